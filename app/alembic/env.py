@@ -4,7 +4,8 @@ from alembic import context
 import os
 import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/../')
-from db_sync import Base
+from models import Base
+from partitions import is_partition
 
 config = context.config
 
@@ -19,6 +20,16 @@ config.set_main_option("sqlalchemy.url", db_url)
 fileConfig(config.config_file_name)
 target_metadata = Base.metadata
 
+def include_object(object, name, type_, reflected, compare_to):
+    # Monthly partitions are created at runtime by partitions.py, not declared in models,
+    # and so are the per-partition copies Postgres makes of foreign keys to them.
+    if reflected and compare_to is None:
+        if type_ == "table" and is_partition(name):
+            return False
+        if type_ == "foreign_key_constraint" and is_partition(object.referred_table.name):
+            return False
+    return True
+
 def run_migrations_online():
     connectable = create_engine(
         config.get_main_option("sqlalchemy.url"),
@@ -27,7 +38,8 @@ def run_migrations_online():
     with connectable.connect() as connection:
         context.configure(
             connection=connection,
-            target_metadata=target_metadata
+            target_metadata=target_metadata,
+            include_object=include_object,
         )
         with context.begin_transaction():
             context.run_migrations()
@@ -35,7 +47,8 @@ def run_migrations_online():
 def run_migrations_offline():
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
-        url=url, target_metadata=target_metadata, literal_binds=True
+        url=url, target_metadata=target_metadata, literal_binds=True,
+        include_object=include_object,
     )
     with context.begin_transaction():
         context.run_migrations()
@@ -0,0 +1,30 @@
+"""add scan coalesce key
+
+Revision ID: 3e5b0c2d9a71
+Revises: 487200b787b6
+Create Date: 2026-10-16 23:10:42.118305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '3e5b0c2d9a71'
+down_revision: Union[str, None] = '487200b787b6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('scans', sa.Column('coalesce_key', sa.Text(), nullable=True))
+    # Lookup of a running scan to coalesce into; only in-progress rows are indexed.
+    with op.get_context().autocommit_block():
+        op.create_index('ix_scans_coalesce_key_running', 'scans', ['coalesce_key'], unique=False, postgresql_where=sa.text("status = 'in_progress'"), postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_scans_coalesce_key_running', table_name='scans', postgresql_where=sa.text("status = 'in_progress'"), postgresql_concurrently=True, if_exists=True)
+    op.drop_column('scans', 'coalesce_key')
@@ -0,0 +1,34 @@
+"""add incremental scan mode
+
+Revision ID: 487200b787b6
+Revises: 6f94c41f8ba0
+Create Date: 2026-10-16 14:55:30.904117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '487200b787b6'
+down_revision: Union[str, None] = '6f94c41f8ba0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('scans', sa.Column('mode', sa.String(), server_default='full', nullable=False))
+    op.add_column('scans', sa.Column('baseline_scan_id', sa.UUID(), nullable=True))
+    op.create_foreign_key('scans_baseline_scan_id_fkey', 'scans', 'scans', ['baseline_scan_id'], ['scan_id'])
+    # Baseline lookup: latest completed scan of a target.
+    with op.get_context().autocommit_block():
+        op.create_index('ix_scans_target_started_at', 'scans', ['target', 'started_at'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_scans_target_started_at', table_name='scans', postgresql_concurrently=True, if_exists=True)
+    op.drop_constraint('scans_baseline_scan_id_fkey', 'scans', type_='foreignkey')
+    op.drop_column('scans', 'baseline_scan_id')
+    op.drop_column('scans', 'mode')
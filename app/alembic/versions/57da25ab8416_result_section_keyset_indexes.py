@@ -0,0 +1,36 @@
+"""result section keyset indexes
+
+Revision ID: 57da25ab8416
+Revises: 65da1610ea20
+Create Date: 2026-10-16 11:41:52.870315
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '57da25ab8416'
+down_revision: Union[str, None] = '65da1610ea20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+TABLES = ('subdomains', 'urls', 'ports')
+
+
+# Section pages are "WHERE scan_id = ? AND id > ? ORDER BY id LIMIT n"; (scan_id, id)
+# answers that without sorting the whole scan, and supersedes the scan_id index.
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        for table in TABLES:
+            op.create_index(f'ix_{table}_scan_id_id', table, ['scan_id', 'id'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+            op.drop_index(f'ix_{table}_scan_id', table_name=table, postgresql_concurrently=True, if_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for table in TABLES:
+            op.create_index(f'ix_{table}_scan_id', table, ['scan_id'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+            op.drop_index(f'ix_{table}_scan_id_id', table_name=table, postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,34 @@
+"""keyset scan listing indexes
+
+Revision ID: 65da1610ea20
+Revises: 8ac6b936c964
+Create Date: 2026-10-16 10:03:17.226904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '65da1610ea20'
+down_revision: Union[str, None] = '8ac6b936c964'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (started_at, scan_id) matches the keyset order of GET /scans and supersedes the
+# plain started_at index. The trigram index serves the target substring filter.
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    with op.get_context().autocommit_block():
+        op.create_index('ix_scans_started_at_scan_id', 'scans', ['started_at', 'scan_id'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_scans_target_trgm', 'scans', ['target'], unique=False, postgresql_using='gin', postgresql_ops={'target': 'gin_trgm_ops'}, postgresql_concurrently=True, if_not_exists=True)
+        op.drop_index('ix_scans_started_at', table_name='scans', postgresql_concurrently=True, if_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index('ix_scans_started_at', 'scans', ['started_at'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.drop_index('ix_scans_target_trgm', table_name='scans', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_scans_started_at_scan_id', table_name='scans', postgresql_concurrently=True, if_exists=True)
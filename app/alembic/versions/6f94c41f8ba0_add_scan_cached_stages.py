@@ -0,0 +1,25 @@
+"""add scan cached stages
+
+Revision ID: 6f94c41f8ba0
+Revises: 57da25ab8416
+Create Date: 2026-10-16 13:20:06.113482
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision: str = '6f94c41f8ba0'
+down_revision: Union[str, None] = '57da25ab8416'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('scans', sa.Column('cached_stages', postgresql.ARRAY(sa.Text()), server_default='{}', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('scans', 'cached_stages')
@@ -0,0 +1,40 @@
+"""add scan lookup indexes
+
+Revision ID: 8ac6b936c964
+Revises: 9c1f49ce112e
+Create Date: 2026-10-16 09:12:41.508213
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '8ac6b936c964'
+down_revision: Union[str, None] = '9c1f49ce112e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# CREATE INDEX CONCURRENTLY can't run inside a transaction, and we don't want to
+# hold write locks on the result tables while the indexes build. vulnerabilities
+# only gets the composite index: its scan_id prefix serves plain scan_id lookups.
+# The IF [NOT] EXISTS guards make a retried upgrade safe, since indexes built here
+# are committed before the revision is stamped.
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(op.f('ix_scans_started_at'), 'scans', ['started_at'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index(op.f('ix_subdomains_scan_id'), 'subdomains', ['scan_id'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index(op.f('ix_urls_scan_id'), 'urls', ['scan_id'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index(op.f('ix_ports_scan_id'), 'ports', ['scan_id'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_vulnerabilities_scan_id_severity', 'vulnerabilities', ['scan_id', 'severity'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_vulnerabilities_scan_id_severity', table_name='vulnerabilities', postgresql_concurrently=True, if_exists=True)
+        op.drop_index(op.f('ix_ports_scan_id'), table_name='ports', postgresql_concurrently=True, if_exists=True)
+        op.drop_index(op.f('ix_urls_scan_id'), table_name='urls', postgresql_concurrently=True, if_exists=True)
+        op.drop_index(op.f('ix_subdomains_scan_id'), table_name='subdomains', postgresql_concurrently=True, if_exists=True)
+        op.drop_index(op.f('ix_scans_started_at'), table_name='scans', postgresql_concurrently=True, if_exists=True)
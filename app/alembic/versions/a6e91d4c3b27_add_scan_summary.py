@@ -0,0 +1,82 @@
+"""add scan summary
+
+Revision ID: a6e91d4c3b27
+Revises: f5c2a8d17b43
+Create Date: 2026-10-17 19:08:14.672301
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision: str = 'a6e91d4c3b27'
+down_revision: Union[str, None] = 'f5c2a8d17b43'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Scans whose stage has finished: completed ones (which predate checkpoints too) and
+# any with the stage checkpointed.
+def _finished(stage: str) -> str:
+    return f"(status = 'completed' OR '{stage}' = ANY(completed_stages))"
+
+# Each finished scan (root) with its baseline lineage, for the sections incremental
+# scans carry forward. As in the API, the newest scan's row of a finding wins.
+_LINEAGE = """
+    WITH RECURSIVE lineage(root, scan_id, started_at, baseline_scan_id, depth) AS (
+        SELECT scan_id, scan_id, started_at, baseline_scan_id, 0 FROM scans WHERE {finished}
+        UNION ALL
+        SELECT l.root, s.scan_id, s.started_at, s.baseline_scan_id, l.depth + 1
+        FROM scans s JOIN lineage l ON s.scan_id = l.baseline_scan_id
+    )
+"""
+
+
+def upgrade() -> None:
+    op.add_column('scans', sa.Column('summary', postgresql.JSONB(), server_default='{}', nullable=False))
+    for stage, table in (('subfinder', 'subdomains'), ('katana', 'urls')):
+        op.execute(f"""
+            UPDATE scans s SET summary = s.summary || jsonb_build_object('{table}', (
+                SELECT count(*) FROM {table} r WHERE r.scan_id = s.scan_id AND r.scan_started_at = s.started_at
+            ))
+            WHERE {_finished(stage)}
+        """)
+    op.execute(_LINEAGE.format(finished=_finished('naabu')) + """,
+        found_ports AS (
+            SELECT DISTINCT ON (l.root, p.ip, p.port) l.root, p.ip
+            FROM lineage l JOIN ports p ON p.scan_id = l.scan_id AND p.scan_started_at = l.started_at
+            ORDER BY l.root, p.ip, p.port, l.depth
+        ),
+        counts AS (
+            SELECT r.root, count(p.ip) AS ports, count(DISTINCT p.ip) AS hosts
+            FROM (SELECT DISTINCT root FROM lineage) r LEFT JOIN found_ports p USING (root)
+            GROUP BY r.root
+        )
+        UPDATE scans s SET summary = s.summary || jsonb_build_object('ports', c.ports, 'hosts_with_ports', c.hosts)
+        FROM counts c WHERE s.scan_id = c.root
+    """)
+    op.execute(_LINEAGE.format(finished=_finished('nuclei')) + """,
+        found_vulns AS (
+            SELECT DISTINCT ON (l.root, v.template_id, v.matched_url) l.root, v.severity
+            FROM lineage l JOIN vulnerabilities v ON v.scan_id = l.scan_id AND v.scan_started_at = l.started_at
+            ORDER BY l.root, v.template_id, v.matched_url, l.depth
+        ),
+        by_severity AS (
+            SELECT root, severity, count(*) AS n FROM found_vulns GROUP BY root, severity
+        ),
+        counts AS (
+            SELECT r.root, coalesce(sum(b.n), 0)::int AS total,
+                   coalesce(jsonb_object_agg(b.severity, b.n) FILTER (WHERE b.severity IS NOT NULL), '{}') AS severity
+            FROM (SELECT DISTINCT root FROM lineage) r LEFT JOIN by_severity b USING (root)
+            GROUP BY r.root
+        )
+        UPDATE scans s SET summary = s.summary || jsonb_build_object('vulnerabilities', c.total, 'severity', c.severity)
+        FROM counts c WHERE s.scan_id = c.root
+    """)
+
+
+def downgrade() -> None:
+    op.drop_column('scans', 'summary')
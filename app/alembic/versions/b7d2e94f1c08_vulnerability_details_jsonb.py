@@ -0,0 +1,57 @@
+"""vulnerability details jsonb
+
+Revision ID: b7d2e94f1c08
+Revises: 3e5b0c2d9a71
+Create Date: 2026-10-16 23:41:07.530861
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision: str = 'b7d2e94f1c08'
+down_revision: Union[str, None] = '3e5b0c2d9a71'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.alter_column('vulnerabilities', 'details', type_=postgresql.JSONB(), existing_type=sa.JSON(), existing_nullable=True, postgresql_using='details::jsonb')
+    op.create_table(
+        'vulnerability_evidence',
+        sa.Column('vulnerability_id', sa.Integer(), nullable=False),
+        sa.Column('request', sa.Text(), nullable=True),
+        sa.Column('response', sa.Text(), nullable=True),
+        sa.ForeignKeyConstraint(['vulnerability_id'], ['vulnerabilities.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('vulnerability_id'),
+    )
+    # Move request/response bodies of existing findings out of details.
+    op.execute("""
+        INSERT INTO vulnerability_evidence (vulnerability_id, request, response)
+        SELECT id, details->>'request', details->>'response'
+        FROM vulnerabilities
+        WHERE details ?| array['request', 'response']
+    """)
+    op.execute("""
+        UPDATE vulnerabilities SET details = details - 'request' - 'response'
+        WHERE details ?| array['request', 'response']
+    """)
+    with op.get_context().autocommit_block():
+        op.create_index('ix_vulnerabilities_details', 'vulnerabilities', ['details'], unique=False, postgresql_using='gin', postgresql_ops={'details': 'jsonb_path_ops'}, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_vulnerabilities_details', table_name='vulnerabilities', postgresql_using='gin', postgresql_ops={'details': 'jsonb_path_ops'}, postgresql_concurrently=True, if_exists=True)
+    op.execute("""
+        UPDATE vulnerabilities v
+        SET details = coalesce(v.details, '{}'::jsonb)
+            || jsonb_strip_nulls(jsonb_build_object('request', e.request, 'response', e.response))
+        FROM vulnerability_evidence e
+        WHERE e.vulnerability_id = v.id
+    """)
+    op.drop_table('vulnerability_evidence')
+    op.alter_column('vulnerabilities', 'details', type_=sa.JSON(), existing_type=postgresql.JSONB(), existing_nullable=True, postgresql_using='details::json')
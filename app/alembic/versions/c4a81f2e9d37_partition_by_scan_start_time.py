@@ -0,0 +1,217 @@
+"""partition by scan start time
+
+Revision ID: c4a81f2e9d37
+Revises: b7d2e94f1c08
+Create Date: 2026-10-17 01:12:48.306115
+
+"""
+from datetime import date, datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision: str = 'c4a81f2e9d37'
+down_revision: Union[str, None] = 'b7d2e94f1c08'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Postgres can't turn a table into a partitioned one in place: each table is renamed,
+# recreated partitioned by RANGE on the scan start time, copied, and dropped. Result
+# rows get their scan's started_at so they fall into the same monthly partition.
+# This rewrites every table under an exclusive lock, so run it in a maintenance window.
+# Result rows without a scan are not carried over.
+
+# Parents first; the reverse is the order tables can be dropped in.
+TABLES = ('scans', 'subdomains', 'urls', 'ports', 'vulnerabilities', 'vulnerability_evidence')
+SERIAL_TABLES = ('subdomains', 'urls', 'ports', 'vulnerabilities')
+
+# Monthly partitions created ahead of the current month; see partitions.PARTITION_MONTHS_AHEAD.
+MONTHS_AHEAD = 3
+
+INDEXES = {
+    'scans': (
+        'ix_scans_started_at_scan_id',
+        'ix_scans_target_trgm',
+        'ix_scans_target_started_at',
+        'ix_scans_coalesce_key_running',
+    ),
+    'subdomains': ('ix_subdomains_scan_id_id',),
+    'urls': ('ix_urls_scan_id_id',),
+    'ports': ('ix_ports_scan_id_id',),
+    'vulnerabilities': ('ix_vulnerabilities_scan_id_severity', 'ix_vulnerabilities_details'),
+    'vulnerability_evidence': (),
+}
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _create_indexes() -> None:
+    op.create_index('ix_scans_started_at_scan_id', 'scans', ['started_at', 'scan_id'], unique=False)
+    op.create_index('ix_scans_target_trgm', 'scans', ['target'], unique=False, postgresql_using='gin', postgresql_ops={'target': 'gin_trgm_ops'})
+    op.create_index('ix_scans_target_started_at', 'scans', ['target', 'started_at'], unique=False)
+    op.create_index('ix_scans_coalesce_key_running', 'scans', ['coalesce_key'], unique=False, postgresql_where=sa.text("status = 'in_progress'"))
+    for table in ('subdomains', 'urls', 'ports'):
+        op.create_index(f'ix_{table}_scan_id_id', table, ['scan_id', 'id'], unique=False)
+    op.create_index('ix_vulnerabilities_scan_id_severity', 'vulnerabilities', ['scan_id', 'severity'], unique=False)
+    op.create_index('ix_vulnerabilities_details', 'vulnerabilities', ['details'], unique=False, postgresql_using='gin', postgresql_ops={'details': 'jsonb_path_ops'})
+
+
+def _set_aside(suffix: str) -> None:
+    """Rename the current tables to <table>_<suffix>, freeing every index and sequence name."""
+    for table in TABLES:
+        for index in INDEXES[table]:
+            op.drop_index(index, table_name=table, if_exists=True)
+        op.rename_table(table, f'{table}_{suffix}')
+        op.execute(f'ALTER TABLE {table}_{suffix} RENAME CONSTRAINT {table}_pkey TO {table}_{suffix}_pkey')
+    for table in SERIAL_TABLES:
+        op.execute(f'ALTER SEQUENCE {table}_id_seq OWNED BY NONE')
+
+
+def _drop_set_aside(suffix: str) -> None:
+    for table in reversed(TABLES):
+        op.drop_table(f'{table}_{suffix}')
+    for table in SERIAL_TABLES:
+        op.execute(f'ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id')
+
+
+def _scan_columns():
+    return [
+        sa.Column('scan_id', sa.UUID(), nullable=False),
+        sa.Column('target', sa.Text(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('started_at', sa.DateTime(), nullable=False),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.Column('cached_stages', postgresql.ARRAY(sa.Text()), server_default='{}', nullable=False),
+        sa.Column('mode', sa.String(), server_default='full', nullable=False),
+        sa.Column('baseline_scan_id', sa.UUID(), nullable=True),
+        sa.Column('coalesce_key', sa.Text(), nullable=True),
+    ]
+
+
+def _id_column(table: str):
+    return sa.Column('id', sa.Integer(), server_default=sa.text(f"nextval('{table}_id_seq'::regclass)"), nullable=False)
+
+
+def _result_columns(table: str):
+    return {
+        'subdomains': [sa.Column('subdomain', sa.Text(), nullable=False)],
+        'urls': [sa.Column('url', sa.Text(), nullable=False)],
+        'ports': [sa.Column('ip', sa.Text(), nullable=False), sa.Column('port', sa.Integer(), nullable=False)],
+        'vulnerabilities': [
+            sa.Column('template_id', sa.Text(), nullable=False),
+            sa.Column('severity', sa.String(), nullable=False),
+            sa.Column('matched_url', sa.Text(), nullable=False),
+            sa.Column('description', sa.Text(), nullable=False),
+            sa.Column('details', postgresql.JSONB(), nullable=True),
+        ],
+    }[table]
+
+
+def _evidence_columns():
+    return [sa.Column('request', sa.Text(), nullable=True), sa.Column('response', sa.Text(), nullable=True)]
+
+
+def _column_list(table: str) -> str:
+    columns = {
+        'scans': [c.name for c in _scan_columns()],
+        'vulnerability_evidence': ['vulnerability_id'] + [c.name for c in _evidence_columns()],
+    }.get(table) or ['id', 'scan_id'] + [c.name for c in _result_columns(table)]
+    return ', '.join(columns)
+
+
+def upgrade() -> None:
+    _set_aside('unpartitioned')
+
+    op.create_table('scans', *_scan_columns(), sa.PrimaryKeyConstraint('scan_id', 'started_at'), postgresql_partition_by='RANGE (started_at)')
+    for table in SERIAL_TABLES:
+        op.create_table(
+            table,
+            _id_column(table),
+            sa.Column('scan_id', sa.UUID(), nullable=True),
+            sa.Column('scan_started_at', sa.DateTime(), nullable=False),
+            *_result_columns(table),
+            sa.ForeignKeyConstraint(['scan_id', 'scan_started_at'], ['scans.scan_id', 'scans.started_at']),
+            sa.PrimaryKeyConstraint('id', 'scan_started_at'),
+            postgresql_partition_by='RANGE (scan_started_at)',
+        )
+    op.create_table(
+        'vulnerability_evidence',
+        sa.Column('vulnerability_id', sa.Integer(), nullable=False),
+        sa.Column('scan_started_at', sa.DateTime(), nullable=False),
+        *_evidence_columns(),
+        sa.ForeignKeyConstraint(['vulnerability_id', 'scan_started_at'], ['vulnerabilities.id', 'vulnerabilities.scan_started_at'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('vulnerability_id', 'scan_started_at'),
+        postgresql_partition_by='RANGE (scan_started_at)',
+    )
+
+    # Monthly partitions covering every existing scan and a few months ahead, plus a
+    # default partition catching anything outside them.
+    oldest = op.get_bind().execute(sa.text('SELECT min(started_at) FROM scans_unpartitioned')).scalar()
+    current = datetime.utcnow().date().replace(day=1)
+    month = min(oldest.date().replace(day=1), current) if oldest else current
+    while month <= _add_months(current, MONTHS_AHEAD):
+        for table in TABLES:
+            op.execute(
+                f"CREATE TABLE {table}_p{month:%Y_%m} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{month}') TO ('{_add_months(month, 1)}')"
+            )
+        month = _add_months(month, 1)
+    for table in TABLES:
+        op.execute(f'CREATE TABLE {table}_default PARTITION OF {table} DEFAULT')
+
+    op.execute(f"INSERT INTO scans ({_column_list('scans')}) SELECT {_column_list('scans')} FROM scans_unpartitioned")
+    for table in SERIAL_TABLES:
+        columns = _column_list(table)
+        op.execute(
+            f"INSERT INTO {table} ({columns}, scan_started_at) "
+            f"SELECT {', '.join(f't.{c}' for c in columns.split(', '))}, s.started_at "
+            f"FROM {table}_unpartitioned t JOIN scans s ON s.scan_id = t.scan_id"
+        )
+    op.execute(
+        f"INSERT INTO vulnerability_evidence ({_column_list('vulnerability_evidence')}, scan_started_at) "
+        "SELECT e.vulnerability_id, e.request, e.response, v.scan_started_at "
+        "FROM vulnerability_evidence_unpartitioned e JOIN vulnerabilities v ON v.id = e.vulnerability_id"
+    )
+
+    _drop_set_aside('unpartitioned')
+    _create_indexes()
+
+
+def downgrade() -> None:
+    _set_aside('partitioned')
+
+    op.create_table('scans', *_scan_columns(), sa.ForeignKeyConstraint(['baseline_scan_id'], ['scans.scan_id'], name='scans_baseline_scan_id_fkey'), sa.PrimaryKeyConstraint('scan_id'))
+    for table in SERIAL_TABLES:
+        op.create_table(
+            table,
+            _id_column(table),
+            sa.Column('scan_id', sa.UUID(), nullable=True),
+            *_result_columns(table),
+            sa.ForeignKeyConstraint(['scan_id'], ['scans.scan_id']),
+            sa.PrimaryKeyConstraint('id'),
+        )
+    op.create_table(
+        'vulnerability_evidence',
+        sa.Column('vulnerability_id', sa.Integer(), autoincrement=False, nullable=False),
+        *_evidence_columns(),
+        sa.ForeignKeyConstraint(['vulnerability_id'], ['vulnerabilities.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('vulnerability_id'),
+    )
+    # Baselines dropped by retention can't be referenced any more.
+    op.execute(
+        f"INSERT INTO scans ({_column_list('scans')}) "
+        f"SELECT {', '.join('b.scan_id' if c == 'baseline_scan_id' else f's.{c}' for c in _column_list('scans').split(', '))} "
+        "FROM scans_partitioned s LEFT JOIN scans_partitioned b ON b.scan_id = s.baseline_scan_id"
+    )
+    for table in SERIAL_TABLES + ('vulnerability_evidence',):
+        columns = _column_list(table)
+        op.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {table}_partitioned")
+
+    _drop_set_aside('partitioned')
+    _create_indexes()
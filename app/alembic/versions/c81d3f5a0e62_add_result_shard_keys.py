@@ -0,0 +1,27 @@
+"""add result shard keys
+
+Revision ID: c81d3f5a0e62
+Revises: a6e91d4c3b27
+Create Date: 2026-10-17 21:12:40.518394
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'c81d3f5a0e62'
+down_revision: Union[str, None] = 'a6e91d4c3b27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('ports', sa.Column('shard', sa.Text(), nullable=True))
+    op.add_column('vulnerabilities', sa.Column('shard', sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('vulnerabilities', 'shard')
+    op.drop_column('ports', 'shard')
@@ -0,0 +1,27 @@
+"""coalesce queued scans
+
+Revision ID: d2f6b81e4c95
+Revises: c81d3f5a0e62
+Create Date: 2026-10-17 22:03:51.184726
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'd2f6b81e4c95'
+down_revision: Union[str, None] = 'c81d3f5a0e62'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.drop_index('ix_scans_coalesce_key_running', table_name='scans', postgresql_where=sa.text("status = 'in_progress'"))
+    op.create_index('ix_scans_coalesce_key_active', 'scans', ['coalesce_key'], unique=False, postgresql_where=sa.text("status IN ('queued', 'in_progress')"))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_scans_coalesce_key_active', table_name='scans', postgresql_where=sa.text("status IN ('queued', 'in_progress')"))
+    op.create_index('ix_scans_coalesce_key_running', 'scans', ['coalesce_key'], unique=False, postgresql_where=sa.text("status = 'in_progress'"))
@@ -0,0 +1,31 @@
+"""add scan checkpoints
+
+Revision ID: d91f3a6c2e58
+Revises: c4a81f2e9d37
+Create Date: 2026-10-17 02:05:33.918420
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision: str = 'd91f3a6c2e58'
+down_revision: Union[str, None] = 'c4a81f2e9d37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Scans started before this revision have no nuclei_templates and can't be resumed.
+def upgrade() -> None:
+    op.add_column('scans', sa.Column('completed_stages', postgresql.ARRAY(sa.Text()), server_default='{}', nullable=False))
+    op.add_column('scans', sa.Column('completed_shards', postgresql.ARRAY(sa.Text()), server_default='{}', nullable=False))
+    op.add_column('scans', sa.Column('nuclei_templates', postgresql.ARRAY(sa.Text()), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('scans', 'nuclei_templates')
+    op.drop_column('scans', 'completed_shards')
+    op.drop_column('scans', 'completed_stages')
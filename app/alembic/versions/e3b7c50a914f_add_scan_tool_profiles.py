@@ -0,0 +1,28 @@
+"""add scan tool profiles
+
+Revision ID: e3b7c50a914f
+Revises: d91f3a6c2e58
+Create Date: 2026-10-17 09:41:12.206175
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+revision: str = 'e3b7c50a914f'
+down_revision: Union[str, None] = 'd91f3a6c2e58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('scans', sa.Column('tool_overrides', postgresql.JSONB(), nullable=True))
+    op.add_column('scans', sa.Column('tool_runs', postgresql.JSONB(), server_default='[]', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('scans', 'tool_runs')
+    op.drop_column('scans', 'tool_overrides')
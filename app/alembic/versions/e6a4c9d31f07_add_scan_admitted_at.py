@@ -0,0 +1,27 @@
+"""add scan admitted_at
+
+Revision ID: e6a4c9d31f07
+Revises: d2f6b81e4c95
+Create Date: 2026-10-17 22:41:12.503918
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'e6a4c9d31f07'
+down_revision: Union[str, None] = 'd2f6b81e4c95'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('scans', sa.Column('admitted_at', sa.DateTime(), nullable=True))
+    # Scans that already got past the caps were admitted when they started.
+    op.execute("UPDATE scans SET admitted_at = started_at WHERE status <> 'queued'")
+
+
+def downgrade() -> None:
+    op.drop_column('scans', 'admitted_at')
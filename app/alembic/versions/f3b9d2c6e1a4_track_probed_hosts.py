@@ -0,0 +1,45 @@
+"""track probed hosts
+
+Revision ID: f3b9d2c6e1a4
+Revises: e6a4c9d31f07
+Create Date: 2026-10-18 09:12:40.381257
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'f3b9d2c6e1a4'
+down_revision: Union[str, None] = 'e6a4c9d31f07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('ports', sa.Column('host', sa.Text(), nullable=True))
+    op.add_column('vulnerabilities', sa.Column('host', sa.Text(), nullable=True))
+    op.create_table(
+        'probed_hosts',
+        sa.Column('scan_id', sa.UUID(), nullable=False),
+        sa.Column('stage', sa.Text(), nullable=False),
+        sa.Column('host', sa.Text(), nullable=False),
+        sa.Column('scan_started_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['scan_id', 'scan_started_at'], ['scans.scan_id', 'scans.started_at']),
+        sa.PrimaryKeyConstraint('scan_id', 'stage', 'host', 'scan_started_at'),
+        postgresql_partition_by='RANGE (scan_started_at)',
+    )
+    # One partition for each of scans', over the same range.
+    partitions = op.get_bind().execute(sa.text(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = 'scans'::regclass"
+    )).all()
+    for name, bound in partitions:
+        op.execute(f"CREATE TABLE probed_hosts{name.removeprefix('scans')} PARTITION OF probed_hosts {bound}")
+
+
+def downgrade() -> None:
+    op.drop_table('probed_hosts')
+    op.drop_column('vulnerabilities', 'host')
+    op.drop_column('ports', 'host')
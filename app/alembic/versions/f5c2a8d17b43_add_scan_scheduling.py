@@ -0,0 +1,31 @@
+"""add scan scheduling
+
+Revision ID: f5c2a8d17b43
+Revises: e3b7c50a914f
+Create Date: 2026-10-17 14:22:48.530912
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = 'f5c2a8d17b43'
+down_revision: Union[str, None] = 'e3b7c50a914f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('scans', sa.Column('owner', sa.Text(), nullable=True))
+    op.add_column('scans', sa.Column('priority', sa.String(), server_default='normal', nullable=False))
+    op.create_index('ix_scans_owner_running', 'scans', ['owner'], unique=False, postgresql_where=sa.text("status = 'in_progress'"))
+    op.create_index('ix_scans_queued', 'scans', ['started_at'], unique=False, postgresql_where=sa.text("status = 'queued'"))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_scans_queued', table_name='scans', postgresql_where=sa.text("status = 'queued'"))
+    op.drop_index('ix_scans_owner_running', table_name='scans', postgresql_where=sa.text("status = 'in_progress'"))
+    op.drop_column('scans', 'priority')
+    op.drop_column('scans', 'owner')
@@ -1,174 +1,534 @@
 import os
+import json
+import base64
+import hashlib
 from uuid import UUID
-from datetime import datetime
-from typing import List, Optional
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+from collections import Counter
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
-from sqlalchemy.orm import declarative_base, relationship
-from sqlalchemy import Column, String, DateTime, Text, Integer, ForeignKey, Enum, JSON
-from sqlalchemy.dialects.postgresql import UUID as PG_UUID
-import enum
+from sqlalchemy import insert, update, tuple_, func
 from sqlalchemy.future import select
-from sqlalchemy.orm import selectinload
+from models import (
+    Base, ScanStatusEnum, Scan, Subdomain, URL, Port, Vulnerability, VulnerabilityEvidence,
+    split_evidence, CARRIED_KEYS, LINEAGE_QUERY, carried_rows,
+)
+import result_cache
+import scheduler
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_async_engine(DATABASE_URL, echo=False, future=True)
-async_session = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
-Base = declarative_base()
-
-class ScanStatusEnum(str, enum.Enum):
-    in_progress = "in_progress"
-    completed = "completed"
-    failed = "failed"
-
-class Scan(Base):
-    __tablename__ = "scans"
-    scan_id = Column(PG_UUID(as_uuid=True), primary_key=True)
-    target = Column(Text, nullable=False)
-    status = Column(String, default=ScanStatusEnum.in_progress, nullable=False)
-    started_at = Column(DateTime, nullable=False)
-    finished_at = Column(DateTime, nullable=True)
-    subdomains = relationship("Subdomain", back_populates="scan")
-    urls = relationship("URL", back_populates="scan")
-    ports = relationship("Port", back_populates="scan")
-    vulnerabilities = relationship("Vulnerability", back_populates="scan")
-
-class Subdomain(Base):
-    __tablename__ = "subdomains"
-    id = Column(Integer, primary_key=True)
-    scan_id = Column(PG_UUID(as_uuid=True), ForeignKey("scans.scan_id"))
-    subdomain = Column(Text, nullable=False)
-    scan = relationship("Scan", back_populates="subdomains")
-
-class URL(Base):
-    __tablename__ = "urls"
-    id = Column(Integer, primary_key=True)
-    scan_id = Column(PG_UUID(as_uuid=True), ForeignKey("scans.scan_id"))
-    url = Column(Text, nullable=False)
-    scan = relationship("Scan", back_populates="urls")
-
-class Port(Base):
-    __tablename__ = "ports"
-    id = Column(Integer, primary_key=True)
-    scan_id = Column(PG_UUID(as_uuid=True), ForeignKey("scans.scan_id"))
-    ip = Column(Text, nullable=False)
-    port = Column(Integer, nullable=False)
-    scan = relationship("Scan", back_populates="ports")
-
-class Vulnerability(Base):
-    __tablename__ = "vulnerabilities"
-    id = Column(Integer, primary_key=True)
-    scan_id = Column(PG_UUID(as_uuid=True), ForeignKey("scans.scan_id"))
-    template_id = Column(Text, nullable=False)
-    severity = Column(String, nullable=False)
-    matched_url = Column(Text, nullable=False)
-    description = Column(Text, nullable=False)
-    details = Column(JSON, nullable=True)
-    scan = relationship("Scan", back_populates="vulnerabilities")
+# Rows per multi-row INSERT ... VALUES statement for the add_* writers. Rows times
+# columns has to stay under Postgres's 32767 bind parameters per statement.
+BULK_INSERT_BATCH_SIZE = int(os.getenv("BULK_INSERT_BATCH_SIZE", "1000"))
+
+# Queued or running scans older than this are assumed stuck and never coalesced into.
+SCAN_COALESCE_MAX_AGE = int(os.getenv("SCAN_COALESCE_MAX_AGE", str(6 * 3600)))
 
+# Coalescing inserts serialize on a transaction advisory lock per bucket of keys,
+# so even a large batch holds a bounded number of locks.
+COALESCE_LOCK_CLASS = 0x5CA7
+COALESCE_LOCK_BUCKETS = 64
+
+engine = create_async_engine(
+    DATABASE_URL, echo=False, future=True,
+    insertmanyvalues_page_size=BULK_INSERT_BATCH_SIZE,
+)
+async_session = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 # --- CRUD Functions ---
-async def create_scan(scan_id: UUID, target: str, started_at: datetime):
-    async with async_session() as session:
-        scan = Scan(scan_id=scan_id, target=target, started_at=started_at, status=ScanStatusEnum.in_progress)
-        session.add(scan)
-        await session.commit()
+def scan_coalesce_key(target: str, nuclei_templates: List[str], mode: str) -> str:
+    payload = json.dumps([target, sorted(set(nuclei_templates)), mode])
+    return hashlib.sha256(payload.encode()).hexdigest()
 
-async def update_scan_status(scan_id: UUID, status: str, finished_at: Optional[datetime] = None):
-    async with async_session() as session:
-        scan = await session.get(Scan, scan_id)
-        if scan:
-            scan.status = status
-            scan.finished_at = finished_at
-            await session.commit()
+async def _find_active_scans(conn, keys: List[str], started_at: datetime) -> dict:
+    """
+    Lock the keys' buckets for the rest of the transaction, then map each key to the
+    (scan_id, status) of its newest queued or running scan. The lock makes lookup plus
+    insert atomic per key.
+    """
+    for bucket in sorted({int(key[:8], 16) % COALESCE_LOCK_BUCKETS for key in keys}):
+        await conn.execute(select(func.pg_advisory_xact_lock(COALESCE_LOCK_CLASS, bucket)))
+    result = await conn.execute(
+        select(Scan.coalesce_key, Scan.scan_id, Scan.status)
+        .where(
+            Scan.coalesce_key.in_(keys),
+            Scan.status.in_((ScanStatusEnum.queued.value, ScanStatusEnum.in_progress.value)),
+            Scan.started_at >= started_at - timedelta(seconds=SCAN_COALESCE_MAX_AGE),
+        )
+        .order_by(Scan.started_at)
+    )
+    return {key: (scan_id, status) for key, scan_id, status in result}
+
+async def _admit_scans(conn, scans: List[dict], now: datetime) -> List[dict]:
+    """
+    The scans that may start now under the per-owner and per-target caps (see
+    scheduler.admit). Holds the admission lock for the rest of the transaction.
+    """
+    await conn.execute(select(func.pg_advisory_xact_lock(scheduler.ADMISSION_LOCK_CLASS, 0)))
+    owners = {scan["owner"] for scan in scans if scan.get("owner")}
+    targets = {scan["target"] for scan in scans}
+    running = (
+        Scan.status == ScanStatusEnum.in_progress.value,
+        Scan.admitted_at >= now - timedelta(seconds=scheduler.SCAN_STUCK_AFTER),
+    )
+    by_owner = Counter(dict((await conn.execute(
+        select(Scan.owner, func.count()).where(*running, Scan.owner.in_(owners)).group_by(Scan.owner)
+    )).all())) if owners else Counter()
+    by_target = Counter(dict((await conn.execute(
+        select(Scan.target, func.count()).where(*running, Scan.target.in_(targets)).group_by(Scan.target)
+    )).all()))
+    return scheduler.admit(scans, by_owner, by_target)
+
+async def create_scan(
+    scan_id: UUID, target: str, started_at: datetime, mode: str = "full",
+    coalesce_key: Optional[str] = None, nuclei_templates: Optional[List[str]] = None,
+    tool_overrides: Optional[dict] = None, owner: Optional[str] = None, priority: str = "normal",
+) -> Tuple[Optional[UUID], str]:
+    """
+    Insert a scan row, in_progress, or queued when its owner or target is at its cap.
+    Returns (None, status) when the scan was created. With a coalesce_key, a queued or
+    in-progress scan with the same key is returned instead as (scan_id, status), and
+    nothing is inserted.
+    """
+    async with engine.begin() as conn:
+        if coalesce_key:
+            active = await _find_active_scans(conn, [coalesce_key], started_at)
+            if coalesce_key in active:
+                return active[coalesce_key]
+        admitted = await _admit_scans(conn, [{"owner": owner, "target": target}], started_at)
+        status = ScanStatusEnum.in_progress.value if admitted else ScanStatusEnum.queued.value
+        await conn.execute(insert(Scan).values(
+            scan_id=scan_id, target=target, started_at=started_at,
+            admitted_at=started_at if admitted else None, status=status, mode=mode, coalesce_key=coalesce_key,
+            nuclei_templates=nuclei_templates, tool_overrides=tool_overrides,
+            owner=owner, priority=priority,
+        ))
+    return None, status
+
+async def create_scans(scans: List[dict]) -> Tuple[dict, set]:
+    """
+    Insert many scan rows (scan_id, target, started_at, mode, nuclei_templates, priority,
+    optional coalesce_key, tool_overrides and owner) in one transaction, as multi-row
+    INSERT statements of BULK_INSERT_BATCH_SIZE rows. Rows whose coalesce_key matches
+    a queued or running scan are skipped. Returns those keys mapped to that scan's
+    (scan_id, status), and the ids of the scans that were queued by the caps instead
+    of started.
+    """
+    keys = [scan["coalesce_key"] for scan in scans if scan.get("coalesce_key")]
+    async with engine.begin() as conn:
+        active = await _find_active_scans(conn, keys, scans[0]["started_at"]) if keys else {}
+        rows = [
+            {"coalesce_key": None, "tool_overrides": None, "owner": None, **scan}
+            for scan in scans if scan.get("coalesce_key") not in active
+        ]
+        admitted = {row["scan_id"] for row in await _admit_scans(conn, rows, scans[0]["started_at"])} if rows else set()
+        for row in rows:
+            row["status"] = (ScanStatusEnum.in_progress if row["scan_id"] in admitted else ScanStatusEnum.queued).value
+            row["admitted_at"] = row["started_at"] if row["scan_id"] in admitted else None
+        await bulk_insert(Scan, rows, conn)
+    return active, {row["scan_id"] for row in rows} - admitted
+
+async def fail_scans(scan_ids: List[UUID], finished_at: datetime):
+    async with engine.begin() as conn:
+        await conn.execute(
+            update(Scan)
+            .where(Scan.scan_id.in_(scan_ids))
+            .values(status=ScanStatusEnum.failed.value, finished_at=finished_at)
+        )
+    await result_cache.invalidate_async(*scan_ids)
+
+async def cancel_scan(scan_id: UUID, finished_at: datetime) -> bool:
+    """
+    Mark an in-progress or queued scan cancelled. Returns False if the scan doesn't
+    exist; raises ValueError if it has already finished.
+    """
+    async with engine.begin() as conn:
+        status = (await conn.execute(
+            select(Scan.status).where(Scan.scan_id == scan_id).with_for_update()
+        )).scalar()
+        if status is None:
+            return False
+        if status not in (ScanStatusEnum.in_progress.value, ScanStatusEnum.queued.value):
+            raise ValueError(f"Only running or queued scans can be cancelled, scan is {status}")
+        await conn.execute(
+            update(Scan)
+            .where(Scan.scan_id == scan_id)
+            .values(status=ScanStatusEnum.cancelled.value, finished_at=finished_at)
+        )
+    await result_cache.invalidate_async(scan_id)
+    return True
+
+async def resume_scan(scan_id: UUID) -> bool:
+    """
+    Put a failed scan back in progress so its pipeline can be resumed. Returns False
+    if the scan doesn't exist; raises ValueError if it can't be resumed.
+    """
+    async with engine.begin() as conn:
+        scan = (await conn.execute(
+            select(Scan.status, Scan.nuclei_templates).where(Scan.scan_id == scan_id).with_for_update()
+        )).first()
+        if not scan:
+            return False
+        if scan.status != ScanStatusEnum.failed.value:
+            raise ValueError(f"Only failed scans can be resumed, scan is {scan.status}")
+        if scan.nuclei_templates is None:
+            raise ValueError("Scan predates checkpoints and can't be resumed")
+        await conn.execute(
+            update(Scan)
+            .where(Scan.scan_id == scan_id)
+            .values(status=ScanStatusEnum.in_progress.value, admitted_at=datetime.utcnow(), finished_at=None)
+        )
+    await result_cache.invalidate_async(scan_id)
+    return True
 
 async def get_scan_by_id(scan_id: UUID):
+    """Scan status, read through the Redis result cache."""
+    cached = await result_cache.get_status(scan_id)
+    if cached:
+        return cached
+    version = await result_cache.get_version(scan_id)
     async with async_session() as session:
         scan = await session.get(Scan, scan_id)
         if not scan:
             return None
-        return {
+        status = {
             "scan_id": scan.scan_id,
             "target": scan.target,
             "status": scan.status,
             "started_at": scan.started_at,
             "finished_at": scan.finished_at,
+            "cached_stages": scan.cached_stages,
+            "completed_stages": scan.completed_stages,
+            "tool_runs": scan.tool_runs,
+            "owner": scan.owner,
+            "priority": scan.priority,
+            "summary": scan.summary,
+            "mode": scan.mode,
+            "baseline_scan_id": scan.baseline_scan_id,
         }
+    await result_cache.set_status(scan_id, status, version)
+    return status
+
+async def bulk_insert(model, rows: List[dict], conn=None, returning=None):
+    """
+    Insert plain dicts through Core instead of building ORM objects, as one multi-row
+    INSERT ... VALUES per BULK_INSERT_BATCH_SIZE rows, on conn if given. The rows
+    must share their keys. With a returning column, its values are returned in the
+    order of rows.
+    """
+    if not rows:
+        return []
+    if conn is None:
+        async with engine.begin() as conn:
+            return await bulk_insert(model, rows, conn, returning)
+    if returning is not None:
+        # insertmanyvalues pages these by BULK_INSERT_BATCH_SIZE rows and keeps the order.
+        stmt = insert(model).returning(returning, sort_by_parameter_order=True)
+        return (await conn.execute(stmt, rows)).scalars().all()
+    # Without RETURNING, asyncpg would run a plain executemany, one INSERT per row.
+    for i in range(0, len(rows), BULK_INSERT_BATCH_SIZE):
+        await conn.execute(insert(model).values(rows[i:i + BULK_INSERT_BATCH_SIZE]))
+    return []
+
+async def scan_started_at(conn, scan_id: UUID) -> Optional[datetime]:
+    """A scan's start time, the partition key of its result rows."""
+    return await conn.scalar(select(Scan.started_at).where(Scan.scan_id == scan_id))
 
 async def add_subdomains(scan_id: UUID, subdomains: List[str]):
-    async with async_session() as session:
-        objs = [Subdomain(scan_id=scan_id, subdomain=s) for s in subdomains]
-        session.add_all(objs)
-        await session.commit()
+    async with engine.begin() as conn:
+        started_at = await scan_started_at(conn, scan_id)
+        await bulk_insert(Subdomain, [
+            {"scan_id": scan_id, "scan_started_at": started_at, "subdomain": s} for s in subdomains
+        ], conn)
 
 async def add_urls(scan_id: UUID, urls: List[str]):
-    async with async_session() as session:
-        objs = [URL(scan_id=scan_id, url=u) for u in urls]
-        session.add_all(objs)
-        await session.commit()
+    async with engine.begin() as conn:
+        started_at = await scan_started_at(conn, scan_id)
+        await bulk_insert(URL, [{"scan_id": scan_id, "scan_started_at": started_at, "url": u} for u in urls], conn)
 
 async def add_ports(scan_id: UUID, ports: List[dict]):
-    async with async_session() as session:
-        objs = [Port(scan_id=scan_id, ip=p["ip"], port=p["port"]) for p in ports]
-        session.add_all(objs)
-        await session.commit()
+    async with engine.begin() as conn:
+        started_at = await scan_started_at(conn, scan_id)
+        await bulk_insert(Port, [
+            {"scan_id": scan_id, "scan_started_at": started_at, "ip": p["ip"], "port": p["port"]} for p in ports
+        ], conn)
 
 async def add_vulnerabilities(scan_id: UUID, vulns: List[dict]):
+    async with engine.begin() as conn:
+        started_at = await scan_started_at(conn, scan_id)
+        rows, evidence = zip(*(
+            split_evidence({"scan_id": scan_id, "scan_started_at": started_at, **v}) for v in vulns
+        )) if vulns else ((), ())
+        ids = await bulk_insert(Vulnerability, list(rows), conn, returning=Vulnerability.id)
+        await bulk_insert(VulnerabilityEvidence, [
+            {"vulnerability_id": vulnerability_id, "scan_started_at": started_at, **blobs}
+            for vulnerability_id, blobs in zip(ids, evidence) if blobs
+        ], conn)
+
+# Result sections: model, the only columns fetched for it, and how a row is rendered.
+RESULT_SECTIONS = {
+    "subdomains": (Subdomain, (Subdomain.subdomain,), lambda r: r.subdomain),
+    "urls": (URL, (URL.url,), lambda r: r.url),
+    "ports": (Port, (Port.ip, Port.port), lambda r: {"ip": r.ip, "port": r.port}),
+    "vulnerabilities": (
+        Vulnerability,
+        (
+            Vulnerability.template_id,
+            Vulnerability.severity,
+            Vulnerability.matched_url,
+            Vulnerability.description,
+            Vulnerability.details,
+        ),
+        lambda r: {
+            "id": r.id,
+            "template_id": r.template_id,
+            "severity": r.severity,
+            "matched_url": r.matched_url,
+            "description": r.description,
+            "details": r.details,
+        },
+    ),
+}
+
+# Rows fetched per round trip when streaming results from a server-side cursor.
+RESULT_STREAM_BATCH_SIZE = int(os.getenv("RESULT_STREAM_BATCH_SIZE", "1000"))
+
+async def _scan_lineage(session, scan_id: UUID) -> List[tuple]:
+    """
+    (scan_id, started_at) of the scan followed by its chain of baselines, newest first.
+    The start times let section queries read only the partitions holding those scans.
+    """
+    return list((await session.execute(LINEAGE_QUERY, {"scan_id": scan_id})).tuples())
+
+def _section_query(
+    scan_id: UUID,
+    section: str,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    lineage: Optional[List[tuple]] = None,
+):
+    model, columns, _ = RESULT_SECTIONS[section]
+    if lineage and len(lineage) > 1 and model in CARRIED_KEYS:
+        rows = carried_rows(model, lineage, model.id, *columns).subquery()
+        id_column = rows.c.id
+        stmt = select(rows)
+    else:
+        id_column = model.id
+        stmt = select(model.id, *columns).where(model.scan_id == scan_id)
+        if lineage:
+            stmt = stmt.where(model.scan_started_at == lineage[0][1])
+    if after_id is not None:
+        stmt = stmt.where(id_column > after_id)
+    stmt = stmt.order_by(id_column)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return stmt
+
+async def scan_exists(scan_id: UUID) -> bool:
     async with async_session() as session:
-        objs = [Vulnerability(scan_id=scan_id, **v) for v in vulns]
-        session.add_all(objs)
-        await session.commit()
+        result = await session.execute(select(Scan.scan_id).where(Scan.scan_id == scan_id))
+        return result.first() is not None
 
 async def get_scan_results(scan_id: UUID):
+    """
+    All result sections of a scan. Results of a completed scan never change, so they
+    are served from the Redis result cache once read.
+    """
+    cached = await result_cache.get_results(scan_id)
+    if cached:
+        return cached
+    version = await result_cache.get_version(scan_id)
     async with async_session() as session:
-        result = await session.execute(
-            select(Scan)
-            .options(
-                selectinload(Scan.subdomains),
-                selectinload(Scan.urls),
-                selectinload(Scan.ports),
-                selectinload(Scan.vulnerabilities),
-            )
-            .where(Scan.scan_id == scan_id)
-        )
-        scan = result.scalar_one_or_none()
-        if not scan:
+        lineage = await _scan_lineage(session, scan_id)
+        if not lineage:
             return None
-        subdomains = [s.subdomain for s in scan.subdomains]
-        urls = [u.url for u in scan.urls]
-        ports = [{"ip": p.ip, "port": p.port} for p in scan.ports]
-        vulnerabilities = [
-            {
-                "template_id": v.template_id,
-                "severity": v.severity,
-                "matched_url": v.matched_url,
-                "description": v.description,
-                "details": v.details,
-            }
-            for v in scan.vulnerabilities
-        ]
-        return {
-            "subdomains": subdomains,
-            "urls": urls,
-            "ports": ports,
-            "vulnerabilities": vulnerabilities,
+        status = await session.scalar(select(Scan.status).where(Scan.scan_id == scan_id))
+        results = {}
+        for section, (_, _, render) in RESULT_SECTIONS.items():
+            rows = await session.execute(_section_query(scan_id, section, lineage=lineage))
+            results[section] = [render(r) for r in rows]
+    if status == ScanStatusEnum.completed.value:
+        await result_cache.set_results(scan_id, results, version)
+    return results
+
+async def get_scan_section_page(scan_id: UUID, section: str, limit: int, cursor: Optional[str] = None):
+    """
+    One page of a single result section, keyset-paginated on the row id.
+    Returns (items, next_cursor); raises ValueError for a malformed cursor.
+    """
+    try:
+        after_id = int(cursor) if cursor else None
+    except ValueError as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    _, _, render = RESULT_SECTIONS[section]
+    async with async_session() as session:
+        lineage = await _scan_lineage(session, scan_id)
+        rows = (await session.execute(_section_query(scan_id, section, after_id, limit + 1, lineage))).fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = str(rows[-1].id)
+    return [render(r) for r in rows], next_cursor
+
+async def stream_scan_results(scan_id: UUID, sections: List[str]):
+    """
+    Yield (section, item) pairs from a server-side cursor, RESULT_STREAM_BATCH_SIZE
+    rows at a time, so memory stays flat regardless of the scan size.
+    """
+    async with async_session() as session:
+        lineage = await _scan_lineage(session, scan_id)
+        for section in sections:
+            _, _, render = RESULT_SECTIONS[section]
+            stmt = _section_query(scan_id, section, lineage=lineage).execution_options(yield_per=RESULT_STREAM_BATCH_SIZE)
+            result = await session.stream(stmt)
+            async for row in result:
+                yield section, render(row)
+
+def encode_scan_cursor(started_at: datetime, scan_id: UUID) -> str:
+    raw = f"{started_at.isoformat()}|{scan_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_scan_cursor(cursor: str):
+    """Inverse of encode_scan_cursor. Raises ValueError for malformed cursors."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        started_at, scan_id = raw.split("|")
+        return datetime.fromisoformat(started_at), UUID(scan_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+def _scans_page_query(
+    limit: int,
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    target: Optional[str] = None,
+    started_after: Optional[datetime] = None,
+    started_before: Optional[datetime] = None,
+):
+    stmt = select(Scan.scan_id, Scan.target, Scan.status, Scan.started_at, Scan.finished_at)
+    if cursor:
+        stmt = stmt.where(tuple_(Scan.started_at, Scan.scan_id) < tuple_(*decode_scan_cursor(cursor)))
+    if status:
+        stmt = stmt.where(Scan.status == status)
+    if target:
+        stmt = stmt.where(Scan.target.icontains(target, autoescape=True))
+    if started_after:
+        stmt = stmt.where(Scan.started_at >= started_after)
+    if started_before:
+        stmt = stmt.where(Scan.started_at < started_before)
+    return stmt.order_by(Scan.started_at.desc(), Scan.scan_id.desc()).limit(limit + 1)
+
+async def get_scans_page(
+    limit: int,
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    target: Optional[str] = None,
+    started_after: Optional[datetime] = None,
+    started_before: Optional[datetime] = None,
+):
+    """
+    One page of scans, newest first, using keyset pagination on (started_at, scan_id)
+    so every page is an index range scan regardless of how deep the client has paged.
+    Returns (items, next_cursor); next_cursor is None on the last page.
+    """
+    stmt = _scans_page_query(limit, cursor, status, target, started_after, started_before)
+    async with async_session() as session:
+        rows = (await session.execute(stmt)).fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_scan_cursor(rows[-1].started_at, rows[-1].scan_id)
+    items = [
+        {
+            "scan_id": row.scan_id,
+            "target": row.target,
+            "status": row.status,
+            "started_at": row.started_at,
+            "finished_at": row.finished_at,
+        }
+        for row in rows
+    ]
+    return items, next_cursor
+
+async def get_target_trend(target: str, limit: int) -> List[dict]:
+    """
+    Summaries of a target's last `limit` completed scans, newest first. Reads only
+    the scans table, through ix_scans_target_started_at.
+    """
+    stmt = (
+        select(Scan.scan_id, Scan.started_at, Scan.finished_at, Scan.mode, Scan.summary)
+        .where(Scan.target == target, Scan.status == ScanStatusEnum.completed.value)
+        .order_by(Scan.started_at.desc())
+        .limit(limit)
+    )
+    async with async_session() as session:
+        rows = (await session.execute(stmt)).fetchall()
+    return [
+        {
+            "scan_id": row.scan_id,
+            "started_at": row.started_at,
+            "finished_at": row.finished_at,
+            "mode": row.mode,
+            "summary": row.summary,
         }
+        for row in rows
+    ]
 
-async def get_all_scans():
+async def get_vulnerability_evidence(vulnerability_id: int) -> Optional[dict]:
     async with async_session() as session:
-        result = await session.execute(
-            Scan.__table__.select().order_by(Scan.started_at.desc())
+        evidence = await session.get(VulnerabilityEvidence, vulnerability_id)
+        if not evidence:
+            return None
+        return {
+            "vulnerability_id": evidence.vulnerability_id,
+            "request": evidence.request,
+            "response": evidence.response,
+        }
+
+async def search_vulnerabilities(
+    limit: int,
+    cursor: Optional[str] = None,
+    template_id: Optional[str] = None,
+    host: Optional[str] = None,
+    severity: Optional[str] = None,
+):
+    """
+    Findings across all scans, newest first, matching a nuclei template and/or host.
+    Both are matched by containment on details so the GIN index narrows the rows;
+    keyset-paginated on the vulnerability id. Returns (items, next_cursor) and
+    raises ValueError without a template_id or host, or for a malformed cursor.
+    """
+    match = {}
+    if template_id:
+        match["template-id"] = template_id
+    if host:
+        match["host"] = host
+    if not match:
+        raise ValueError("template_id or host is required")
+    try:
+        before_id = int(cursor) if cursor else None
+    except ValueError as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    stmt = (
+        select(
+            Vulnerability.id, Vulnerability.scan_id, Scan.target, Scan.started_at,
+            Vulnerability.template_id, Vulnerability.severity, Vulnerability.matched_url,
         )
-        scans = result.fetchall()
-        return [
-            {
-                "scan_id": row.scan_id,
-                "target": row.target,
-                "status": row.status,
-                "started_at": row.started_at,
-                "finished_at": row.finished_at,
-            }
-            for row in scans
-        ]
+        .join(Scan, (Scan.scan_id == Vulnerability.scan_id) & (Scan.started_at == Vulnerability.scan_started_at))
+        .where(Vulnerability.details.contains(match))
+    )
+    if severity:
+        stmt = stmt.where(Vulnerability.severity == severity)
+    if before_id is not None:
+        stmt = stmt.where(Vulnerability.id < before_id)
+    stmt = stmt.order_by(Vulnerability.id.desc()).limit(limit + 1)
+    async with async_session() as session:
+        rows = (await session.execute(stmt)).fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = str(rows[-1].id)
+    return [dict(row._mapping) for row in rows], next_cursor
 
 # --- DB Init ---
 async def init_db():
@@ -1,96 +1,429 @@
 import os
+import time
+import logging
+from contextlib import contextmanager
+from functools import lru_cache
+from contextvars import ContextVar
 from uuid import UUID
-from datetime import datetime
-from typing import List, Optional
-from sqlalchemy import create_engine, Column, String, DateTime, Text, Integer, ForeignKey, Enum, JSON
-from sqlalchemy.orm import declarative_base, sessionmaker, relationship
-from sqlalchemy.dialects.postgresql import UUID as PG_UUID
-import enum
+from datetime import datetime, timedelta
+from typing import List, Optional, Set
+from collections import Counter
+from urllib.parse import urlparse
+from sqlalchemy import create_engine, insert, update, delete, select, tuple_, func, literal, case
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.dialects.postgresql import JSONB, insert as pg_insert
+from models import (
+    ScanStatusEnum, Scan, Subdomain, URL, Port, Vulnerability, VulnerabilityEvidence, ProbedHost,
+    split_evidence, host_of, carried_rows, CARRIED_KEYS, LINEAGE_QUERY, SCAN_MAX_INCREMENTS,
+)
+import result_cache
+import scan_events
+import scheduler
+from metrics import DB_WRITE_SECONDS, DB_ROWS_WRITTEN, DB_POOL_CHECKOUT_SECONDS, DB_POOL_CHECKED_OUT
 
 DATABASE_URL = os.getenv("DATABASE_URL_SYNC", os.getenv("DATABASE_URL").replace("+asyncpg", ""))
 
-engine = create_engine(DATABASE_URL, echo=False, future=True)
+# Rows per multi-row INSERT ... VALUES statement for the add_* writers. Rows times
+# columns has to stay under Postgres's 32767 bind parameters per statement.
+BULK_INSERT_BATCH_SIZE = int(os.getenv("BULK_INSERT_BATCH_SIZE", "1000"))
+
+# Per-process pool. A prefork worker child runs one task at a time, so a small pool
+# is enough; keep replicas * concurrency * (size + overflow) under max_connections.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "2"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "2"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Waiting longer than this for a pooled connection is logged as a warning.
+DB_SLOW_CHECKOUT_SECONDS = float(os.getenv("DB_SLOW_CHECKOUT_SECONDS", "1.0"))
+
+logger = logging.getLogger(__name__)
+
+def _create_engine():
+    return create_engine(
+        DATABASE_URL, echo=False, future=True,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+        insertmanyvalues_page_size=BULK_INSERT_BATCH_SIZE,
+    )
+
+engine = _create_engine()
 SessionLocal = sessionmaker(bind=engine)
-Base = declarative_base()
-
-class ScanStatusEnum(str, enum.Enum):
-    in_progress = "in_progress"
-    completed = "completed"
-    failed = "failed"
-
-class Scan(Base):
-    __tablename__ = "scans"
-    scan_id = Column(PG_UUID(as_uuid=True), primary_key=True)
-    target = Column(Text, nullable=False)
-    status = Column(String, default=ScanStatusEnum.in_progress, nullable=False)
-    started_at = Column(DateTime, nullable=False)
-    finished_at = Column(DateTime, nullable=True)
-    subdomains = relationship("Subdomain", back_populates="scan")
-    urls = relationship("URL", back_populates="scan")
-    ports = relationship("Port", back_populates="scan")
-    vulnerabilities = relationship("Vulnerability", back_populates="scan")
-
-class Subdomain(Base):
-    __tablename__ = "subdomains"
-    id = Column(Integer, primary_key=True)
-    scan_id = Column(PG_UUID(as_uuid=True), ForeignKey("scans.scan_id"))
-    subdomain = Column(Text, nullable=False)
-    scan = relationship("Scan", back_populates="subdomains")
-
-class URL(Base):
-    __tablename__ = "urls"
-    id = Column(Integer, primary_key=True)
-    scan_id = Column(PG_UUID(as_uuid=True), ForeignKey("scans.scan_id"))
-    url = Column(Text, nullable=False)
-    scan = relationship("Scan", back_populates="urls")
-
-class Port(Base):
-    __tablename__ = "ports"
-    id = Column(Integer, primary_key=True)
-    scan_id = Column(PG_UUID(as_uuid=True), ForeignKey("scans.scan_id"))
-    ip = Column(Text, nullable=False)
-    port = Column(Integer, nullable=False)
-    scan = relationship("Scan", back_populates="ports")
-
-class Vulnerability(Base):
-    __tablename__ = "vulnerabilities"
-    id = Column(Integer, primary_key=True)
-    scan_id = Column(PG_UUID(as_uuid=True), ForeignKey("scans.scan_id"))
-    template_id = Column(Text, nullable=False)
-    severity = Column(String, nullable=False)
-    matched_url = Column(Text, nullable=False)
-    description = Column(Text, nullable=False)
-    details = Column(JSON, nullable=True)
-    scan = relationship("Scan", back_populates="vulnerabilities")
+
+_checkout_stats = {"checkouts": 0, "checkout_seconds_total": 0.0, "checkout_seconds_max": 0.0}
+_scan_connection: ContextVar = ContextVar("db_sync_scan_connection", default=None)
+
+def init_engine():
+    """
+    Give this process its own engine and pool. Called from Celery's worker_process_init
+    so forked children never reuse connections inherited from the parent.
+    """
+    global engine
+    engine.dispose(close=False)
+    engine = _create_engine()
+    SessionLocal.configure(bind=engine)
+    _checkout_stats.update(checkouts=0, checkout_seconds_total=0.0, checkout_seconds_max=0.0)
+
+def _record_checkout(seconds: float):
+    DB_POOL_CHECKOUT_SECONDS.observe(seconds)
+    DB_POOL_CHECKED_OUT.set(engine.pool.checkedout())
+    _checkout_stats["checkouts"] += 1
+    _checkout_stats["checkout_seconds_total"] += seconds
+    _checkout_stats["checkout_seconds_max"] = max(_checkout_stats["checkout_seconds_max"], seconds)
+    if seconds > DB_SLOW_CHECKOUT_SECONDS:
+        logger.warning(f"Waited {seconds:.2f}s for a database connection: {pool_stats()}")
+
+def pool_stats() -> dict:
+    pool = engine.pool
+    capacity = pool.size() + DB_MAX_OVERFLOW
+    return {
+        "size": pool.size(),
+        "max_overflow": DB_MAX_OVERFLOW,
+        "checked_out": pool.checkedout(),
+        "utilization": pool.checkedout() / capacity if capacity else 0.0,
+        **_checkout_stats,
+    }
+
+@contextmanager
+def transaction():
+    """A connection inside a transaction, or the enclosing scan_transaction()'s one."""
+    conn = _scan_connection.get()
+    if conn is not None:
+        yield conn
+        return
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        _record_checkout(time.perf_counter() - start)
+        yield conn
+    DB_POOL_CHECKED_OUT.set(engine.pool.checkedout())
+
+@contextmanager
+def scan_transaction():
+    """Run every db_sync write in the block on one connection and commit them together."""
+    with transaction() as conn:
+        token = _scan_connection.set(conn)
+        try:
+            yield conn
+        finally:
+            _scan_connection.reset(token)
+
+def bulk_insert(model, rows: List[dict], returning=None):
+    """
+    Insert plain dicts through a Core executemany, which psycopg2 renders as multi-row
+    INSERT ... VALUES pages of BULK_INSERT_BATCH_SIZE rows, skipping ORM objects
+    and the unit-of-work flush entirely. With a returning column, its values are
+    returned in the order of rows.
+    """
+    if not rows:
+        return []
+    stmt = insert(model)
+    if returning is not None:
+        stmt = stmt.returning(returning, sort_by_parameter_order=True)
+    start = time.perf_counter()
+    with transaction() as conn:
+        result = conn.execute(stmt, rows)
+        returned = result.scalars().all() if returning is not None else []
+    DB_WRITE_SECONDS.labels(model.__tablename__).observe(time.perf_counter() - start)
+    DB_ROWS_WRITTEN.labels(model.__tablename__).inc(len(rows))
+    return returned
+
+@lru_cache(maxsize=1024)
+def scan_started_at(scan_id: UUID) -> Optional[datetime]:
+    """
+    A scan's start time, the partition key of its result rows. It never changes, so
+    it is looked up once per process.
+    """
+    with transaction() as conn:
+        return conn.execute(select(Scan.started_at).where(Scan.scan_id == scan_id)).scalar()
+
+def this_scan(scan_id: UUID):
+    """Filter for a scan's row that only reads the partition holding it."""
+    return (Scan.scan_id == scan_id) & (Scan.started_at == scan_started_at(scan_id))
+
+# Writers drop the API's cached copy of whatever they change (see result_cache).
 
 def add_subdomains(scan_id: UUID, subdomains: List[str]):
-    with SessionLocal() as session:
-        objs = [Subdomain(scan_id=scan_id, subdomain=s) for s in subdomains]
-        session.add_all(objs)
-        session.commit()
+    started_at = scan_started_at(scan_id)
+    bulk_insert(Subdomain, [{"scan_id": scan_id, "scan_started_at": started_at, "subdomain": s} for s in subdomains])
+    result_cache.invalidate(scan_id, status=False)
 
 def add_urls(scan_id: UUID, urls: List[str]):
-    with SessionLocal() as session:
-        objs = [URL(scan_id=scan_id, url=u) for u in urls]
-        session.add_all(objs)
-        session.commit()
-
-def add_ports(scan_id: UUID, ports: List[dict]):
-    with SessionLocal() as session:
-        objs = [Port(scan_id=scan_id, ip=p["ip"], port=p["port"]) for p in ports]
-        session.add_all(objs)
-        session.commit()
-
-def add_vulnerabilities(scan_id: UUID, vulns: List[dict]):
-    with SessionLocal() as session:
-        objs = [Vulnerability(scan_id=scan_id, **v) for v in vulns]
-        session.add_all(objs)
-        session.commit()
+    started_at = scan_started_at(scan_id)
+    bulk_insert(URL, [{"scan_id": scan_id, "scan_started_at": started_at, "url": u} for u in urls])
+    result_cache.invalidate(scan_id, status=False)
+
+def add_ports(scan_id: UUID, ports: List[dict], shard: Optional[str] = None):
+    started_at = scan_started_at(scan_id)
+    bulk_insert(Port, [
+        {
+            "scan_id": scan_id, "scan_started_at": started_at,
+            "ip": p["ip"], "port": p["port"], "host": p.get("host"), "shard": shard,
+        }
+        for p in ports
+    ])
+    result_cache.invalidate(scan_id, status=False)
+
+def add_vulnerabilities(scan_id: UUID, vulns: List[dict], shard: Optional[str] = None):
+    started_at = scan_started_at(scan_id)
+    rows, evidence = zip(*(
+        split_evidence({"scan_id": scan_id, "scan_started_at": started_at, "shard": shard, **v}) for v in vulns
+    )) if vulns else ((), ())
+    with scan_transaction():
+        ids = bulk_insert(Vulnerability, list(rows), returning=Vulnerability.id)
+        bulk_insert(VulnerabilityEvidence, [
+            {"vulnerability_id": vulnerability_id, "scan_started_at": started_at, **blobs}
+            for vulnerability_id, blobs in zip(ids, evidence) if blobs
+        ])
+    result_cache.invalidate(scan_id, status=False)
 
 def update_scan_status(scan_id: UUID, status: str, finished_at: Optional[datetime] = None):
-    with SessionLocal() as session:
-        scan = session.get(Scan, scan_id)
-        if scan:
-            scan.status = status
-            scan.finished_at = finished_at
-            session.commit() 
\ No newline at end of file
+    # A cancelled scan stays cancelled, whatever its tasks still in flight report.
+    with transaction() as conn:
+        conn.execute(
+            update(Scan)
+            .where(this_scan(scan_id), Scan.status != ScanStatusEnum.cancelled.value)
+            .values(status=status, finished_at=finished_at)
+        )
+    result_cache.invalidate(scan_id)
+
+def get_scan_status(scan_id: UUID) -> Optional[str]:
+    with transaction() as conn:
+        return conn.execute(select(Scan.status).where(this_scan(scan_id))).scalar()
+
+def mark_stage_cached(scan_id: UUID, stage: str):
+    # Sharded stages report each cache hit, but the stage is only listed once.
+    with transaction() as conn:
+        conn.execute(
+            update(Scan)
+            .where(this_scan(scan_id), ~Scan.cached_stages.any(stage))
+            .values(cached_stages=func.array_append(Scan.cached_stages, stage))
+        )
+    result_cache.invalidate(scan_id, results=False)
+
+def mark_stage_completed(scan_id: UUID, stage: str):
+    """
+    Checkpoint a stage whose rows are all persisted, and roll its counts up into the
+    scan's summary. A resumed scan skips the stage.
+    """
+    with transaction() as conn:
+        conn.execute(
+            update(Scan)
+            .where(this_scan(scan_id), ~Scan.completed_stages.any(stage))
+            .values(
+                completed_stages=func.array_append(Scan.completed_stages, stage),
+                summary=Scan.summary.op("||")(literal(stage_summary(conn, scan_id, stage), JSONB)),
+            )
+        )
+    result_cache.invalidate(scan_id, results=False)
+
+def mark_shard_completed(scan_id: UUID, shard_key: str):
+    with transaction() as conn:
+        conn.execute(
+            update(Scan)
+            .where(this_scan(scan_id), ~Scan.completed_shards.any(shard_key))
+            .values(completed_shards=func.array_append(Scan.completed_shards, shard_key))
+        )
+
+def add_probed_hosts(scan_id: UUID, stage: str, targets: List[str]):
+    """Record the hosts of the targets a naabu/nuclei shard probed (see ProbedHost)."""
+    started_at = scan_started_at(scan_id)
+    rows = [
+        {"scan_id": scan_id, "scan_started_at": started_at, "stage": stage, "host": host}
+        for host in sorted({host_of(target) for target in targets})
+    ]
+    with transaction() as conn:
+        conn.execute(pg_insert(ProbedHost).on_conflict_do_nothing(), rows)
+
+def claim_queued_scans() -> List[dict]:
+    """
+    Start the queued scans that now fit under the running-scan caps, highest priority
+    and oldest first: mark them in_progress, admitted now, and return them (scan_id,
+    target, nuclei_templates, mode, priority) for their pipelines to be enqueued.
+    """
+    now = datetime.utcnow()
+    with transaction() as conn:
+        conn.execute(select(func.pg_advisory_xact_lock(scheduler.ADMISSION_LOCK_CLASS, 0)))
+        queued = conn.execute(
+            select(Scan.scan_id, Scan.started_at, Scan.target, Scan.owner, Scan.nuclei_templates, Scan.mode, Scan.priority)
+            .where(Scan.status == ScanStatusEnum.queued.value)
+            .order_by(case(scheduler.SCAN_PRIORITIES, value=Scan.priority), Scan.started_at)
+            .limit(scheduler.SCAN_DISPATCH_BATCH)
+        ).mappings().all()
+        if not queued:
+            return []
+        owners = {scan["owner"] for scan in queued if scan["owner"]}
+        running = (
+            Scan.status == ScanStatusEnum.in_progress.value,
+            Scan.admitted_at >= now - timedelta(seconds=scheduler.SCAN_STUCK_AFTER),
+        )
+        by_owner = Counter(dict(conn.execute(
+            select(Scan.owner, func.count()).where(*running, Scan.owner.in_(owners)).group_by(Scan.owner)
+        ).all())) if owners else Counter()
+        by_target = Counter(dict(conn.execute(
+            select(Scan.target, func.count())
+            .where(*running, Scan.target.in_({scan["target"] for scan in queued})).group_by(Scan.target)
+        ).all()))
+        admitted = scheduler.admit([dict(scan) for scan in queued], by_owner, by_target)
+        if admitted:
+            keys = [(scan["scan_id"], scan["started_at"]) for scan in admitted]
+            conn.execute(
+                update(Scan)
+                .where(tuple_(Scan.scan_id, Scan.started_at).in_(keys))
+                .values(status=ScanStatusEnum.in_progress.value, admitted_at=now)
+            )
+    for scan in admitted:
+        result_cache.invalidate(scan["scan_id"], results=False)
+    return admitted
+
+def demote_scan(scan_id: UUID):
+    with transaction() as conn:
+        conn.execute(update(Scan).where(this_scan(scan_id)).values(priority="demoted"))
+    result_cache.invalidate(scan_id, results=False)
+
+def get_tool_overrides(scan_id: UUID) -> dict:
+    with transaction() as conn:
+        return conn.execute(select(Scan.tool_overrides).where(this_scan(scan_id))).scalar() or {}
+
+def record_tool_run(scan_id: UUID, run: dict):
+    """Append a naabu/nuclei run (its profile and throughput) to the scan's tool_runs."""
+    with transaction() as conn:
+        conn.execute(
+            update(Scan).where(this_scan(scan_id))
+            .values(tool_runs=Scan.tool_runs.op("||")(literal([run], JSONB)))
+        )
+    result_cache.invalidate(scan_id, results=False)
+
+def get_completed_shards(scan_id: UUID, stage: str) -> Set[str]:
+    with transaction() as conn:
+        keys = conn.execute(select(Scan.completed_shards).where(this_scan(scan_id))).scalar() or []
+    return {key for key in keys if key.startswith(f"{stage}:")}
+
+def clear_stage(scan_id: UUID, stage: str, model):
+    """
+    Delete the rows a stage wrote for a scan, the hosts it probed, and its shard
+    checkpoints, so the stage can run again from scratch. Evidence goes with its
+    vulnerabilities (ON DELETE CASCADE). The section's row total in the scan's
+    progress goes back to zero.
+    """
+    with transaction() as conn:
+        conn.execute(delete(model).where(of_scan(model, scan_id)))
+        conn.execute(delete(ProbedHost).where(of_scan(ProbedHost, scan_id), ProbedHost.stage == stage))
+        keys = conn.execute(select(Scan.completed_shards).where(this_scan(scan_id))).scalar() or []
+        conn.execute(
+            update(Scan).where(this_scan(scan_id))
+            .values(completed_shards=[key for key in keys if not key.startswith(f"{stage}:")])
+        )
+    result_cache.invalidate(scan_id, status=False)
+    scan_events.publish_rows_cleared(scan_id, model.__tablename__)
+
+def _scan_rows(conn, model, scan_id: UUID, *columns):
+    """
+    Subquery of a scan's rows as GET /scans/{id}/results returns them: for ports and
+    vulnerabilities, with the rows carried from its baselines, the newest scan's winning.
+    """
+    lineage = conn.execute(LINEAGE_QUERY, {"scan_id": scan_id}).all()
+    if len(lineage) > 1 and model in CARRIED_KEYS:
+        return carried_rows(model, lineage, *columns).subquery()
+    return select(*columns).where(of_scan(model, scan_id)).subquery()
+
+def stage_summary(conn, scan_id: UUID, stage: str) -> dict:
+    """The summary counts a completed stage contributes."""
+    if stage in ("subfinder", "katana"):
+        model = Subdomain if stage == "subfinder" else URL
+        count = conn.execute(select(func.count()).select_from(model).where(of_scan(model, scan_id))).scalar()
+        return {model.__tablename__: count}
+    if stage == "naabu":
+        rows = _scan_rows(conn, Port, scan_id, Port.ip)
+        ports, hosts = conn.execute(select(func.count(), func.count(rows.c.ip.distinct())).select_from(rows)).one()
+        return {"ports": ports, "hosts_with_ports": hosts}
+    rows = _scan_rows(conn, Vulnerability, scan_id, Vulnerability.severity)
+    severity = dict(conn.execute(select(rows.c.severity, func.count()).group_by(rows.c.severity)).all())
+    return {"vulnerabilities": sum(severity.values()), "severity": severity}
+
+def clear_shard(scan_id: UUID, model, shard_key: str) -> int:
+    """
+    Delete the rows an earlier, failed attempt of a naabu/nuclei shard committed, so
+    the shard can run again. Returns how many there were.
+    """
+    with transaction() as conn:
+        deleted = conn.execute(delete(model).where(of_scan(model, scan_id), model.shard == shard_key)).rowcount
+    if deleted:
+        result_cache.invalidate(scan_id, status=False)
+        scan_events.publish_rows_cleared(scan_id, model.__tablename__, deleted)
+    return deleted
+
+def count_rows(scan_id: UUID, model) -> int:
+    with transaction() as conn:
+        return conn.execute(select(func.count()).select_from(model).where(of_scan(model, scan_id))).scalar()
+
+def get_resume_state(scan_id: UUID) -> Optional[dict]:
+    """What resuming a scan needs: its target, templates, baseline, completed stages and priority."""
+    with transaction() as conn:
+        row = conn.execute(
+            select(Scan.target, Scan.nuclei_templates, Scan.baseline_scan_id, Scan.completed_stages, Scan.priority)
+            .where(this_scan(scan_id))
+        ).first()
+    return dict(row._mapping) if row else None
+
+def assign_baseline_scan(scan_id: UUID, target: str, nuclei_templates: List[str]) -> Optional[UUID]:
+    """
+    Link an incremental scan to the latest completed scan of the same target and
+    nuclei template set, and return that scan's id. None if there is no such scan:
+    findings of other templates can't stand in for a run of these. None as well when
+    that scan is already SCAN_MAX_INCREMENTS increments away from a full scan.
+    """
+    templates = sorted(set(nuclei_templates))
+    with transaction() as conn:
+        baseline_id = conn.execute(
+            select(Scan.scan_id)
+            .where(
+                Scan.target == target, Scan.status == "completed", Scan.scan_id != scan_id,
+                Scan.nuclei_templates.contains(templates), Scan.nuclei_templates.contained_by(templates),
+            )
+            .order_by(Scan.started_at.desc())
+            .limit(1)
+        ).scalar()
+        if baseline_id and len(conn.execute(LINEAGE_QUERY, {"scan_id": baseline_id}).all()) > SCAN_MAX_INCREMENTS:
+            logger.info(f"Baseline {baseline_id} is {SCAN_MAX_INCREMENTS} increments deep, scan {scan_id} runs in full")
+            baseline_id = None
+        if baseline_id:
+            conn.execute(update(Scan).where(this_scan(scan_id)).values(baseline_scan_id=baseline_id))
+    if baseline_id:
+        result_cache.invalidate(scan_id, results=False)
+    return baseline_id
+
+def of_scan(model, scan_id: UUID):
+    """Filter for a scan's rows of a result table that only reads the scan's partition."""
+    return (model.scan_id == scan_id) & (model.scan_started_at == scan_started_at(scan_id))
+
+def _new_values(column, scan_id: UUID, baseline_id: UUID):
+    model = column.class_
+    return (
+        select(column).where(of_scan(model, scan_id))
+        .except_(select(column).where(of_scan(model, baseline_id)))
+    )
+
+def get_subdomains(scan_id: UUID) -> List[str]:
+    with transaction() as conn:
+        return list(conn.execute(
+            select(Subdomain.subdomain).where(of_scan(Subdomain, scan_id)).distinct().order_by(Subdomain.subdomain)
+        ).scalars())
+
+def get_new_subdomains(scan_id: UUID, baseline_id: UUID) -> List[str]:
+    with transaction() as conn:
+        return list(conn.execute(_new_values(Subdomain.subdomain, scan_id, baseline_id)).scalars())
+
+def get_changed_hosts(scan_id: UUID, baseline_id: UUID) -> Set[str]:
+    """New subdomains plus the hosts of every URL katana didn't see in the baseline."""
+    hosts = set(get_new_subdomains(scan_id, baseline_id))
+    with transaction() as conn:
+        urls = conn.execute(
+            _new_values(URL.url, scan_id, baseline_id).execution_options(yield_per=1000)
+        ).scalars()
+        for url in urls:
+            host = urlparse(url).hostname
+            if host:
+                hosts.add(host)
+    return hosts
@@ -1,26 +1,115 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel, HttpUrl, Field
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse, Response
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, HttpUrl, Field, TypeAdapter, ValidationError
 from uuid import UUID, uuid4
 from datetime import datetime
-from typing import List, Optional
+from typing import Any, List, Literal, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
 import redis.asyncio as aioredis
+import json
 import os
+import time
+import logging
 
-from db import get_scan_by_id, create_scan, get_scan_results, get_all_scans, async_session
-from worker import start_scan_chain
+from db import (
+    get_scan_by_id, create_scan, get_scan_results, get_scans_page, async_session,
+    scan_exists, get_scan_section_page, stream_scan_results, RESULT_SECTIONS,
+    create_scans, fail_scans, scan_coalesce_key, resume_scan, cancel_scan,
+    get_vulnerability_evidence, search_vulnerabilities, get_target_trend,
+)
+from worker import start_scan_chain, resume_scan_chain, enqueue_scans, dispatch_queued_scans
+from metrics import API_REQUEST_DURATION, render_latest
+import scan_events
+import scheduler
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="ProjectDiscovery Security Scanner API")
 
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    # Label by route template, not raw path, so scan ids don't explode cardinality.
+    route = request.scope.get("route")
+    API_REQUEST_DURATION.labels(
+        request.method, route.path if route else "unmatched", str(response.status_code)
+    ).observe(time.perf_counter() - start)
+    return response
+
+# Priority classes a scan can ask for; see scheduler.SCAN_PRIORITIES.
+ScanPriority = Literal["interactive", "normal", "batch"]
+
+class NaabuOverrides(BaseModel):
+    concurrency: Optional[int] = Field(None, ge=1, description="-c, concurrent probes")
+    rate: Optional[int] = Field(None, ge=1, description="-rate, packets per second")
+
+class NucleiOverrides(BaseModel):
+    concurrency: Optional[int] = Field(None, ge=1, description="-c, templates run in parallel")
+    bulk_size: Optional[int] = Field(None, ge=1, description="-bulk-size, hosts per template run in parallel")
+    rate: Optional[int] = Field(None, ge=1, description="-rate-limit, requests per second")
+
+class ToolOverrides(BaseModel):
+    naabu: Optional[NaabuOverrides] = None
+    nuclei: Optional[NucleiOverrides] = None
+
 class ScanRequest(BaseModel):
     target: HttpUrl
     nuclei_templates: List[str] = Field(default_factory=lambda: ["default"])
+    mode: Literal["full", "incremental"] = Field(
+        "full",
+        description="incremental only probes hosts new or changed since the target's last completed scan",
+    )
+    coalesce: Optional[bool] = Field(
+        None,
+        description="attach to a queued or running scan of the same target, templates and mode instead of starting a new one (default: SCAN_COALESCE)",
+    )
+    tool_overrides: Optional[ToolOverrides] = Field(
+        None,
+        description="naabu/nuclei settings replacing those the worker picks from the input size and its resources",
+    )
+    owner: Optional[str] = Field(
+        None, max_length=200,
+        description="who the scan is for; an owner has at most SCAN_MAX_RUNNING_PER_OWNER scans running, the rest are queued",
+    )
+    priority: ScanPriority = Field(
+        "normal",
+        description="interactive scans are served before normal ones, normal before batch",
+    )
 
 class ScanResponse(BaseModel):
     scan_id: UUID
     message: str
+    coalesced: bool = False
+    queued: bool = False
+
+# Default for ScanRequest.coalesce when a request doesn't set it.
+SCAN_COALESCE = os.getenv("SCAN_COALESCE", "0") == "1"
+
+# Upper bound on targets per POST /scans/batch request.
+SCAN_BATCH_MAX_TARGETS = int(os.getenv("SCAN_BATCH_MAX_TARGETS", "10000"))
+
+class ScanBatchRequest(BaseModel):
+    targets: List[HttpUrl] = Field(..., min_length=1, max_length=SCAN_BATCH_MAX_TARGETS)
+    nuclei_templates: List[str] = Field(default_factory=lambda: ["default"])
+    mode: Literal["full", "incremental"] = "full"
+    coalesce: Optional[bool] = None
+    tool_overrides: Optional[ToolOverrides] = None
+    owner: Optional[str] = Field(None, max_length=200)
+    priority: ScanPriority = "batch"
+
+class ScanBatchItem(BaseModel):
+    scan_id: UUID
+    target: HttpUrl
+    coalesced: bool = False
+    queued: bool = False
+
+class ScanBatchResponse(BaseModel):
+    scans: List[ScanBatchItem]
+    duplicates: int
+    message: str
 
 class ScanStatusResponse(BaseModel):
     scan_id: UUID
@@ -28,6 +117,48 @@ class ScanStatusResponse(BaseModel):
     status: str
     started_at: datetime
     finished_at: Optional[datetime]
+    cached_stages: List[str] = []
+    completed_stages: List[str] = []
+    tool_runs: List[dict] = []
+    owner: Optional[str] = None
+    priority: str = "normal"
+    mode: str = "full"
+    baseline_scan_id: Optional[UUID] = None
+
+# Severities every scan summary reports, zero when nuclei found none of them.
+SUMMARY_SEVERITIES = ("critical", "high", "medium", "low", "info", "unknown")
+
+class ScanSummary(BaseModel):
+    """Counts of a scan's findings. A count is null until the stage producing it has completed."""
+    subdomains: Optional[int] = None
+    urls: Optional[int] = None
+    ports: Optional[int] = None
+    hosts_with_ports: Optional[int] = None
+    vulnerabilities: Optional[int] = None
+    severity: Optional[dict] = None
+
+class ScanSummaryResponse(BaseModel):
+    scan_id: UUID
+    target: HttpUrl
+    status: str
+    started_at: datetime
+    finished_at: Optional[datetime]
+    completed_stages: List[str] = []
+    summary: ScanSummary
+
+class TargetTrendItem(BaseModel):
+    scan_id: UUID
+    started_at: datetime
+    finished_at: Optional[datetime]
+    mode: str = "full"
+    summary: ScanSummary
+
+# Normalises a trend's target the way scan targets are stored.
+target_url = TypeAdapter(HttpUrl)
+
+class TargetTrendResponse(BaseModel):
+    target: HttpUrl
+    items: List[TargetTrendItem]
 
 class ScanResultsResponse(BaseModel):
     subdomains: List[str]
@@ -35,6 +166,14 @@ class ScanResultsResponse(BaseModel):
     ports: List[dict]
     vulnerabilities: List[dict]
 
+ResultSection = Literal["subdomains", "urls", "ports", "vulnerabilities"]
+ResultFormat = Literal["json", "ndjson"]
+
+class ScanSectionPage(BaseModel):
+    section: ResultSection
+    items: List[Any]
+    next_cursor: Optional[str]
+
 class ScanListItem(BaseModel):
     scan_id: UUID
     target: HttpUrl
@@ -42,6 +181,28 @@ class ScanListItem(BaseModel):
     started_at: datetime
     finished_at: Optional[datetime]
 
+class ScanListResponse(BaseModel):
+    items: List[ScanListItem]
+    next_cursor: Optional[str]
+
+class VulnerabilityMatch(BaseModel):
+    id: int
+    scan_id: UUID
+    target: str
+    started_at: datetime
+    template_id: str
+    severity: str
+    matched_url: str
+
+class VulnerabilitySearchResponse(BaseModel):
+    items: List[VulnerabilityMatch]
+    next_cursor: Optional[str]
+
+class VulnerabilityEvidenceResponse(BaseModel):
+    vulnerability_id: int
+    request: Optional[str]
+    response: Optional[str]
+
 # Dependency for async DB session
 async def get_async_session() -> AsyncSession:
     async with async_session() as session:
@@ -60,10 +221,123 @@ async def get_redis():
 async def create_scan_endpoint(request: ScanRequest):
     scan_id = uuid4()
     now = datetime.utcnow()
-    await create_scan(scan_id, str(request.target), now)
-    start_scan_chain.delay(str(scan_id), str(request.target), request.nuclei_templates)
+    coalesce = SCAN_COALESCE if request.coalesce is None else request.coalesce
+    key = scan_coalesce_key(str(request.target), request.nuclei_templates, request.mode) if coalesce else None
+    coalesced_scan_id, status = await create_scan(
+        scan_id, str(request.target), now, request.mode, key, request.nuclei_templates,
+        request.tool_overrides.model_dump(exclude_none=True) if request.tool_overrides else None,
+        request.owner, request.priority,
+    )
+    if coalesced_scan_id:
+        queued = status == "queued"
+        return ScanResponse(
+            scan_id=coalesced_scan_id, message=f"Attached to {'queued' if queued else 'running'} scan",
+            coalesced=True, queued=queued,
+        )
+    if status == "queued":
+        return ScanResponse(
+            scan_id=scan_id, message="Scan queued, its owner or target is at its running-scan cap", queued=True,
+        )
+    try:
+        await run_in_threadpool(
+            start_scan_chain.apply_async,
+            (str(scan_id), str(request.target), request.nuclei_templates, request.mode),
+            priority=scheduler.broker_priority(request.priority),
+        )
+    except Exception as e:
+        # Otherwise the scan would hold its slot under the caps with nothing running it.
+        await fail_scans([scan_id], datetime.utcnow())
+        raise HTTPException(status_code=503, detail=f"Could not enqueue scan: {e}")
     return ScanResponse(scan_id=scan_id, message="Scan started")
 
+@app.post("/scans/batch", response_model=ScanBatchResponse)
+async def create_scan_batch_endpoint(request: ScanBatchRequest):
+    """
+    Start scans for many targets at once. Targets are de-duplicated after URL
+    normalization, all scan rows are inserted in one transaction and the pipelines
+    are enqueued over a single broker connection. If enqueueing fails, the new
+    scans are marked failed and 503 is returned. With coalescing, targets that
+    already have a matching queued or running scan get that scan's id. Scans over
+    the running-scan caps are queued and started later.
+    """
+    targets = list(dict.fromkeys(str(target) for target in request.targets))
+    now = datetime.utcnow()
+    coalesce = SCAN_COALESCE if request.coalesce is None else request.coalesce
+    rows = [
+        {
+            "scan_id": uuid4(), "target": target, "started_at": now, "mode": request.mode,
+            "nuclei_templates": request.nuclei_templates,
+            "tool_overrides": request.tool_overrides.model_dump(exclude_none=True) if request.tool_overrides else None,
+            "owner": request.owner, "priority": request.priority,
+            "coalesce_key": scan_coalesce_key(target, request.nuclei_templates, request.mode) if coalesce else None,
+        }
+        for target in targets
+    ]
+    active, queued = await create_scans(rows)
+    items, new_scans = [], []
+    for row in rows:
+        if row["coalesce_key"] in active:
+            scan_id, status = active[row["coalesce_key"]]
+            items.append(ScanBatchItem(scan_id=scan_id, target=row["target"], coalesced=True, queued=status == "queued"))
+        elif row["scan_id"] in queued:
+            items.append(ScanBatchItem(scan_id=row["scan_id"], target=row["target"], queued=True))
+        else:
+            items.append(ScanBatchItem(scan_id=row["scan_id"], target=row["target"]))
+            new_scans.append((row["scan_id"], row["target"]))
+    try:
+        await run_in_threadpool(enqueue_scans, new_scans, request.nuclei_templates, request.mode, request.priority)
+    except Exception as e:
+        await fail_scans([scan_id for scan_id, _ in new_scans], datetime.utcnow())
+        raise HTTPException(status_code=503, detail=f"Could not enqueue scans: {e}")
+    return ScanBatchResponse(
+        scans=items,
+        duplicates=len(request.targets) - len(targets),
+        message=(
+            f"{len(new_scans)} scans started, {len(queued)} queued, "
+            f"{len(items) - len(new_scans) - len(queued)} attached to queued or running scans"
+        ),
+    )
+
+@app.post("/scans/{scan_id}/resume", response_model=ScanResponse)
+async def resume_scan_endpoint(scan_id: UUID):
+    """
+    Restart a failed scan from its first incomplete stage. Rows of completed stages,
+    and of naabu/nuclei shards that were committed, are kept and not scanned again.
+    """
+    try:
+        found = await resume_scan(scan_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if not found:
+        raise HTTPException(status_code=404, detail="Scan not found")
+    try:
+        await run_in_threadpool(resume_scan_chain.delay, str(scan_id))
+    except Exception as e:
+        await fail_scans([scan_id], datetime.utcnow())
+        raise HTTPException(status_code=503, detail=f"Could not enqueue scan: {e}")
+    return ScanResponse(scan_id=scan_id, message="Scan resumed")
+
+@app.post("/scans/{scan_id}/cancel", response_model=ScanResponse)
+@app.delete("/scans/{scan_id}", response_model=ScanResponse)
+async def cancel_scan_endpoint(scan_id: UUID):
+    """
+    Stop a running or queued scan. Its running tools are killed within TOOL_WATCH_INTERVAL
+    and its queued tasks are dropped when a worker picks them up. Rows already stored are kept.
+    """
+    try:
+        found = await cancel_scan(scan_id, datetime.utcnow())
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if not found:
+        raise HTTPException(status_code=404, detail="Scan not found")
+    await scan_events.publish_cancelled(scan_id)
+    # The scan's slot under the caps is free; beat retries dispatch if this fails.
+    try:
+        await run_in_threadpool(dispatch_queued_scans.apply_async, priority=scheduler.broker_priority("interactive"))
+    except Exception:
+        logger.warning("Could not dispatch queued scans", exc_info=True)
+    return ScanResponse(scan_id=scan_id, message="Scan cancelled")
+
 @app.get("/scans/{scan_id}", response_model=ScanStatusResponse)
 async def get_scan_status(scan_id: UUID):
     scan = await get_scan_by_id(scan_id)
@@ -71,17 +345,186 @@ async def get_scan_status(scan_id: UUID):
         raise HTTPException(status_code=404, detail="Scan not found")
     return scan
 
+def scan_summary(rollup: dict) -> ScanSummary:
+    summary = ScanSummary(**{name: value for name, value in rollup.items() if name != "severity"})
+    if "severity" in rollup:
+        summary.severity = {**dict.fromkeys(SUMMARY_SEVERITIES, 0), **rollup["severity"]}
+    return summary
+
+@app.get("/scans/{scan_id}/summary", response_model=ScanSummaryResponse)
+async def get_scan_summary(scan_id: UUID):
+    """
+    Finding counts of a scan, by severity for vulnerabilities. They are rolled up as
+    each stage completes, so this never reads the result tables.
+    """
+    scan = await get_scan_by_id(scan_id)
+    if not scan:
+        raise HTTPException(status_code=404, detail="Scan not found")
+    return ScanSummaryResponse(**{**scan, "summary": scan_summary(scan.get("summary") or {})})
+
+@app.get("/targets/{target:path}/trend", response_model=TargetTrendResponse)
+async def get_target_trend_endpoint(target: str, limit: int = Query(30, ge=1, le=1000)):
+    """
+    Summaries of a target's completed scans, newest first. The target is the scanned
+    URL, URL-encoded, e.g. /targets/https%3A%2F%2Fexample.com/trend.
+    """
+    try:
+        target = str(target_url.validate_python(target))
+    except ValidationError:
+        raise HTTPException(status_code=400, detail=f"Invalid target: {target}")
+    items = await get_target_trend(target, limit)
+    return TargetTrendResponse(
+        target=target,
+        items=[{**item, "summary": scan_summary(item["summary"])} for item in items],
+    )
+
+async def open_scan_events(scan_id: UUID):
+    """
+    Subscribe to a scan's progress events. Postgres is only asked when Redis has no
+    snapshot for the scan; returns (None, None) if the scan doesn't exist.
+    """
+    pubsub, snapshot = await scan_events.subscribe(scan_id)
+    if snapshot is None:
+        scan = await get_scan_by_id(scan_id)
+        if not scan:
+            await pubsub.aclose()
+            return None, None
+        snapshot = {"status": scan["status"], "stages": {}, "rows": {}}
+    return pubsub, snapshot
+
+@app.get("/scans/{scan_id}/events")
+async def scan_events_sse(scan_id: UUID):
+    """
+    Server-Sent Events stream of a scan's progress: a `snapshot` event with the current
+    status, stage states and row counts, then `status`, `stage` and `rows` events as
+    workers publish them. The stream ends once the scan is completed or failed.
+    """
+    pubsub, snapshot = await open_scan_events(scan_id)
+    if pubsub is None:
+        raise HTTPException(status_code=404, detail="Scan not found")
+
+    async def lines():
+        async for event in scan_events.iter_events(pubsub, snapshot):
+            if event is None:
+                yield ": keepalive\n\n"
+            else:
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+    # X-Accel-Buffering stops nginx ingress from holding events back.
+    return StreamingResponse(
+        lines(), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.websocket("/scans/{scan_id}/events/ws")
+async def scan_events_ws(websocket: WebSocket, scan_id: UUID):
+    """
+    Same events as GET /scans/{scan_id}/events, one JSON message each. Closes with
+    code 4404 for an unknown scan and 1000 once the scan has finished.
+    """
+    await websocket.accept()
+    pubsub, snapshot = await open_scan_events(scan_id)
+    if pubsub is None:
+        await websocket.close(code=4404, reason="Scan not found")
+        return
+    try:
+        async for event in scan_events.iter_events(pubsub, snapshot):
+            if event is not None:
+                await websocket.send_json(event)
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+
+def ndjson_response(scan_id: UUID, sections: List[str]) -> StreamingResponse:
+    async def lines():
+        async for section, item in stream_scan_results(scan_id, sections):
+            yield json.dumps({"section": section, "item": item}, default=str) + "\n"
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
 @app.get("/scans/{scan_id}/results", response_model=ScanResultsResponse)
-async def get_scan_results_endpoint(scan_id: UUID):
+async def get_scan_results_endpoint(scan_id: UUID, format: ResultFormat = "json"):
+    """
+    All results of a scan. With format=ndjson the rows are streamed one per line as
+    {"section": ..., "item": ...} instead of being built into a single document.
+    """
+    if format == "ndjson":
+        if not await scan_exists(scan_id):
+            raise HTTPException(status_code=404, detail="Results not found")
+        return ndjson_response(scan_id, list(RESULT_SECTIONS))
     results = await get_scan_results(scan_id)
     if not results:
         raise HTTPException(status_code=404, detail="Results not found")
     return results
 
-@app.get("/scans", response_model=List[ScanListItem])
-async def list_scans():
-    scans = await get_all_scans()
-    return scans 
+@app.get("/scans/{scan_id}/results/{section}", response_model=ScanSectionPage)
+async def get_scan_section_endpoint(
+    scan_id: UUID,
+    section: ResultSection,
+    cursor: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=10000),
+    format: ResultFormat = "json",
+):
+    """
+    One section of a scan's results, paginated with next_cursor. With format=ndjson the
+    whole section is streamed instead and cursor/limit are ignored.
+    """
+    if not await scan_exists(scan_id):
+        raise HTTPException(status_code=404, detail="Results not found")
+    if format == "ndjson":
+        return ndjson_response(scan_id, [section])
+    try:
+        items, next_cursor = await get_scan_section_page(scan_id, section, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return ScanSectionPage(section=section, items=items, next_cursor=next_cursor)
+
+@app.get("/scans", response_model=ScanListResponse)
+async def list_scans(
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    target: Optional[str] = Query(None, description="Case-insensitive substring of the scan target"),
+    started_after: Optional[datetime] = None,
+    started_before: Optional[datetime] = None,
+):
+    """
+    List scans newest first. Pass the returned next_cursor back as cursor to get the
+    next page; it is null once there are no more scans matching the filters.
+    """
+    try:
+        items, next_cursor = await get_scans_page(
+            limit, cursor, status, target, started_after, started_before
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return ScanListResponse(items=items, next_cursor=next_cursor)
+
+@app.get("/vulnerabilities/search", response_model=VulnerabilitySearchResponse)
+async def search_vulnerabilities_endpoint(
+    template_id: Optional[str] = Query(None, description="nuclei template id, e.g. CVE-2021-44228"),
+    host: Optional[str] = Query(None, description="Affected host as reported by nuclei"),
+    severity: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+):
+    """
+    Find vulnerabilities across all scans by template and/or affected host, newest
+    first. At least one of template_id or host is required.
+    """
+    try:
+        items, next_cursor = await search_vulnerabilities(limit, cursor, template_id, host, severity)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return VulnerabilitySearchResponse(items=items, next_cursor=next_cursor)
+
+@app.get("/vulnerabilities/{vulnerability_id}/evidence", response_model=VulnerabilityEvidenceResponse)
+async def get_vulnerability_evidence_endpoint(vulnerability_id: int):
+    """
+    Raw request and response of a finding, which are left out of scan results.
+    """
+    evidence = await get_vulnerability_evidence(vulnerability_id)
+    if not evidence:
+        raise HTTPException(status_code=404, detail="No evidence for this vulnerability")
+    return evidence
 
 @app.get("/health", status_code=200)
 async def health_check(
@@ -117,3 +560,10 @@ async def health_check(
         
     return health_status
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """
+    Prometheus metrics of the API process. Worker metrics are served by the workers themselves.
+    """
+    payload, content_type = render_latest()
+    return Response(payload, media_type=content_type)
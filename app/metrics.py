@@ -0,0 +1,85 @@
+import os
+from prometheus_client import (
+    Counter, Gauge, Histogram, CollectorRegistry, REGISTRY,
+    CONTENT_TYPE_LATEST, generate_latest, multiprocess, start_http_server,
+)
+
+# Celery prefork children record into PROMETHEUS_MULTIPROC_DIR and the worker's main
+# process serves the aggregate. The API runs a single process and uses the default registry.
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "9100"))
+
+STAGE_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200, 14400)
+
+STAGE_DURATION = Histogram(
+    "pdscanner_stage_duration_seconds", "Wall time of a scan stage task", ["stage"], buckets=STAGE_BUCKETS,
+)
+STAGE_START_DELAY = Histogram(
+    "pdscanner_stage_start_delay_seconds", "Time from POST /scans to the stage task starting", ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+TASK_QUEUE_WAIT = Histogram(
+    "pdscanner_task_queue_wait_seconds", "Time a task spent in the broker before a worker started it", ["task"],
+    buckets=(0.05, 0.1, 0.5, 1, 5, 15, 60, 300, 900, 3600),
+)
+SUBPROCESS_WALL = Histogram(
+    "pdscanner_subprocess_wall_seconds", "Wall time of a tool subprocess", ["tool"], buckets=STAGE_BUCKETS,
+)
+SUBPROCESS_CPU = Counter(
+    "pdscanner_subprocess_cpu_seconds_total", "User + system CPU time of tool subprocesses", ["tool"],
+)
+LINES_PARSED = Counter(
+    "pdscanner_tool_lines_parsed_total", "JSONL records parsed from tool output", ["tool"],
+)
+TOOL_ABORTS = Counter(
+    "pdscanner_tool_aborts_total", "Tool runs stopped early, by reason (cancelled, timeout, output)", ["tool", "reason"],
+)
+TOOL_THROUGHPUT = Histogram(
+    "pdscanner_tool_throughput_hosts_per_second", "Input hosts a naabu/nuclei run got through per second", ["tool"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 500),
+)
+DB_WRITE_SECONDS = Histogram(
+    "pdscanner_db_write_seconds", "Time spent in one bulk insert", ["table"],
+    buckets=(0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+DB_ROWS_WRITTEN = Counter(
+    "pdscanner_db_rows_written_total", "Result rows inserted", ["table"],
+)
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "pdscanner_db_pool_checkout_seconds", "Time waiting for a pooled database connection",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "pdscanner_db_pool_checked_out", "Connections currently checked out of worker pools",
+    multiprocess_mode="livesum",
+)
+API_REQUEST_DURATION = Histogram(
+    "pdscanner_api_request_duration_seconds", "API request latency", ["method", "route", "status"],
+)
+
+def render_latest():
+    """Exposition payload and content type for a /metrics response."""
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+def start_worker_exporter():
+    """Serve the aggregated metrics of every worker process. Run once in the main process."""
+    if not PROMETHEUS_MULTIPROC_DIR:
+        start_http_server(WORKER_METRICS_PORT)
+        return
+    # Files left behind by a previous run of the container would be summed into this one.
+    own_suffix = f"_{os.getpid()}.db"
+    for name in os.listdir(PROMETHEUS_MULTIPROC_DIR):
+        if name.endswith(".db") and not name.endswith(own_suffix):
+            os.remove(os.path.join(PROMETHEUS_MULTIPROC_DIR, name))
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    start_http_server(WORKER_METRICS_PORT, registry=registry)
+
+def mark_process_dead(pid: int):
+    if PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,271 @@
+"""
+Tables and row helpers shared by db (API, asyncpg) and db_sync (worker, psycopg2),
+so both sides always read and write the same schema.
+"""
+import os
+import re
+import enum
+from sqlalchemy import (
+    text, select, exists, func, literal, and_, or_, Column, String, DateTime, Text, Integer, ForeignKeyConstraint, Index,
+)
+from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID, ARRAY, JSONB
+
+Base = declarative_base()
+
+# scans and every result table are range-partitioned by scan start time, one
+# partition per month (see partitions.py). Result rows carry their scan's started_at
+# so they land in the same month as the scan, and the whole month can be dropped at once.
+
+def scan_partition_key():
+    return ForeignKeyConstraint(["scan_id", "scan_started_at"], ["scans.scan_id", "scans.started_at"])
+
+class ScanStatusEnum(str, enum.Enum):
+    queued = "queued"
+    in_progress = "in_progress"
+    completed = "completed"
+    failed = "failed"
+    cancelled = "cancelled"
+
+class Scan(Base):
+    __tablename__ = "scans"
+    __table_args__ = (
+        Index("ix_scans_started_at_scan_id", "started_at", "scan_id"),
+        Index("ix_scans_target_trgm", "target", postgresql_using="gin", postgresql_ops={"target": "gin_trgm_ops"}),
+        Index("ix_scans_target_started_at", "target", "started_at"),
+        Index("ix_scans_coalesce_key_active", "coalesce_key", postgresql_where=text("status IN ('queued', 'in_progress')")),
+        Index("ix_scans_owner_running", "owner", postgresql_where=text("status = 'in_progress'")),
+        Index("ix_scans_queued", "started_at", postgresql_where=text("status = 'queued'")),
+        {"postgresql_partition_by": "RANGE (started_at)"},
+    )
+    # The partition key has to be part of the primary key; scan_id alone still
+    # identifies a scan, so the ORM keeps using it as the identity.
+    __mapper_args__ = {"primary_key": ["scan_id"]}
+    scan_id = Column(PG_UUID(as_uuid=True), primary_key=True)
+    target = Column(Text, nullable=False)
+    status = Column(String, default=ScanStatusEnum.in_progress, nullable=False)
+    started_at = Column(DateTime, primary_key=True)
+    # When the scan got past the running-scan caps: started_at, or when a queued scan
+    # was dispatched. The caps count scans by it (see scheduler.SCAN_STUCK_AFTER).
+    admitted_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    # Stages whose output was replayed from the cross-scan stage cache.
+    cached_stages = Column(ARRAY(Text), nullable=False, server_default="{}")
+    # "full" or "incremental". Incremental scans only probe hosts that are new or changed
+    # since baseline_scan_id, and carry the baseline's other findings forward.
+    mode = Column(String, nullable=False, server_default="full")
+    # No foreign key: the baseline may live in an older partition that retention has
+    # already dropped, which only shortens the lineage.
+    baseline_scan_id = Column(PG_UUID(as_uuid=True), nullable=True)
+    # Hash of (target, templates, mode) for scans started with coalescing, so an
+    # identical request can attach to this scan while it is queued or running.
+    coalesce_key = Column(Text, nullable=True)
+    # Checkpoints: stages whose rows are all persisted, and naabu/nuclei shards (as
+    # "<stage>:<digest of the shard's input>") committed so far. Resuming a failed
+    # scan starts after them.
+    completed_stages = Column(ARRAY(Text), nullable=False, server_default="{}")
+    completed_shards = Column(ARRAY(Text), nullable=False, server_default="{}")
+    # Templates the scan was started with, so it can be resumed.
+    nuclei_templates = Column(ARRAY(Text), nullable=True)
+    # Per-tool settings requested with the scan ({"naabu": {...}, "nuclei": {...}}),
+    # replacing those of the adaptive tool profile.
+    tool_overrides = Column(JSONB, nullable=True)
+    # One entry per naabu/nuclei run: the profile it ran with and its throughput.
+    tool_runs = Column(JSONB, nullable=False, server_default="[]")
+    # Who the scan runs for, capped at SCAN_MAX_RUNNING_PER_OWNER running scans, and its
+    # priority class (see scheduler.py). Scans over a cap wait with status "queued".
+    owner = Column(Text, nullable=True)
+    priority = Column(String, nullable=False, server_default="normal")
+    # Counts rolled up as each stage completes (see db_sync.stage_summary), so summaries
+    # and trends never read the result tables.
+    summary = Column(JSONB, nullable=False, server_default="{}")
+    subdomains = relationship("Subdomain", back_populates="scan")
+    urls = relationship("URL", back_populates="scan")
+    ports = relationship("Port", back_populates="scan")
+    vulnerabilities = relationship("Vulnerability", back_populates="scan")
+
+class Subdomain(Base):
+    __tablename__ = "subdomains"
+    __table_args__ = (
+        Index("ix_subdomains_scan_id_id", "scan_id", "id"),
+        scan_partition_key(),
+        {"postgresql_partition_by": "RANGE (scan_started_at)"},
+    )
+    __mapper_args__ = {"primary_key": ["id"]}
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    scan_id = Column(PG_UUID(as_uuid=True))
+    # Copy of the scan's started_at, the partition key of every result table.
+    scan_started_at = Column(DateTime, primary_key=True)
+    subdomain = Column(Text, nullable=False)
+    scan = relationship("Scan", back_populates="subdomains")
+
+class URL(Base):
+    __tablename__ = "urls"
+    __table_args__ = (
+        Index("ix_urls_scan_id_id", "scan_id", "id"),
+        scan_partition_key(),
+        {"postgresql_partition_by": "RANGE (scan_started_at)"},
+    )
+    __mapper_args__ = {"primary_key": ["id"]}
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    scan_id = Column(PG_UUID(as_uuid=True))
+    scan_started_at = Column(DateTime, primary_key=True)
+    url = Column(Text, nullable=False)
+    scan = relationship("Scan", back_populates="urls")
+
+class Port(Base):
+    __tablename__ = "ports"
+    __table_args__ = (
+        Index("ix_ports_scan_id_id", "scan_id", "id"),
+        scan_partition_key(),
+        {"postgresql_partition_by": "RANGE (scan_started_at)"},
+    )
+    __mapper_args__ = {"primary_key": ["id"]}
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    scan_id = Column(PG_UUID(as_uuid=True))
+    scan_started_at = Column(DateTime, primary_key=True)
+    ip = Column(Text, nullable=False)
+    port = Column(Integer, nullable=False)
+    # Host naabu probed to find it (the ip when it was given one); null on older rows.
+    host = Column(Text, nullable=True)
+    # Checkpoint key of the naabu shard that found the port, so a retried shard can
+    # clear what its failed attempt already committed.
+    shard = Column(Text, nullable=True)
+    scan = relationship("Scan", back_populates="ports")
+
+class Vulnerability(Base):
+    __tablename__ = "vulnerabilities"
+    __table_args__ = (
+        Index("ix_vulnerabilities_scan_id_severity", "scan_id", "severity"),
+        # Containment (@>) search over the nuclei event, e.g. {"template-id": ...} or {"host": ...}.
+        Index("ix_vulnerabilities_details", "details", postgresql_using="gin", postgresql_ops={"details": "jsonb_path_ops"}),
+        scan_partition_key(),
+        {"postgresql_partition_by": "RANGE (scan_started_at)"},
+    )
+    __mapper_args__ = {"primary_key": ["id"]}
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    scan_id = Column(PG_UUID(as_uuid=True))
+    scan_started_at = Column(DateTime, primary_key=True)
+    template_id = Column(Text, nullable=False)
+    severity = Column(String, nullable=False)
+    matched_url = Column(Text, nullable=False)
+    description = Column(Text, nullable=False)
+    # The nuclei event minus EVIDENCE_FIELDS, which live in vulnerability_evidence.
+    details = Column(JSONB, nullable=True)
+    # Host of the nuclei target that found it (see host_of); null on older rows.
+    host = Column(Text, nullable=True)
+    # Checkpoint key of the nuclei shard that found it, as Port.shard.
+    shard = Column(Text, nullable=True)
+    scan = relationship("Scan", back_populates="vulnerabilities")
+
+# Raw request/response of a finding. Kept out of vulnerabilities.details so result
+# reads and the details index stay small; the columns are TOASTed (compressed and
+# stored out of line) and only loaded on demand.
+EVIDENCE_FIELDS = ("request", "response")
+
+class VulnerabilityEvidence(Base):
+    __tablename__ = "vulnerability_evidence"
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ["vulnerability_id", "scan_started_at"], ["vulnerabilities.id", "vulnerabilities.scan_started_at"],
+            ondelete="CASCADE",
+        ),
+        {"postgresql_partition_by": "RANGE (scan_started_at)"},
+    )
+    __mapper_args__ = {"primary_key": ["vulnerability_id"]}
+    vulnerability_id = Column(Integer, primary_key=True, autoincrement=False)
+    scan_started_at = Column(DateTime, primary_key=True)
+    request = Column(Text, nullable=True)
+    response = Column(Text, nullable=True)
+
+def split_evidence(vuln: dict):
+    """A vulnerability row without its evidence blobs, and the blobs (None if it had none)."""
+    details = vuln.get("details")
+    if not details or not any(field in details for field in EVIDENCE_FIELDS):
+        return vuln, None
+    details = dict(details)
+    evidence = {field: details.pop(field, None) for field in EVIDENCE_FIELDS}
+    return {**vuln, "details": details}, evidence
+
+# Hosts a naabu or nuclei run probed, written with its shard's checkpoint. A baseline's
+# finding on a host a newer scan probed again is not carried forward: that scan's
+# result for the host, found or not, replaces it.
+class ProbedHost(Base):
+    __tablename__ = "probed_hosts"
+    __table_args__ = (
+        scan_partition_key(),
+        {"postgresql_partition_by": "RANGE (scan_started_at)"},
+    )
+    scan_id = Column(PG_UUID(as_uuid=True), primary_key=True)
+    stage = Column(Text, primary_key=True)
+    host = Column(Text, primary_key=True)
+    scan_started_at = Column(DateTime, primary_key=True)
+
+# Leading host of a URL or host[:port] target, in Python (host_of) and in SQL alike.
+HOST_PATTERN = r"^(?:[A-Za-z][A-Za-z0-9+.-]*://)?([^/:?#]+)"
+
+def host_of(target: str) -> str:
+    match = re.match(HOST_PATTERN, target)
+    return match.group(1) if match else target
+
+# Result tables an incremental scan inherits from its baseline lineage: the stage that
+# writes them, the natural key identifying the same finding across scans (the newest
+# scan's row wins), and the host a row was found on. Vulnerabilities older than their
+# host column take it from matched_url; such ports have none and are always carried.
+CARRIED_STAGES = {Port: "naabu", Vulnerability: "nuclei"}
+CARRIED_KEYS = {
+    Port: (Port.ip, Port.port),
+    Vulnerability: (Vulnerability.template_id, Vulnerability.matched_url),
+}
+CARRIED_HOSTS = {
+    Port: Port.host,
+    Vulnerability: func.coalesce(Vulnerability.host, func.substring(Vulnerability.matched_url, HOST_PATTERN)),
+}
+
+# Incremental scans that may follow one another before a target is scanned in full
+# again. Bounds the lineage every result read and carry-forward walks, and stops
+# findings of hosts that have since disappeared from being carried forever.
+SCAN_MAX_INCREMENTS = int(os.getenv("SCAN_MAX_INCREMENTS", "10"))
+
+# (scan_id, started_at) of a scan followed by its chain of baselines, newest first,
+# at most SCAN_MAX_INCREMENTS baselines deep.
+LINEAGE_QUERY = text("""
+    WITH RECURSIVE lineage(scan_id, started_at, baseline_scan_id, depth) AS (
+        SELECT scan_id, started_at, baseline_scan_id, 0 FROM scans WHERE scan_id = :scan_id
+        UNION ALL
+        SELECT s.scan_id, s.started_at, s.baseline_scan_id, l.depth + 1
+        FROM scans s JOIN lineage l ON s.scan_id = l.baseline_scan_id
+        WHERE l.depth < :max_depth
+    )
+    SELECT scan_id, started_at FROM lineage ORDER BY depth
+""").bindparams(max_depth=SCAN_MAX_INCREMENTS)
+
+def carried_rows(model, lineage, *columns):
+    """
+    A scan's rows of a CARRIED_KEYS table with those of its lineage (LINEAGE_QUERY rows)
+    carried forward. A baseline row is left out when a newer scan in the lineage probed
+    its host again, or when its host is gone from the scan's subdomains. Rows without a
+    host are carried as long as no newer row has their key.
+    """
+    scan_ids, started = zip(*lineage)
+    ids = literal(list(scan_ids), ARRAY(PG_UUID(as_uuid=True)))
+    rank = func.array_position(ids, model.scan_id)
+    host = CARRIED_HOSTS[model]
+    probed_since = exists().where(
+        ProbedHost.scan_id.in_(scan_ids), ProbedHost.scan_started_at.in_(started),
+        ProbedHost.stage == CARRIED_STAGES[model], ProbedHost.host == host,
+        func.array_position(ids, ProbedHost.scan_id) < rank,
+    )
+    subdomains = select(Subdomain.subdomain).where(
+        Subdomain.scan_id == scan_ids[0], Subdomain.scan_started_at == started[0],
+    )
+    key = CARRIED_KEYS[model]
+    return (
+        select(*columns)
+        .where(
+            model.scan_id.in_(scan_ids), model.scan_started_at.in_(started),
+            or_(model.scan_id == scan_ids[0], host.is_(None), and_(~probed_since, host.in_(subdomains))),
+        )
+        .distinct(*key)
+        .order_by(*key, rank)
+    )
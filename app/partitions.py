@@ -0,0 +1,135 @@
+import os
+import re
+import gzip
+import logging
+from datetime import date, datetime
+from typing import List
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+import db_sync
+
+logger = logging.getLogger(__name__)
+
+# Range-partitioned tables and their partition key. Referencing tables come before the
+# tables they reference, the order in which old partitions have to be detached.
+PARTITIONED_TABLES = (
+    ("vulnerability_evidence", "scan_started_at"),
+    ("vulnerabilities", "scan_started_at"),
+    ("ports", "scan_started_at"),
+    ("urls", "scan_started_at"),
+    ("subdomains", "scan_started_at"),
+    ("probed_hosts", "scan_started_at"),
+    ("scans", "started_at"),
+)
+
+# Monthly partitions are created this many months ahead of the current one. Rows
+# outside every partition land in the table's _default partition.
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+
+# Scans (and all their results) are kept for this many full months before their
+# partition is dropped. 0 keeps everything.
+PARTITION_RETENTION_MONTHS = int(os.getenv("PARTITION_RETENTION_MONTHS", "0"))
+
+# When set, expired partitions are written here as gzipped CSV before being dropped.
+PARTITION_ARCHIVE_DIR = os.getenv("PARTITION_ARCHIVE_DIR", "")
+
+# Detaching needs a brief exclusive lock on the parent table. Give up rather than
+# queue behind long-running reads (and block every query queued behind us).
+PARTITION_LOCK_TIMEOUT = os.getenv("PARTITION_LOCK_TIMEOUT", "5s")
+
+_PARTITION_NAME = re.compile(r"^(?P<table>\w+)_(?:p(?P<year>\d{4})_(?P<month>\d{2})|default)$")
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y_%m}"
+
+def is_partition(name: str) -> bool:
+    """Whether a table name is one of the partitions created for PARTITIONED_TABLES."""
+    match = _PARTITION_NAME.match(name)
+    return bool(match) and match["table"] in dict(PARTITIONED_TABLES)
+
+def _current_month() -> date:
+    return datetime.utcnow().date().replace(day=1)
+
+def _attached_partitions(conn, table: str) -> List[str]:
+    return list(conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = CAST(:table AS regclass) ORDER BY c.relname"
+    ), {"table": table}).scalars())
+
+def ensure_partitions(months_ahead: int = PARTITION_MONTHS_AHEAD) -> List[str]:
+    """
+    Create any missing monthly partition from the current month to months_ahead
+    months out, parents first. Returns the partitions created.
+    """
+    created = []
+    months = [add_months(_current_month(), i) for i in range(months_ahead + 1)]
+    for table, _ in reversed(PARTITIONED_TABLES):
+        for month in months:
+            name = partition_name(table, month)
+            try:
+                with db_sync.transaction() as conn:
+                    if conn.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar():
+                        continue
+                    conn.execute(text(
+                        f"CREATE TABLE {name} PARTITION OF {table} "
+                        f"FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}')"
+                    ))
+            except DBAPIError:
+                # Typically rows for this month already sit in the default partition.
+                logger.exception(f"Could not create partition {name}")
+                continue
+            created.append(name)
+    if created:
+        logger.info(f"Created partitions: {', '.join(created)}")
+    return created
+
+def _archive(conn, name: str, archive_dir: str) -> str:
+    """COPY a partition to <archive_dir>/<name>.csv.gz, replacing any earlier attempt."""
+    path = os.path.join(archive_dir, f"{name}.csv.gz")
+    partial = f"{path}.partial"
+    with gzip.open(partial, "wb") as out:
+        conn.connection.cursor().copy_expert(f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)", out)
+    os.replace(partial, path)
+    return path
+
+def drop_expired_partitions(
+    retention_months: int = PARTITION_RETENTION_MONTHS,
+    archive_dir: str = PARTITION_ARCHIVE_DIR,
+) -> List[str]:
+    """
+    Detach and drop every monthly partition that ends before the retention window,
+    archiving it first when archive_dir is set. Each partition is detached, archived
+    and dropped in one transaction, so a failure leaves it attached for the next run.
+    Returns the partitions dropped.
+    """
+    if retention_months <= 0:
+        return []
+    cutoff = add_months(_current_month(), -retention_months)
+    if archive_dir:
+        os.makedirs(archive_dir, exist_ok=True)
+    dropped = []
+    for table, _ in PARTITIONED_TABLES:
+        with db_sync.transaction() as conn:
+            names = _attached_partitions(conn, table)
+        for name in names:
+            match = _PARTITION_NAME.match(name)
+            if not match["year"] or add_months(date(int(match["year"]), int(match["month"]), 1), 1) > cutoff:
+                continue
+            try:
+                with db_sync.transaction() as conn:
+                    conn.execute(text(f"SET LOCAL lock_timeout = '{PARTITION_LOCK_TIMEOUT}'"))
+                    conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+                    if archive_dir:
+                        logger.info(f"Archived partition {name} to {_archive(conn, name, archive_dir)}")
+                    conn.execute(text(f"DROP TABLE {name}"))
+            except DBAPIError:
+                logger.exception(f"Could not drop partition {name}")
+                continue
+            dropped.append(name)
+    if dropped:
+        logger.info(f"Dropped expired partitions: {', '.join(dropped)}")
+    return dropped
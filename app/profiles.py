@@ -0,0 +1,110 @@
+import os
+import logging
+from functools import lru_cache
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# CPUs and memory (MB) the worker may use. Detected from the container's cgroup
+# limits, falling back to the host's; set these when detection gets it wrong.
+PROFILE_CPUS = float(os.getenv("PROFILE_CPUS", "0"))
+PROFILE_MEMORY_MB = int(os.getenv("PROFILE_MEMORY_MB", "0"))
+
+# Probes (naabu) or requests (nuclei) a tool run may keep in flight per CPU of its
+# share, and the memory each is assumed to need. The lower of the two bounds wins.
+PROFILE_PARALLELISM_PER_CPU = int(os.getenv("PROFILE_PARALLELISM_PER_CPU", "50"))
+PROFILE_MEMORY_PER_UNIT_MB = float(os.getenv("PROFILE_MEMORY_PER_UNIT_MB", "8"))
+
+# Send rates per CPU of a run's share, capped per target host so a small input isn't
+# hammered. naabu's rate is in packets/s, nuclei's in requests/s.
+NAABU_RATE_PER_CPU = int(os.getenv("NAABU_RATE_PER_CPU", "1000"))
+NAABU_RATE_PER_HOST = int(os.getenv("NAABU_RATE_PER_HOST", "500"))
+NUCLEI_RATE_PER_CPU = int(os.getenv("NUCLEI_RATE_PER_CPU", "150"))
+NUCLEI_RATE_PER_HOST = int(os.getenv("NUCLEI_RATE_PER_HOST", "25"))
+
+# nuclei splits its parallelism into templates x hosts per template; it always runs
+# at least this many templates at once.
+NUCLEI_MIN_TEMPLATE_CONCURRENCY = 5
+
+# Flag for each profile setting, per tool.
+TOOL_FLAGS = {
+    "naabu": {"concurrency": "-c", "rate": "-rate"},
+    "nuclei": {"concurrency": "-c", "bulk_size": "-bulk-size", "rate": "-rate-limit"},
+}
+
+# Worker processes sharing those resources, each running one tool at a time.
+# Set from --concurrency when the worker starts, before its processes fork.
+_worker_slots = 1
+
+def set_worker_slots(slots: int):
+    global _worker_slots
+    _worker_slots = max(1, slots)
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def _cgroup_cpus() -> Optional[float]:
+    cpu_max = _read("/sys/fs/cgroup/cpu.max")  # cgroup v2: "<quota> <period>" or "max <period>"
+    if cpu_max:
+        quota, period = cpu_max.split()
+        return None if quota == "max" else int(quota) / int(period)
+    quota, period = _read("/sys/fs/cgroup/cpu/cpu.cfs_quota_us"), _read("/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+    if quota and period and int(quota) > 0:
+        return int(quota) / int(period)
+    return None
+
+def _cgroup_memory_mb() -> Optional[int]:
+    limit = _read("/sys/fs/cgroup/memory.max") or _read("/sys/fs/cgroup/memory/memory.limit_in_bytes")
+    if not limit or limit == "max":
+        return None
+    # cgroup v1 reports no limit as a number close to 2^63.
+    return int(limit) // 2**20 if int(limit) < 2**62 else None
+
+@lru_cache(maxsize=1)
+def worker_resources() -> dict:
+    """CPUs and memory (MB) of the container, or PROFILE_CPUS/PROFILE_MEMORY_MB."""
+    host_cpus = os.cpu_count() or 1
+    host_memory_mb = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 2**20
+    cpus = PROFILE_CPUS or min(_cgroup_cpus() or host_cpus, host_cpus)
+    memory_mb = PROFILE_MEMORY_MB or min(_cgroup_memory_mb() or host_memory_mb, host_memory_mb)
+    logger.info(f"Tool profiles sized for {cpus:.2f} CPUs and {memory_mb} MB shared by {_worker_slots} processes")
+    return {"cpus": cpus, "memory_mb": memory_mb}
+
+def choose_profile(tool: str, hosts: int, overrides: Optional[dict] = None) -> dict:
+    """
+    Settings for one naabu or nuclei run over `hosts` targets, sized to this process's
+    share of the worker's CPU and memory. Values in overrides (a scan's per-tool
+    overrides) replace the computed ones. The profile also records its inputs.
+    """
+    resources = worker_resources()
+    cpus = max(resources["cpus"] / _worker_slots, 0.1)
+    memory_mb = resources["memory_mb"] / _worker_slots
+    parallelism = max(2, min(int(PROFILE_PARALLELISM_PER_CPU * cpus), int(memory_mb / PROFILE_MEMORY_PER_UNIT_MB)))
+    hosts = max(hosts, 1)
+    if tool == "naabu":
+        profile = {
+            "concurrency": parallelism,
+            "rate": max(10, min(int(NAABU_RATE_PER_CPU * cpus), NAABU_RATE_PER_HOST * hosts)),
+        }
+    else:
+        # Few hosts leave the parallelism to templates; many spread it across hosts.
+        bulk_size = min(hosts, max(1, parallelism // NUCLEI_MIN_TEMPLATE_CONCURRENCY))
+        profile = {
+            "concurrency": max(1, parallelism // bulk_size),
+            "bulk_size": bulk_size,
+            "rate": max(10, min(int(NUCLEI_RATE_PER_CPU * cpus), NUCLEI_RATE_PER_HOST * hosts)),
+        }
+    overridden = {name: value for name, value in (overrides or {}).items() if value is not None and name in profile}
+    return {
+        **profile, **overridden,
+        "overridden": sorted(overridden),
+        "hosts": hosts, "cpus": round(cpus, 2), "memory_mb": int(memory_mb),
+    }
+
+def tool_args(tool: str, profile: dict) -> list:
+    """Command-line flags applying a profile."""
+    return [arg for name, flag in TOOL_FLAGS[tool].items() for arg in (flag, str(profile[name]))]
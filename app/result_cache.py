@@ -0,0 +1,145 @@
+import os
+import json
+import zlib
+import logging
+from uuid import UUID
+from datetime import datetime
+from typing import Optional
+import redis
+import redis.asyncio as aioredis
+
+logger = logging.getLogger(__name__)
+
+RESULT_CACHE_URL = os.getenv("RESULT_CACHE_URL", os.getenv("CELERY_BROKER_URL", "redis://redis:6379/0"))
+
+# Seconds a completed scan's results (and a finished scan's status) stay cached after
+# their last read. Every hit pushes expiry back, so rarely read scans age out first.
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", str(3600)))
+
+# Results larger than this once compressed are served from Postgres only.
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+
+# Seconds a running scan's status may be served from cache.
+STATUS_CACHE_TTL = int(os.getenv("STATUS_CACHE_TTL", "2"))
+
+FINISHED_STATUSES = ("completed", "failed", "cancelled")
+
+def status_key(scan_id) -> str:
+    return f"pd:scan-cache:status:{scan_id}"
+
+def results_key(scan_id) -> str:
+    return f"pd:scan-cache:results:{scan_id}"
+
+# Bumped by every invalidation. A reader takes the version before loading a scan from
+# Postgres and only caches what it loaded if the version is still the same, so a row
+# read just before a write commits can't be cached after that write's invalidation.
+def version_key(scan_id) -> str:
+    return f"pd:scan-cache:version:{scan_id}"
+
+def _encode(value) -> bytes:
+    return zlib.compress(json.dumps(value, default=str).encode())
+
+def _decode(raw: bytes):
+    return json.loads(zlib.decompress(raw))
+
+def _decode_status(raw: bytes) -> dict:
+    scan = _decode(raw)
+    scan["scan_id"] = UUID(scan["scan_id"])
+    scan["started_at"] = datetime.fromisoformat(scan["started_at"])
+    if scan["finished_at"]:
+        scan["finished_at"] = datetime.fromisoformat(scan["finished_at"])
+    if scan["baseline_scan_id"]:
+        scan["baseline_scan_id"] = UUID(scan["baseline_scan_id"])
+    return scan
+
+# --- API side: read-through ---
+#
+# Redis errors are logged and treated as a miss, so the cache can never fail a request.
+
+_async_client = None
+
+def get_async_client() -> aioredis.Redis:
+    global _async_client
+    if _async_client is None:
+        _async_client = aioredis.from_url(RESULT_CACHE_URL)
+    return _async_client
+
+async def _get(key: str, ttl: Optional[int] = None):
+    try:
+        client = get_async_client()
+        return await (client.getex(key, ex=ttl) if ttl else client.get(key))
+    except redis.RedisError:
+        logger.warning(f"Result cache read failed for {key}", exc_info=True)
+        return None
+
+async def get_version(scan_id) -> Optional[bytes]:
+    """The scan's cache version, taken before loading what set_status/set_results store."""
+    return await _get(version_key(scan_id))
+
+async def _set(scan_id, key: str, value: bytes, ttl: int, version: Optional[bytes]):
+    """Cache value unless the scan was invalidated since version was taken."""
+    try:
+        async with get_async_client().pipeline() as pipe:
+            await pipe.watch(version_key(scan_id))
+            if await pipe.get(version_key(scan_id)) != version:
+                return
+            pipe.multi()
+            pipe.set(key, value, ex=ttl)
+            await pipe.execute()
+    except redis.WatchError:
+        pass
+    except redis.RedisError:
+        logger.warning(f"Result cache write failed for {key}", exc_info=True)
+
+async def get_status(scan_id) -> Optional[dict]:
+    raw = await _get(status_key(scan_id))
+    return _decode_status(raw) if raw else None
+
+async def set_status(scan_id, scan: dict, version: Optional[bytes]):
+    ttl = RESULT_CACHE_TTL if scan["status"] in FINISHED_STATUSES else STATUS_CACHE_TTL
+    await _set(scan_id, status_key(scan_id), _encode(scan), ttl, version)
+
+async def get_results(scan_id) -> Optional[dict]:
+    raw = await _get(results_key(scan_id), RESULT_CACHE_TTL)
+    return _decode(raw) if raw else None
+
+async def set_results(scan_id, results: dict, version: Optional[bytes]):
+    raw = _encode(results)
+    if len(raw) <= RESULT_CACHE_MAX_BYTES:
+        await _set(scan_id, results_key(scan_id), raw, RESULT_CACHE_TTL, version)
+
+def _invalidate(pipe, scan_id, keys):
+    pipe.delete(*keys)
+    pipe.incr(version_key(scan_id))
+    pipe.expire(version_key(scan_id), RESULT_CACHE_TTL)
+
+async def invalidate_async(*scan_ids):
+    if not scan_ids:
+        return
+    try:
+        async with get_async_client().pipeline(transaction=False) as pipe:
+            for scan_id in scan_ids:
+                _invalidate(pipe, scan_id, [status_key(scan_id), results_key(scan_id)])
+            await pipe.execute()
+    except redis.RedisError:
+        logger.warning("Result cache invalidation failed", exc_info=True)
+
+# --- Worker side: invalidation ---
+
+_client = None
+
+def get_client() -> redis.Redis:
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(RESULT_CACHE_URL)
+    return _client
+
+def invalidate(scan_id, status: bool = True, results: bool = True):
+    """Drop a scan's cached status and/or results after the worker changed them."""
+    keys = ([status_key(scan_id)] if status else []) + ([results_key(scan_id)] if results else [])
+    try:
+        with get_client().pipeline(transaction=False) as pipe:
+            _invalidate(pipe, scan_id, keys)
+            pipe.execute()
+    except redis.RedisError:
+        logger.warning(f"Result cache invalidation failed for scan {scan_id}", exc_info=True)
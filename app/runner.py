@@ -0,0 +1,179 @@
+import os
+import json
+import time
+import signal
+import logging
+import resource
+import subprocess
+import tempfile
+import threading
+from itertools import islice
+from metrics import SUBPROCESS_WALL, SUBPROCESS_CPU, LINES_PARSED, TOOL_ABORTS, TOOL_THROUGHPUT
+
+logger = logging.getLogger(__name__)
+
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "500"))
+STDERR_TAIL_BYTES = 4096
+
+# How often a running tool is checked against its cancellation flag and deadline,
+# and how long it gets to exit after SIGTERM before its process group is killed.
+TOOL_WATCH_INTERVAL = float(os.getenv("TOOL_WATCH_INTERVAL", "1"))
+TOOL_KILL_GRACE = float(os.getenv("TOOL_KILL_GRACE", "5"))
+
+class ToolAborted(Exception):
+    """A tool was stopped before it finished; see the subclasses."""
+
+class ToolCancelled(ToolAborted):
+    pass
+
+class ToolBudgetExceeded(ToolAborted):
+    pass
+
+def _feed_stdin(proc, lines):
+    try:
+        for line in lines:
+            proc.stdin.write(f"{line}\n")
+    except BrokenPipeError:
+        pass
+    finally:
+        try:
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+
+def _stderr_tail(stderr) -> str:
+    stderr.seek(0, os.SEEK_END)
+    stderr.seek(max(0, stderr.tell() - STDERR_TAIL_BYTES))
+    return stderr.read().decode(errors="replace")
+
+def _children_cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+def _signal_group(proc, sig):
+    try:
+        os.killpg(proc.pid, sig)
+    except ProcessLookupError:
+        pass
+
+def _stop(proc):
+    """SIGTERM the tool's process group, SIGKILL it if it hasn't exited after TOOL_KILL_GRACE."""
+    _signal_group(proc, signal.SIGTERM)
+    try:
+        proc.wait(TOOL_KILL_GRACE)
+    except subprocess.TimeoutExpired:
+        _signal_group(proc, signal.SIGKILL)
+
+def _watch(proc, stopped, abort, timeout, cancelled):
+    """Stop the tool once it is cancelled or runs past timeout; record why in abort."""
+    deadline = time.monotonic() + timeout if timeout else None
+    while not stopped.wait(TOOL_WATCH_INTERVAL):
+        if cancelled and cancelled():
+            abort.append("cancelled")
+        elif deadline and time.monotonic() > deadline:
+            abort.append("timeout")
+        else:
+            continue
+        _stop(proc)
+        return
+
+def stream_jsonl(
+    cmd, input_lines=None, timeout: float = 0, max_output_bytes: int = 0, cancelled=None, input_hosts: int = 0,
+):
+    """
+    Run a tool and yield every JSON object it prints, as soon as the line is written.
+    stdout is never buffered as a whole, stderr is spooled to a temp file and only its
+    tail is kept for logging. Raises CalledProcessError if the tool exits non-zero.
+
+    The tool runs in its own process group, so stopping it also stops whatever it
+    spawned. It is stopped, raising ToolCancelled, once cancelled() returns true, and
+    raising ToolBudgetExceeded once it runs longer than timeout seconds or prints more
+    than max_output_bytes (0 for no limit). A run that finishes over input_hosts hosts
+    records its throughput.
+    """
+    tool = os.path.basename(cmd[0])
+    with tempfile.TemporaryFile() as stderr:
+        started = time.perf_counter()
+        # Children's rusage only covers reaped processes, so the delta around wait()
+        # is this tool's CPU time (a prefork worker runs one task at a time).
+        cpu_before = _children_cpu_seconds()
+        proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE if input_lines is not None else subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=stderr,
+            text=True,
+            bufsize=1,
+            start_new_session=True,
+        )
+        feeder = None
+        if input_lines is not None:
+            feeder = threading.Thread(target=_feed_stdin, args=(proc, input_lines), daemon=True)
+            feeder.start()
+        stopped, abort = threading.Event(), []
+        watcher = None
+        if timeout or cancelled:
+            watcher = threading.Thread(target=_watch, args=(proc, stopped, abort, timeout, cancelled), daemon=True)
+            watcher.start()
+        lines = output_bytes = 0
+        try:
+            for line in proc.stdout:
+                output_bytes += len(line)
+                if max_output_bytes and output_bytes > max_output_bytes:
+                    abort.append("output")
+                    _stop(proc)
+                    break
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as ex:
+                    logger.warning(f"Could not parse {cmd[0]} line: {line} ({ex})")
+                    continue
+                lines += 1
+                yield record
+        except BaseException:
+            # Consumer failed or stopped early: don't leave the tool running.
+            _signal_group(proc, signal.SIGKILL)
+            raise
+        finally:
+            proc.stdout.close()
+            returncode = proc.wait()
+            stopped.set()
+            if watcher:
+                watcher.join()
+            if feeder:
+                feeder.join()
+            SUBPROCESS_WALL.labels(tool).observe(time.perf_counter() - started)
+            SUBPROCESS_CPU.labels(tool).inc(max(0.0, _children_cpu_seconds() - cpu_before))
+            LINES_PARSED.labels(tool).inc(lines)
+        tail = _stderr_tail(stderr)
+        if abort:
+            TOOL_ABORTS.labels(tool, abort[0]).inc()
+            if abort[0] == "cancelled":
+                raise ToolCancelled(f"{tool} stopped, its scan was cancelled")
+            limit = f"{timeout}s" if abort[0] == "timeout" else f"{max_output_bytes} bytes of output"
+            raise ToolBudgetExceeded(f"{tool} stopped after exceeding its budget of {limit}")
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, cmd, stderr=tail)
+        if input_hosts:
+            TOOL_THROUGHPUT.labels(tool).observe(input_hosts / max(time.perf_counter() - started, 1e-3))
+        if tail.strip():
+            logger.info(f"{cmd[0]} stderr: {tail}")
+
+def batched(iterable, size: int = INGEST_BATCH_SIZE):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+def ingest(records, writer, scan_id, batch_size: int = INGEST_BATCH_SIZE) -> int:
+    """
+    Persist records through a db_sync writer in bounded batches, committing each one so
+    partial results are visible while the tool is still running. Returns the row count.
+    """
+    count = 0
+    for batch in batched(records, batch_size):
+        writer(scan_id, batch)
+        count += len(batch)
+    return count
@@ -0,0 +1,212 @@
+import os
+import json
+import time
+import logging
+from functools import wraps
+from typing import Optional
+import redis
+import redis.asyncio as aioredis
+
+logger = logging.getLogger(__name__)
+
+SCAN_EVENTS_URL = os.getenv("SCAN_EVENTS_URL", os.getenv("CELERY_BROKER_URL", "redis://redis:6379/0"))
+
+# How long a scan's progress snapshot is kept after its last update, for late subscribers.
+SCAN_EVENTS_TTL = int(os.getenv("SCAN_EVENTS_TTL", str(24 * 3600)))
+
+# Seconds without events before a subscriber is sent a keep-alive.
+SCAN_EVENTS_KEEPALIVE = float(os.getenv("SCAN_EVENTS_KEEPALIVE", "15"))
+
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
+def channel(scan_id) -> str:
+    return f"pd:scan-events:{scan_id}"
+
+def progress_key(scan_id) -> str:
+    return f"pd:scan-progress:{scan_id}"
+
+def cancel_key(scan_id) -> str:
+    return f"pd:scan-cancel:{scan_id}"
+
+# --- Worker side: publish ---
+#
+# Every event updates the scan's progress hash (the snapshot new subscribers start
+# from) and is published on the scan's channel. Publishing is best effort: Redis
+# errors are logged and never fail a scan.
+
+_client = None
+
+def get_client() -> redis.Redis:
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(SCAN_EVENTS_URL)
+    return _client
+
+def _publish(scan_id, event: dict, fields: Optional[dict] = None):
+    key = progress_key(scan_id)
+    pipe = get_client().pipeline()
+    if fields:
+        pipe.hset(key, mapping=fields)
+    pipe.expire(key, SCAN_EVENTS_TTL)
+    pipe.publish(channel(scan_id), json.dumps({"scan_id": str(scan_id), "ts": time.time(), **event}))
+    pipe.execute()
+
+def _best_effort(fn):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        try:
+            fn(*args, **kwargs)
+        except redis.RedisError:
+            logger.warning(f"Could not publish scan event {fn.__name__}", exc_info=True)
+    return wrapper
+
+@_best_effort
+def publish_status(scan_id, status: str):
+    _publish(scan_id, {"type": "status", "status": status}, {"status": status})
+
+@_best_effort
+def publish_stage_started(scan_id, stage: str, shards: int = 1):
+    """A stage was started as `shards` sub-tasks; 0 means it had no input and is already done."""
+    state = "running" if shards else "completed"
+    _publish(
+        scan_id,
+        {"type": "stage", "stage": stage, "state": state, "shards": shards, "shards_done": 0},
+        {f"stage:{stage}:state": state, f"stage:{stage}:shards": shards, f"stage:{stage}:shards_done": 0},
+    )
+
+@_best_effort
+def publish_shard_completed(scan_id, stage: str):
+    key = progress_key(scan_id)
+    done, shards = get_client().pipeline().hincrby(key, f"stage:{stage}:shards_done", 1) \
+        .hget(key, f"stage:{stage}:shards").execute()
+    shards = int(shards or 1)
+    state = "completed" if done >= shards else "running"
+    _publish(
+        scan_id,
+        {"type": "stage", "stage": stage, "state": state, "shards": shards, "shards_done": done},
+        {f"stage:{stage}:state": state},
+    )
+
+@_best_effort
+def publish_stage_failed(scan_id, stage: str):
+    _publish(scan_id, {"type": "stage", "stage": stage, "state": "failed"}, {f"stage:{stage}:state": "failed"})
+
+@_best_effort
+def publish_stage_retrying(scan_id, stage: str, attempt: int, countdown: float):
+    _publish(
+        scan_id,
+        {"type": "stage", "stage": stage, "state": "retrying", "retry": attempt, "countdown": countdown},
+        {f"stage:{stage}:state": "retrying", f"stage:{stage}:retries": attempt},
+    )
+
+@_best_effort
+def publish_stage_cached(scan_id, stage: str):
+    _publish(scan_id, {"type": "stage", "stage": stage, "cached": True}, {f"stage:{stage}:cached": 1})
+
+@_best_effort
+def publish_rows(scan_id, section: str, count: int):
+    total = get_client().hincrby(progress_key(scan_id), f"rows:{section}", count)
+    _publish(scan_id, {"type": "rows", "section": section, "added": count, "total": total})
+
+@_best_effort
+def publish_rows_cleared(scan_id, section: str, count: Optional[int] = None):
+    """
+    `count` rows of a section (all of them when None) were deleted so a stage or shard
+    can run again. Published as a negative `added`, so totals don't count them twice.
+    """
+    if count is None:
+        count = int(get_client().hget(progress_key(scan_id), f"rows:{section}") or 0)
+    if count:
+        publish_rows(scan_id, section, -count)
+
+def cancel_requested(scan_id) -> bool:
+    """Whether the scan was cancelled, polled while its tools run. Redis errors read as no."""
+    try:
+        return bool(get_client().exists(cancel_key(scan_id)))
+    except redis.RedisError:
+        logger.warning(f"Could not check cancellation of scan {scan_id}", exc_info=True)
+        return False
+
+# --- API side: cancel and subscribe ---
+
+_async_client = None
+
+def get_async_client() -> aioredis.Redis:
+    global _async_client
+    if _async_client is None:
+        _async_client = aioredis.from_url(SCAN_EVENTS_URL)
+    return _async_client
+
+def _parse_snapshot(fields: dict) -> dict:
+    snapshot = {"status": "in_progress", "stages": {}, "rows": {}}
+    for raw_name, raw_value in fields.items():
+        name, value = raw_name.decode(), raw_value.decode()
+        if name == "status":
+            snapshot["status"] = value
+        elif name.startswith("rows:"):
+            snapshot["rows"][name[len("rows:"):]] = int(value)
+        elif name.startswith("stage:"):
+            _, stage, attr = name.split(":", 2)
+            stage_info = snapshot["stages"].setdefault(stage, {})
+            if attr == "state":
+                stage_info[attr] = value
+            elif attr == "cached":
+                stage_info[attr] = True
+            else:
+                stage_info[attr] = int(value)
+    return snapshot
+
+async def publish_cancelled(scan_id):
+    """
+    Flag a scan as cancelled so workers stop its running tools, and end its event
+    streams. Best effort like the worker side: without Redis, running tools finish
+    and the scan's remaining tasks are dropped as they start.
+    """
+    key = progress_key(scan_id)
+    pipe = get_async_client().pipeline()
+    pipe.set(cancel_key(scan_id), 1, ex=SCAN_EVENTS_TTL)
+    pipe.hset(key, mapping={"status": "cancelled"})
+    pipe.expire(key, SCAN_EVENTS_TTL)
+    pipe.publish(channel(scan_id), json.dumps({"scan_id": str(scan_id), "ts": time.time(), "type": "status", "status": "cancelled"}))
+    try:
+        await pipe.execute()
+    except redis.RedisError:
+        logger.warning(f"Could not publish cancellation of scan {scan_id}", exc_info=True)
+
+async def subscribe(scan_id):
+    """
+    Subscribe to a scan's events, then read its progress snapshot. Subscribing first
+    means no event published in between is missed. The snapshot is None when Redis
+    has no progress for the scan (unknown, or finished longer than SCAN_EVENTS_TTL ago).
+    """
+    client = get_async_client()
+    pubsub = client.pubsub()
+    await pubsub.subscribe(channel(scan_id))
+    try:
+        fields = await client.hgetall(progress_key(scan_id))
+    except BaseException:
+        await pubsub.aclose()
+        raise
+    return pubsub, (_parse_snapshot(fields) if fields else None)
+
+async def iter_events(pubsub, snapshot: dict):
+    """
+    Yield the snapshot, then every published event until the scan reaches a terminal
+    status. None is yielded after SCAN_EVENTS_KEEPALIVE seconds without events.
+    Closes the subscription when done.
+    """
+    try:
+        yield {"type": "snapshot", **snapshot}
+        if snapshot["status"] in TERMINAL_STATUSES:
+            return
+        while True:
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=SCAN_EVENTS_KEEPALIVE)
+            if message is None:
+                yield None
+                continue
+            event = json.loads(message["data"])
+            yield event
+            if event["type"] == "status" and event["status"] in TERMINAL_STATUSES:
+                return
+    finally:
+        await pubsub.aclose()
@@ -0,0 +1,54 @@
+import os
+from collections import Counter
+
+# Scan priority classes and the broker priority of their tasks. With the Redis broker
+# a lower number is served first; these are kombu's priority steps for Redis.
+# "demoted" isn't requested, scans are moved there by their cost estimate.
+SCAN_PRIORITIES = {"interactive": 0, "normal": 3, "batch": 6, "demoted": 9}
+
+# Scans whose subfinder found more hosts than this are demoted: their naabu and nuclei
+# shards queue behind every other scan's, so a huge target only uses idle workers.
+# 0 disables demotion.
+SCAN_DEMOTE_HOSTS = int(os.getenv("SCAN_DEMOTE_HOSTS", "5000"))
+
+# Scans of one owner, and of one target, that may run at once. Scans over a cap are
+# queued and started as running ones finish. Scans without an owner are only capped
+# per target. 0 disables a cap.
+SCAN_MAX_RUNNING_PER_OWNER = int(os.getenv("SCAN_MAX_RUNNING_PER_OWNER", "20"))
+SCAN_MAX_RUNNING_PER_TARGET = int(os.getenv("SCAN_MAX_RUNNING_PER_TARGET", "2"))
+
+# Scans admitted (started running) longer ago than this are assumed stuck and don't
+# count against the caps. It has to outlast a healthy scan: every stage's timeout
+# (STAGE_TIMEOUT_*, nuclei alone is 4h per shard) times STAGE_MAX_RETRIES + 1.
+SCAN_STUCK_AFTER = int(os.getenv("SCAN_STUCK_AFTER", str(48 * 3600)))
+
+# Queued scans looked at per dispatch, highest priority and oldest first, and how
+# often dispatch runs besides whenever a scan finishes.
+SCAN_DISPATCH_BATCH = int(os.getenv("SCAN_DISPATCH_BATCH", "500"))
+SCAN_DISPATCH_INTERVAL = int(os.getenv("SCAN_DISPATCH_INTERVAL", "60"))
+
+# Admission (API) and dispatch (worker) serialize on this transaction advisory lock,
+# so two of them never both see room under a cap.
+ADMISSION_LOCK_CLASS = 0x5CA8
+
+def broker_priority(priority: str) -> int:
+    return SCAN_PRIORITIES[priority]
+
+def admit(scans, running_by_owner: Counter, running_by_target: Counter) -> list:
+    """
+    The scans (dicts with owner and target), taken in order, that fit under the caps
+    given how many scans run per owner and per target. The counters are updated with
+    the admitted scans.
+    """
+    admitted = []
+    for scan in scans:
+        owner, target = scan.get("owner"), scan["target"]
+        if owner and SCAN_MAX_RUNNING_PER_OWNER and running_by_owner[owner] >= SCAN_MAX_RUNNING_PER_OWNER:
+            continue
+        if SCAN_MAX_RUNNING_PER_TARGET and running_by_target[target] >= SCAN_MAX_RUNNING_PER_TARGET:
+            continue
+        if owner:
+            running_by_owner[owner] += 1
+        running_by_target[target] += 1
+        admitted.append(scan)
+    return admitted
@@ -0,0 +1,119 @@
+import os
+import json
+import hashlib
+import logging
+from uuid import uuid4
+from urllib.parse import urlparse, urlunparse
+import redis
+
+logger = logging.getLogger(__name__)
+
+STAGE_CACHE_URL = os.getenv("STAGE_CACHE_URL", os.getenv("CELERY_BROKER_URL", "redis://redis:6379/0"))
+
+# Seconds a stage's output can be reused by later scans of the same target. 0 disables
+# caching for the stage; nuclei always runs by default since findings must be fresh.
+STAGE_CACHE_TTLS = {
+    "subfinder": int(os.getenv("STAGE_CACHE_TTL_SUBFINDER", str(6 * 3600))),
+    "katana": int(os.getenv("STAGE_CACHE_TTL_KATANA", str(3600))),
+    "naabu": int(os.getenv("STAGE_CACHE_TTL_NAABU", str(3600))),
+    "nuclei": int(os.getenv("STAGE_CACHE_TTL_NUCLEI", "0")),
+}
+
+# Records per RPUSH/LRANGE round trip.
+STAGE_CACHE_CHUNK_SIZE = 1000
+
+# First element of every cached list, so an empty stage output is still a cache hit.
+_HEADER = json.dumps({"v": 1})
+
+_client = None
+
+def get_client() -> redis.Redis:
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(STAGE_CACHE_URL)
+    return _client
+
+def normalize_target(target: str) -> str:
+    """The target URL with scheme and host lowercased (https if it had no scheme) and no trailing slash."""
+    parsed = urlparse(target if "://" in target else f"https://{target}")
+    return urlunparse((parsed.scheme.lower(), parsed.netloc.lower(), parsed.path.rstrip("/"), parsed.params, parsed.query, ""))
+
+def cache_key(stage: str, target: str, cmd, inputs=()) -> str:
+    """
+    Key for a stage run: normalized target, the tool command and (order-independent)
+    input list. Flags that only affect how the tool runs, not what it finds, are left
+    out of cmd by the caller.
+    """
+    payload = json.dumps([normalize_target(target), list(cmd), sorted(inputs)])
+    return f"pd:stage-cache:{stage}:{hashlib.sha256(payload.encode()).hexdigest()}"
+
+class ReplayInterrupted(Exception):
+    """Redis failed partway through replaying a cached stage output."""
+
+def _iter_cached(client, key):
+    start = 1
+    while True:
+        try:
+            chunk = client.lrange(key, start, start + STAGE_CACHE_CHUNK_SIZE - 1)
+        except redis.RedisError as e:
+            raise ReplayInterrupted(key) from e
+        for raw in chunk:
+            yield json.loads(raw)
+        if len(chunk) < STAGE_CACHE_CHUNK_SIZE:
+            return
+        start += STAGE_CACHE_CHUNK_SIZE
+
+def lookup(stage: str, key: str):
+    """
+    Iterator over a stage's cached records, or None on a miss. Redis errors count as
+    a miss so the cache can never fail a scan; one that breaks off the replay raises
+    ReplayInterrupted, after some records may already have been consumed.
+    """
+    if STAGE_CACHE_TTLS.get(stage, 0) <= 0:
+        return None
+    client = get_client()
+    try:
+        if client.lindex(key, 0) is None:
+            return None
+    except redis.RedisError:
+        logger.warning(f"Stage cache lookup failed for {stage}", exc_info=True)
+        return None
+    return _iter_cached(client, key)
+
+def store(stage: str, key: str, records):
+    """
+    Pass records through while appending them to a temporary list, which is renamed onto
+    the cache key only once the stage output is complete. Memory stays bounded by
+    STAGE_CACHE_CHUNK_SIZE and a failed run never leaves a partial entry behind.
+    """
+    ttl = STAGE_CACHE_TTLS.get(stage, 0)
+    if ttl <= 0:
+        yield from records
+        return
+    client = get_client()
+    tmp_key = f"{key}:tmp:{uuid4().hex}"
+    caching = True
+    buffer = [_HEADER]
+
+    def flush():
+        nonlocal caching, buffer
+        if caching and buffer:
+            try:
+                client.pipeline().rpush(tmp_key, *buffer).expire(tmp_key, ttl).execute()
+            except redis.RedisError:
+                logger.warning(f"Stage cache write failed for {stage}", exc_info=True)
+                caching = False
+        buffer = []
+
+    for record in records:
+        if caching:
+            buffer.append(json.dumps(record))
+            if len(buffer) >= STAGE_CACHE_CHUNK_SIZE:
+                flush()
+        yield record
+    flush()
+    if caching:
+        try:
+            client.pipeline().rename(tmp_key, key).expire(key, ttl).execute()
+        except redis.RedisError:
+            logger.warning(f"Stage cache commit failed for {stage}", exc_info=True)
@@ -1,21 +1,50 @@
 import os
-import subprocess
-import json
-import asyncio
+import time
+import hashlib
 import logging
+import subprocess
+from contextlib import nullcontext
+from functools import partial
 from urllib.parse import urlparse
-from celery import Celery, chain
+from celery import Celery, chain, chord, group, current_task
+from celery.schedules import crontab
+from celery.exceptions import Ignore
+from celery.utils.time import get_exponential_backoff_interval
+from sqlalchemy.exc import OperationalError, InterfaceError
+import redis
+from celery.signals import (
+    celeryd_init, worker_init, worker_process_init, worker_process_shutdown,
+    before_task_publish, task_prerun, task_postrun,
+)
 from db_sync import (
+    Subdomain, URL, Port, Vulnerability, host_of,
     add_subdomains, add_urls, add_ports, add_vulnerabilities,
-    update_scan_status
+    update_scan_status, get_scan_status, mark_stage_cached, mark_stage_completed, mark_shard_completed,
+    get_completed_shards, add_probed_hosts, get_tool_overrides, record_tool_run, claim_queued_scans, demote_scan,
+    clear_stage, clear_shard, count_rows, get_resume_state,
+    assign_baseline_scan, get_subdomains, get_new_subdomains, get_changed_hosts,
+    init_engine, pool_stats, scan_transaction,
 )
-from datetime import datetime
+from runner import stream_jsonl, ingest, ToolCancelled
+from metrics import (
+    STAGE_DURATION, STAGE_START_DELAY, TASK_QUEUE_WAIT, start_worker_exporter, mark_process_dead,
+)
+import stage_cache
+import profiles
+import scheduler
+import partitions
+import scan_events
+from datetime import datetime, timezone
 from uuid import UUID
 import tempfile
 
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://redis:6379/0")
 CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", "redis://redis:6379/0")
 
+# naabu/nuclei inputs larger than this are split into shards that run as parallel
+# sub-tasks, so one big target spreads across every worker replica.
+SCAN_SHARD_SIZE = int(os.getenv("SCAN_SHARD_SIZE", "200"))
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -25,13 +54,200 @@ celery_app = Celery(
     backend=CELERY_RESULT_BACKEND,
 )
 
-def run_async(coro):
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        return loop.run_until_complete(coro)
-    finally:
-        loop.close()
+# Stages run on separate queues so each can get its own worker pool: fast discovery
+# lookups never wait behind an hour-long nuclei run, and the CPU-heavy vulnerability
+# pool scales on its own. Pipeline bookkeeping tasks are short and share the
+# discovery queue. A single worker can serve everything with
+# -Q discovery,portscan,vulnscan.
+DISCOVERY_QUEUE = os.getenv("CELERY_DISCOVERY_QUEUE", "discovery")
+PORTSCAN_QUEUE = os.getenv("CELERY_PORTSCAN_QUEUE", "portscan")
+VULNSCAN_QUEUE = os.getenv("CELERY_VULNSCAN_QUEUE", "vulnscan")
+# Periodic housekeeping, served by the single worker that also runs celery beat.
+MAINTENANCE_QUEUE = os.getenv("CELERY_MAINTENANCE_QUEUE", "maintenance")
+
+# UTC hour at which beat runs partition maintenance each day.
+PARTITION_MAINTENANCE_HOUR = int(os.getenv("PARTITION_MAINTENANCE_HOUR", "3"))
+
+celery_app.conf.update(
+    task_default_queue=DISCOVERY_QUEUE,
+    task_routes={
+        "worker.naabu_task": {"queue": PORTSCAN_QUEUE},
+        "worker.naabu_shard_task": {"queue": PORTSCAN_QUEUE},
+        "worker.nuclei_task": {"queue": VULNSCAN_QUEUE},
+        "worker.nuclei_shard_task": {"queue": VULNSCAN_QUEUE},
+        "worker.maintain_partitions_task": {"queue": MAINTENANCE_QUEUE},
+    },
+    beat_schedule={
+        "maintain-partitions": {
+            "task": "worker.maintain_partitions_task",
+            "schedule": crontab(hour=PARTITION_MAINTENANCE_HOUR, minute=0),
+        },
+        # Scans also finish without a worker noticing (cancelled, or stuck past
+        # SCAN_STUCK_AFTER), so queued scans are dispatched periodically too.
+        "dispatch-queued-scans": {
+            "task": "worker.dispatch_queued_scans",
+            "schedule": scheduler.SCAN_DISPATCH_INTERVAL,
+        },
+    },
+    timezone="UTC",
+    # Tasks a worker process reserves ahead of the one it runs. Pools running long
+    # tasks should use 1 so queued work stays available to idle workers.
+    worker_prefetch_multiplier=int(os.getenv("CELERY_PREFETCH_MULTIPLIER", "4")),
+    # Scans are published with the broker priority of their class and every task they
+    # spawn inherits it, so a worker always takes the most urgent scan's task next.
+    broker_transport_options={"priority_steps": sorted(set(scheduler.SCAN_PRIORITIES.values()))},
+    task_inherit_parent_priority=True,
+)
+
+# When set, all rows subfinder and katana write are committed in one transaction instead
+# of batch by batch. Atomic per stage, but partial results are no longer visible mid-run.
+# naabu and nuclei shards always commit atomically, once their tool has finished.
+DB_STAGE_TRANSACTION = os.getenv("DB_STAGE_TRANSACTION", "0") == "1"
+
+# Stage tasks failing with a transient error (lost database or Redis connection, tool
+# exiting non-zero or killed) are retried up to STAGE_MAX_RETRIES times, waiting a
+# random time of up to STAGE_RETRY_BACKOFF * 2^retry seconds, capped at
+# STAGE_RETRY_BACKOFF_MAX. Anything else, or running out of retries, fails the scan;
+# it can then be resumed with POST /scans/{scan_id}/resume.
+STAGE_MAX_RETRIES = int(os.getenv("STAGE_MAX_RETRIES", "3"))
+STAGE_RETRY_BACKOFF = int(os.getenv("STAGE_RETRY_BACKOFF", "30"))
+STAGE_RETRY_BACKOFF_MAX = int(os.getenv("STAGE_RETRY_BACKOFF_MAX", "900"))
+TRANSIENT_ERRORS = (
+    OperationalError, InterfaceError, redis.ConnectionError, redis.TimeoutError, subprocess.CalledProcessError,
+)
+
+# Budgets for one tool run (a whole stage, or one naabu/nuclei shard): a tool running
+# longer, or printing more output, is stopped and fails the scan so its worker slot
+# goes back to the queue. 0 disables a budget.
+STAGE_TIMEOUTS = {
+    "subfinder": int(os.getenv("STAGE_TIMEOUT_SUBFINDER", str(1800))),
+    "katana": int(os.getenv("STAGE_TIMEOUT_KATANA", str(3600))),
+    "naabu": int(os.getenv("STAGE_TIMEOUT_NAABU", str(3600))),
+    "nuclei": int(os.getenv("STAGE_TIMEOUT_NUCLEI", str(4 * 3600))),
+}
+# Stage tasks only return small manifests, but result_expires also sets how long the
+# Redis backend keeps chord counters, and a chord's body only runs once its last part
+# has finished: up to a whole stage later, retries included. Never below Celery's
+# one-day default.
+celery_app.conf.result_expires = int(os.getenv("CELERY_RESULT_EXPIRES", str(max(
+    24 * 3600, max(STAGE_TIMEOUTS.values()) * (STAGE_MAX_RETRIES + 1) + STAGE_RETRY_BACKOFF_MAX,
+))))
+STAGE_MAX_OUTPUT_BYTES = {
+    stage: int(os.getenv(f"STAGE_MAX_OUTPUT_MB_{stage.upper()}", "1024")) * 1024 * 1024
+    for stage in ("subfinder", "katana", "naabu", "nuclei")
+}
+
+@celeryd_init.connect
+def init_tool_profiles(options=None, **kwargs):
+    # Every pool process runs its own tools, so each gets a share of the resources.
+    profiles.set_worker_slots((options or {}).get("concurrency") or os.cpu_count() or 1)
+
+@worker_process_init.connect
+def init_worker_process(**kwargs):
+    init_engine()
+    logger.info(f"Worker process DB pool ready: {pool_stats()}")
+
+@worker_init.connect
+def init_worker_metrics(**kwargs):
+    start_worker_exporter()
+
+@worker_process_shutdown.connect
+def shutdown_worker_process(pid=None, **kwargs):
+    mark_process_dead(pid or os.getpid())
+
+STAGES = ("subfinder", "katana", "naabu", "nuclei")
+
+# Result table each stage writes to.
+STAGE_MODELS = {"subfinder": Subdomain, "katana": URL, "naabu": Port, "nuclei": Vulnerability}
+
+def stage_of(task_name: str):
+    name = task_name.rsplit(".", 1)[-1].removesuffix("_task").removesuffix("_shard")
+    return name if name in STAGES else None
+
+# Tasks that aren't part of one scan's pipeline, though a scan's task may publish them.
+UNSCANNED_TASKS = {"worker.dispatch_queued_scans", "worker.maintain_partitions_task"}
+
+@before_task_publish.connect
+def stamp_task_headers(headers=None, **kwargs):
+    """
+    Stamp publish time on every message, and the time the scan was submitted: as
+    given by the publisher (dispatch_queued_scans starting a queued scan), else carried
+    from the task that publishes the next step of its pipeline, else now (the API has
+    no current task).
+    """
+    now = time.time()
+    headers["published_at"] = now
+    if "scan_submitted_at" in headers or headers.get("task") in UNSCANNED_TASKS:
+        return
+    parent = current_task.request if current_task else None
+    headers["scan_submitted_at"] = (parent and parent.get("scan_submitted_at")) or now
+
+_task_started = {}
+
+@task_prerun.connect
+def record_task_start(task_id=None, task=None, **kwargs):
+    now = time.time()
+    published_at = task.request.get("published_at")
+    if published_at:
+        TASK_QUEUE_WAIT.labels(task.name.rsplit(".", 1)[-1]).observe(max(0.0, now - published_at))
+    stage = stage_of(task.name)
+    if stage:
+        submitted_at = task.request.get("scan_submitted_at")
+        if submitted_at:
+            STAGE_START_DELAY.labels(stage).observe(max(0.0, now - submitted_at))
+        _task_started[task_id] = time.perf_counter()
+
+@task_postrun.connect
+def record_task_end(task_id=None, task=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        STAGE_DURATION.labels(stage_of(task.name)).observe(time.perf_counter() - started)
+
+def stage_transaction():
+    return scan_transaction() if DB_STAGE_TRANSACTION else nullcontext()
+
+def set_scan_status(scan_id: str, status: str):
+    update_scan_status(UUID(scan_id), status, datetime.utcnow())
+    scan_events.publish_status(scan_id, status)
+    # The scan's slot under the caps is free again.
+    dispatch_queued_scans.apply_async(priority=scheduler.broker_priority("interactive"))
+
+def fail_stage(scan_id: str, stage: str):
+    scan_events.publish_stage_failed(scan_id, stage)
+    set_scan_status(scan_id, "failed")
+
+def ensure_scan_running(scan_id: str):
+    """
+    Drop a task of a scan that was cancelled or has failed. Ignore ends the task
+    without a result, so the rest of its chain (or chord) never runs either.
+    """
+    status = get_scan_status(UUID(scan_id))
+    if status in ("cancelled", "failed"):
+        logger.info(f"Dropping {current_task.name} of {status} scan {scan_id}")
+        raise Ignore()
+
+def retry_or_fail(task, scan_id: str, stage: str, exc: Exception):
+    """Retry the stage task with backoff if exc is transient and retries are left, else fail the scan."""
+    if isinstance(exc, ToolCancelled):
+        logger.info(f"{stage} stopped, scan {scan_id} was cancelled")
+        raise Ignore()
+    retries = task.request.retries
+    if isinstance(exc, TRANSIENT_ERRORS) and retries < STAGE_MAX_RETRIES:
+        countdown = get_exponential_backoff_interval(
+            STAGE_RETRY_BACKOFF, retries, STAGE_RETRY_BACKOFF_MAX, full_jitter=True,
+        )
+        logger.warning(f"{stage} failed for scan {scan_id}, retry {retries + 1}/{STAGE_MAX_RETRIES} in {countdown}s")
+        scan_events.publish_stage_retrying(scan_id, stage, retries + 1, countdown)
+        raise task.retry(exc=exc, countdown=countdown, max_retries=STAGE_MAX_RETRIES)
+    fail_stage(scan_id, stage)
+    raise exc
+
+def progress_writer(writer, section: str):
+    """Wrap a db_sync add_* writer so every written batch is published as a progress event."""
+    def write(scan_id: UUID, rows):
+        writer(scan_id, rows)
+        scan_events.publish_rows(scan_id, section, len(rows))
+    return write
 
 def ensure_url(target: str) -> str:
     if target.startswith("http://") or target.startswith("https://"):
@@ -47,121 +263,461 @@ def strip_scheme(target: str) -> str:
     # Remove any trailing slashes
     return host.rstrip('/')
 
+def stage_records(
+    stage: str, scan_id: str, target: str, cmd, parse, run_args=(), input_lines=None, inputs=(), use_cache: bool = True,
+):
+    """
+    Parsed records for a stage. Replayed from the cross-scan cache when a fresh entry
+    exists for the same target, tool command and inputs; otherwise streamed from the
+    tool and written through to the cache. run_args (temp files, profile flags) are
+    passed to the tool but don't change what it finds, so they aren't part of the key.
+    Returns (records, whether they are replayed from the cache).
+    """
+    key = stage_cache.cache_key(stage, target, cmd, inputs)
+    cached = stage_cache.lookup(stage, key) if use_cache else None
+    if cached is not None:
+        logger.info(f"{stage} served from cache for scan {scan_id}")
+        mark_stage_cached(UUID(scan_id), stage)
+        scan_events.publish_stage_cached(scan_id, stage)
+        return cached, True
+    return stage_cache.store(stage, key, parse(stream_jsonl(
+        [*cmd, *run_args], input_lines,
+        timeout=STAGE_TIMEOUTS[stage],
+        max_output_bytes=STAGE_MAX_OUTPUT_BYTES[stage],
+        cancelled=lambda: scan_events.cancel_requested(scan_id),
+        input_hosts=len(inputs),
+    ))), False
+
+def ingest_stage(stage: str, scan_id: str, target: str, cmd, parse, writer, clear, **kwargs):
+    """
+    ingest() a stage's records (see stage_records). If a replay from the stage cache
+    breaks off, the rows it wrote are removed with clear() and the tool runs instead.
+    Returns (row count, whether the rows were replayed from the cache).
+    """
+    try:
+        records, cached = stage_records(stage, scan_id, target, cmd, parse, **kwargs)
+        return ingest(records, writer, UUID(scan_id)), cached
+    except stage_cache.ReplayInterrupted:
+        logger.warning(f"{stage} cache replay for scan {scan_id} broke off, running the tool", exc_info=True)
+        clear()
+        records, _ = stage_records(stage, scan_id, target, cmd, parse, use_cache=False, **kwargs)
+        return ingest(records, writer, UUID(scan_id)), False
+
+def stage_manifest(scan_id: str, stage: str, section: str, count: int) -> dict:
+    """
+    What a stage task returns instead of its output: the output itself stays in the
+    scan's Postgres result section, which downstream stages read what they need from.
+    Manifests of parallel stages merge with merge_results, shards with sum_shard_results.
+    """
+    return {"scan_id": scan_id, "stages": {stage: {"section": section, "count": count}}}
+
+def stage_count(manifest: dict, stage: str) -> int:
+    return manifest.get("stages", {}).get(stage, {}).get("count", 0)
+
+def parse_subfinder_records(records):
+    return (r["host"] for r in records if "host" in r)
+
+def parse_katana_records(records):
+    return (r["url"] for r in records if "url" in r)
+
+def parse_naabu_records(records):
+    return ({"ip": r["ip"], "port": r["port"], "host": r.get("host") or r["ip"]} for r in records)
+
+def parse_nuclei_record(j: dict) -> dict:
+    info = j.get("info", {})
+    return {
+        "template_id": j.get("template-id", ""),
+        "severity": info.get("severity", "unknown"),
+        "matched_url": j.get("matched-at", ""),
+        "host": host_of(j.get("host") or j.get("matched-at", "")),
+        "description": info.get("description", ""),
+        "details": j,
+    }
+
+def parse_nuclei_records(records):
+    return map(parse_nuclei_record, records)
+
 @celery_app.task(bind=True)
 def subfinder_task(self, scan_id: str, target: str):
+    ensure_scan_running(scan_id)
     try:
         domain = strip_scheme(target)
         logger.info(f"subfinder input: {repr(target)} -> {repr(domain)}")
-        result = subprocess.run([
-            "subfinder", "-d", domain, "-silent", "-oJ"
-        ], capture_output=True, text=True, check=True)
-        subdomains = [json.loads(line)["host"] for line in result.stdout.splitlines() if line.strip()]
-        add_subdomains(UUID(scan_id), subdomains)
-        return {"subdomains": subdomains}
+        scan_events.publish_stage_started(scan_id, "subfinder")
+        # Rows of an earlier, failed attempt would be duplicated.
+        clear_stage(UUID(scan_id), "subfinder", STAGE_MODELS["subfinder"])
+        with stage_transaction():
+            subdomain_count, _ = ingest_stage(
+                "subfinder", scan_id, target, ["subfinder", "-d", domain, "-silent", "-oJ"], parse_subfinder_records,
+                progress_writer(add_subdomains, "subdomains"),
+                lambda: clear_stage(UUID(scan_id), "subfinder", STAGE_MODELS["subfinder"]),
+            )
+            mark_stage_completed(UUID(scan_id), "subfinder")
+        scan_events.publish_shard_completed(scan_id, "subfinder")
+        logger.info(f"subfinder found {subdomain_count} subdomains")
+        return stage_manifest(scan_id, "subfinder", "subdomains", subdomain_count)
     except Exception as e:
         logger.exception("Error in subfinder_task")
-        update_scan_status(UUID(scan_id), "failed", datetime.utcnow())
-        raise e
+        retry_or_fail(self, scan_id, "subfinder", e)
 
 @celery_app.task(bind=True)
-def katana_task(self, prev_result, scan_id: str, target: str):
+def katana_task(self, scan_id: str, target: str):
+    ensure_scan_running(scan_id)
     try:
         url = ensure_url(target)
         logger.info(f"katana input: {repr(target)} -> {repr(url)}")
-        result = subprocess.run([
-            "katana", "-u", url, "-silent", "-ob", "-or", "-jsonl"
-        ], capture_output=True, text=True, check=True)
-        logger.info(f"katana raw output: {result.stdout}")
-        urls = []
-        for line in result.stdout.splitlines():
-            if line.strip():
-                try:
-                    j = json.loads(line)
-                    if "url" in j:
-                        urls.append(j["url"])
-                except Exception as ex:
-                    logger.warning(f"Could not parse katana line: {line} ({ex})")
-        add_urls(UUID(scan_id), urls)
-        return {**prev_result, "urls": urls}
+        scan_events.publish_stage_started(scan_id, "katana")
+        # Rows of an earlier, failed attempt would be duplicated.
+        clear_stage(UUID(scan_id), "katana", STAGE_MODELS["katana"])
+        with stage_transaction():
+            url_count, _ = ingest_stage(
+                "katana", scan_id, target, ["katana", "-u", url, "-silent", "-ob", "-or", "-jsonl"], parse_katana_records,
+                progress_writer(add_urls, "urls"), lambda: clear_stage(UUID(scan_id), "katana", STAGE_MODELS["katana"]),
+            )
+            mark_stage_completed(UUID(scan_id), "katana")
+        scan_events.publish_shard_completed(scan_id, "katana")
+        logger.info(f"katana found {url_count} urls")
+        return stage_manifest(scan_id, "katana", "urls", url_count)
     except Exception as e:
         logger.exception("Error in katana_task")
-        update_scan_status(UUID(scan_id), "failed", datetime.utcnow())
-        raise e
+        retry_or_fail(self, scan_id, "katana", e)
 
-@celery_app.task(bind=True)
-def naabu_task(self, prev_result, scan_id: str, target: str):
+def shard(items, size: int):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def shard_key(stage: str, items) -> str:
+    return f"{stage}:{hashlib.sha1(chr(10).join(items).encode()).hexdigest()[:16]}"
+
+def pending_shards(scan_id: str, stage: str, items):
+    """
+    Split a stage's input into shards and drop those already committed by an earlier
+    run of the scan. If the checkpoints don't match this split (the input or
+    SCAN_SHARD_SIZE changed), the stage's rows are cleared and every shard runs again.
+    """
+    shards = shard(items, SCAN_SHARD_SIZE)
+    keys = [shard_key(stage, chunk) for chunk in shards]
+    done = get_completed_shards(UUID(scan_id), stage)
+    if not done <= set(keys):
+        logger.info(f"{stage} checkpoints of scan {scan_id} don't match its shards, rerunning the stage")
+        clear_stage(UUID(scan_id), stage, STAGE_MODELS[stage])
+        done = set()
+    elif done:
+        logger.info(f"{stage}: {len(done)} of {len(shards)} shards already done for scan {scan_id}")
+    return [chunk for chunk, key in zip(shards, keys) if key not in done]
+
+def complete_stage(scan_id: str, stage: str, section: str) -> dict:
+    """Checkpoint a stage that has nothing left to run and return its manifest."""
+    mark_stage_completed(UUID(scan_id), stage)
+    return stage_manifest(scan_id, stage, section, count_rows(UUID(scan_id), STAGE_MODELS[stage]))
+
+def fan_out(shard_task, shards, scan_id: str, target: str, *args, priority: int = None):
+    """
+    Chord of one shard_task per slice of the stage input. It replaces the calling
+    stage task, so its summed counts stand in for the stage's result downstream.
+    Without a priority, the shards inherit the stage task's.
+    """
+    options = {} if priority is None else {"priority": priority}
+    return chord(
+        group(shard_task.s(scan_id, target, chunk, *args).set(**options) for chunk in shards),
+        sum_shard_results.s().set(**options),
+    )
+
+def shard_priority(scan_id: str, stage: str, hosts):
+    """
+    Cost estimate of a sharded stage: a scan with more than SCAN_DEMOTE_HOSTS hosts to
+    probe is demoted, and its shards get the lowest priority. None keeps the scan's own.
+    """
+    if not scheduler.SCAN_DEMOTE_HOSTS or len(hosts) <= scheduler.SCAN_DEMOTE_HOSTS:
+        return None
+    logger.info(f"{stage}: demoting scan {scan_id}, {len(hosts)} hosts exceed SCAN_DEMOTE_HOSTS")
+    demote_scan(UUID(scan_id))
+    return scheduler.broker_priority("demoted")
+
+@celery_app.task
+def sum_shard_results(results):
+    merged = {"scan_id": results[0]["scan_id"], "stages": {}}
+    for result in results:
+        for stage, info in result["stages"].items():
+            total = merged["stages"].setdefault(stage, {**info, "count": 0})
+            total["count"] += info["count"]
+    # Shards committed before a resume aren't in results; count what the stage persisted.
+    for stage, total in merged["stages"].items():
+        mark_stage_completed(UUID(merged["scan_id"]), stage)
+        total["count"] = count_rows(UUID(merged["scan_id"]), STAGE_MODELS[stage])
+    return merged
+
+def tool_run(stage: str, profile: dict, started: float, records: int, cached: bool = False) -> dict:
+    """
+    A scan's tool_runs entry: the profile a tool ran with and the throughput it got.
+    A run replayed from the stage cache is tagged cached and has no throughput.
+    """
+    seconds = time.perf_counter() - started
+    run = {"stage": stage, "profile": profile, "records": records, "seconds": round(seconds, 3), "cached": cached}
+    if not cached:
+        run["hosts_per_second"] = round(profile["hosts"] / max(seconds, 1e-3), 3)
+    return run
+
+def run_naabu(task, scan_id: str, target: str, hosts, overrides: dict = None, whole_stage: bool = False):
+    """
+    Scan one shard of hosts. Ports are committed in batches as naabu prints them and
+    tagged with the shard's key; a retried or resumed shard first clears the rows of
+    its failed attempt, then its checkpoint is committed once naabu has finished.
+    """
     try:
-        subdomains = prev_result.get("subdomains", [])
-        hosts = subdomains if subdomains else [strip_scheme(target)]
-        logger.info(f"naabu input hosts: {hosts}")
-        logger.info(f"naabu command: naabu -silent -json, input: {'|'.join(hosts)}")
-        result = subprocess.run(
-            ["naabu", "-silent", "-json"],
-            input="\n".join(hosts),
-            text=True,
-            capture_output=True,
-            check=True
+        profile = profiles.choose_profile("naabu", len(hosts), (overrides or {}).get("naabu"))
+        logger.info(f"naabu input: {len(hosts)} hosts, profile {profile}")
+        key = shard_key("naabu", hosts)
+        clear_shard(UUID(scan_id), Port, key)
+        started = time.perf_counter()
+        port_count, cached = ingest_stage(
+            "naabu", scan_id, target, ["naabu", "-silent", "-json"], parse_naabu_records,
+            progress_writer(partial(add_ports, shard=key), "ports"), lambda: clear_shard(UUID(scan_id), Port, key),
+            run_args=profiles.tool_args("naabu", profile), input_lines=hosts, inputs=hosts,
         )
-        logger.info(f"naabu raw output: {result.stdout}")
-        ports = [json.loads(line) for line in result.stdout.splitlines() if line.strip()]
-        add_ports(UUID(scan_id), ports)
-        return {**prev_result, "ports": ports}
+        with scan_transaction():
+            mark_shard_completed(UUID(scan_id), key)
+            add_probed_hosts(UUID(scan_id), "naabu", hosts)
+            record_tool_run(UUID(scan_id), tool_run("naabu", profile, started, port_count, cached))
+            if whole_stage:
+                mark_stage_completed(UUID(scan_id), "naabu")
+        scan_events.publish_shard_completed(scan_id, "naabu")
+        logger.info(f"naabu found {port_count} open ports")
+        return stage_manifest(scan_id, "naabu", "ports", port_count)
+    except Exception as e:
+        logger.exception("Error in naabu_task")
+        retry_or_fail(task, scan_id, "naabu", e)
+
+@celery_app.task(bind=True)
+def naabu_task(self, prev_result, scan_id: str, target: str, baseline_scan_id: str = None):
+    ensure_scan_running(scan_id)
+    try:
+        subdomain_count = stage_count(prev_result, "subfinder")
+        if not subdomain_count:
+            hosts = [strip_scheme(target)]
+        elif baseline_scan_id:
+            hosts = sorted(get_new_subdomains(UUID(scan_id), UUID(baseline_scan_id)))
+            logger.info(f"naabu incremental: {len(hosts)} of {subdomain_count} hosts are new since {baseline_scan_id}")
+        else:
+            hosts = get_subdomains(UUID(scan_id))
+        overrides = get_tool_overrides(UUID(scan_id))
+        shards = pending_shards(scan_id, "naabu", hosts)
+        scan_events.publish_stage_started(scan_id, "naabu", len(shards))
+        if not shards:
+            return complete_stage(scan_id, "naabu", "ports")
     except Exception as e:
         logger.exception("Error in naabu_task")
-        update_scan_status(UUID(scan_id), "failed", datetime.utcnow())
-        raise e
+        retry_or_fail(self, scan_id, "naabu", e)
+    # A sharded stage always fans out, even down to one pending shard, so its
+    # manifest counts the rows of shards committed before a resume too.
+    if len(hosts) > SCAN_SHARD_SIZE:
+        logger.info(f"naabu: running {len(shards)} shards of up to {SCAN_SHARD_SIZE} hosts")
+        return self.replace(fan_out(
+            naabu_shard_task, shards, scan_id, target, overrides,
+            priority=shard_priority(scan_id, "naabu", hosts),
+        ))
+    return run_naabu(self, scan_id, target, shards[0], overrides, whole_stage=True)
 
 @celery_app.task(bind=True)
-def nuclei_task(self, prev_result, scan_id: str, target: str, nuclei_templates):
+def naabu_shard_task(self, scan_id: str, target: str, hosts, overrides: dict = None):
+    ensure_scan_running(scan_id)
+    return run_naabu(self, scan_id, target, hosts, overrides)
+
+def run_nuclei(
+    task, scan_id: str, target: str, targets, nuclei_templates, overrides: dict = None, whole_stage: bool = False,
+):
+    """
+    Scan one shard of targets. Like run_naabu, findings are committed in batches as
+    nuclei reports them, and the shard's checkpoint once nuclei has finished.
+    """
     try:
-        subdomains = prev_result.get("subdomains", [])
-        targets = subdomains if subdomains else [ensure_url(target)]
-        logger.info(f"nuclei input targets: {targets}")
+        profile = profiles.choose_profile("nuclei", len(targets), (overrides or {}).get("nuclei"))
+        logger.info(f"nuclei input: {len(targets)} targets, profile {profile}")
         templates_args = []
         for t in nuclei_templates:
             templates_args.extend(["-t", t])
+        key = shard_key("nuclei", targets)
+        clear_shard(UUID(scan_id), Vulnerability, key)
         # Write targets to a temp file
-        with tempfile.NamedTemporaryFile(mode="w+", delete=False) as f:
+        with tempfile.NamedTemporaryFile(mode="w+") as f:
             for t in targets:
                 f.write(f"{t}\n")
             f.flush()
-            result = subprocess.run(
-                ["nuclei", "-list", f.name, "-jsonl", "-silent"] + templates_args,
-                text=True,
-                capture_output=True,
-                check=True
+            started = time.perf_counter()
+            vuln_count, cached = ingest_stage(
+                "nuclei", scan_id, target, ["nuclei", "-jsonl", "-silent", *templates_args], parse_nuclei_records,
+                progress_writer(partial(add_vulnerabilities, shard=key), "vulnerabilities"),
+                lambda: clear_shard(UUID(scan_id), Vulnerability, key),
+                run_args=["-list", f.name, *profiles.tool_args("nuclei", profile)], inputs=targets,
             )
-        logger.info(f"nuclei raw output: {result.stdout}")
-        logger.error(f"nuclei stderr: {result.stderr}")
-        vulns = []
-        for line in result.stdout.splitlines():
-            if line.strip():
-                j = json.loads(line)
-                info = j.get("info", {})
-                vuln = {
-                    "template_id": j.get("template-id", ""),
-                    "severity": info.get("severity", "unknown"),
-                    "matched_url": j.get("matched-at", ""),
-                    "description": info.get("description", ""),
-                    "details": j,
-                }
-                vulns.append(vuln)
-        add_vulnerabilities(UUID(scan_id), vulns)
-        update_scan_status(UUID(scan_id), "completed", datetime.utcnow())
-        return {**prev_result, "vulnerabilities": vulns}
+        with scan_transaction():
+            mark_shard_completed(UUID(scan_id), key)
+            add_probed_hosts(UUID(scan_id), "nuclei", targets)
+            record_tool_run(UUID(scan_id), tool_run("nuclei", profile, started, vuln_count, cached))
+            if whole_stage:
+                mark_stage_completed(UUID(scan_id), "nuclei")
+        scan_events.publish_shard_completed(scan_id, "nuclei")
+        logger.info(f"nuclei found {vuln_count} vulnerabilities")
+        return stage_manifest(scan_id, "nuclei", "vulnerabilities", vuln_count)
     except Exception as e:
         logger.exception("Error in nuclei_task")
-        update_scan_status(UUID(scan_id), "failed", datetime.utcnow())
-        raise e
+        retry_or_fail(task, scan_id, "nuclei", e)
+
+@celery_app.task(bind=True)
+def nuclei_task(self, prev_result, scan_id: str, target: str, nuclei_templates, baseline_scan_id: str = None):
+    ensure_scan_running(scan_id)
+    try:
+        subdomain_count = stage_count(prev_result, "subfinder")
+        if not subdomain_count:
+            targets = [ensure_url(target)]
+        elif baseline_scan_id:
+            targets = sorted(get_changed_hosts(UUID(scan_id), UUID(baseline_scan_id)))
+            logger.info(f"nuclei incremental: {len(targets)} new or changed hosts since {baseline_scan_id}")
+        else:
+            targets = get_subdomains(UUID(scan_id))
+        overrides = get_tool_overrides(UUID(scan_id))
+        shards = pending_shards(scan_id, "nuclei", targets)
+        scan_events.publish_stage_started(scan_id, "nuclei", len(shards))
+        if not shards:
+            return complete_stage(scan_id, "nuclei", "vulnerabilities")
+    except Exception as e:
+        logger.exception("Error in nuclei_task")
+        retry_or_fail(self, scan_id, "nuclei", e)
+    # A sharded stage always fans out, even down to one pending shard, so its
+    # manifest counts the rows of shards committed before a resume too.
+    if len(targets) > SCAN_SHARD_SIZE:
+        logger.info(f"nuclei: running {len(shards)} shards of up to {SCAN_SHARD_SIZE} targets")
+        return self.replace(fan_out(
+            nuclei_shard_task, shards, scan_id, target, nuclei_templates, overrides,
+            priority=shard_priority(scan_id, "nuclei", targets),
+        ))
+    return run_nuclei(self, scan_id, target, shards[0], nuclei_templates, overrides, whole_stage=True)
+
+@celery_app.task(bind=True)
+def nuclei_shard_task(self, scan_id: str, target: str, targets, nuclei_templates, overrides: dict = None):
+    ensure_scan_running(scan_id)
+    return run_nuclei(self, scan_id, target, targets, nuclei_templates, overrides)
+
+def merge_results(results, carried: dict = None):
+    """
+    Merge stage manifests, starting from carried (the manifest of stages a resumed
+    scan skips). A header group of one task hands over a single manifest, not a list.
+    """
+    if isinstance(results, dict):
+        results = [results]
+    manifests = ([carried] if carried else []) + list(results)
+    merged = {"scan_id": manifests[0]["scan_id"], "stages": {}}
+    for result in manifests:
+        merged["stages"].update(result["stages"])
+    return merged
+
+@celery_app.task
+def merge_stage_results(results, carried: dict = None):
+    return merge_results(results, carried)
+
+@celery_app.task
+def finalize_scan_task(results, scan_id: str, carried: dict = None):
+    set_scan_status(scan_id, "completed")
+    logger.info(f"Scan {scan_id} completed")
+    return merge_results(results, carried)
+
+def build_scan_pipeline(
+    scan_id: str, target: str, nuclei_templates, baseline_scan_id: str = None,
+    completed_stages=(), carried: dict = None,
+):
+    # Stages inside a group don't depend on each other and run in parallel.
+    # Each group is a chord header: its results are merged before the next
+    # level starts. katana only needs the target, so it runs next to subfinder;
+    # naabu and nuclei both consume the subdomains but not each other's output.
+    # With a baseline they only probe what changed since that scan. Stages in
+    # completed_stages are left out, their manifests passed along as carried.
+    discovery = [
+        signature for stage, signature in (
+            ("subfinder", subfinder_task.si(scan_id, target)),
+            ("katana", katana_task.si(scan_id, target)),
+        ) if stage not in completed_stages
+    ]
+    probes = [
+        signature for stage, signature in (
+            ("naabu", naabu_task.s(scan_id, target, baseline_scan_id)),
+            ("nuclei", nuclei_task.s(scan_id, target, nuclei_templates, baseline_scan_id)),
+        ) if stage not in completed_stages
+    ]
+    steps = [group(*discovery), merge_stage_results.s(carried)] if discovery else [merge_stage_results.si([], carried)]
+    if probes:
+        steps += [group(*probes), finalize_scan_task.s(scan_id, carried)]
+    else:
+        steps.append(finalize_scan_task.s(scan_id))
+    return chain(*steps)
+
+# Pipeline entrypoint
+@celery_app.task
+def start_scan_chain(scan_id: str, target: str, nuclei_templates, mode: str = "full"):
+    ensure_scan_running(scan_id)
+    logger.info(f"Scan {scan_id} started ({mode})")
+    scan_events.publish_status(scan_id, "in_progress")
+    baseline_scan_id = None
+    if mode == "incremental":
+        baseline = assign_baseline_scan(UUID(scan_id), target, nuclei_templates)
+        if baseline:
+            baseline_scan_id = str(baseline)
+            logger.info(f"Scan {scan_id} is incremental against {baseline_scan_id}")
+        else:
+            logger.info(f"Scan {scan_id} has no completed baseline with its templates, running a full scan")
+    return build_scan_pipeline(scan_id, target, nuclei_templates, baseline_scan_id).apply_async().id
+
+@celery_app.task
+def resume_scan_chain(scan_id: str):
+    """
+    Rebuild a failed scan's pipeline from its first incomplete stage. Completed stages
+    are skipped and their persisted rows reused; so are committed naabu/nuclei shards.
+    """
+    state = get_resume_state(UUID(scan_id))
+    completed = [stage for stage in STAGES if stage in state["completed_stages"]]
+    logger.info(f"Scan {scan_id} resumed, skipping {', '.join(completed) or 'no stages'}")
+    scan_events.publish_status(scan_id, "in_progress")
+    carried = {"scan_id": scan_id, "stages": {}}
+    for stage in completed:
+        section = {"subfinder": "subdomains", "katana": "urls", "naabu": "ports", "nuclei": "vulnerabilities"}[stage]
+        carried["stages"][stage] = {"section": section, "count": count_rows(UUID(scan_id), STAGE_MODELS[stage])}
+    baseline_scan_id = str(state["baseline_scan_id"]) if state["baseline_scan_id"] else None
+    return build_scan_pipeline(
+        scan_id, state["target"], state["nuclei_templates"], baseline_scan_id, completed, carried,
+    ).apply_async(priority=scheduler.broker_priority(state["priority"])).id
+
+def enqueue_scans(scans, nuclei_templates, mode: str = "full", priority: str = "normal"):
+    """
+    Publish a start_scan_chain message per (scan_id, target) over one broker
+    connection, instead of acquiring a producer for every .delay() call.
+    """
+    with celery_app.producer_or_acquire() as producer:
+        for scan_id, target in scans:
+            start_scan_chain.apply_async(
+                (str(scan_id), target, nuclei_templates, mode), producer=producer,
+                priority=scheduler.broker_priority(priority),
+            )
+
+@celery_app.task
+def dispatch_queued_scans():
+    """Start the queued scans that now fit under the running-scan caps."""
+    scans = claim_queued_scans()
+    with celery_app.producer_or_acquire() as producer:
+        for scan in scans:
+            try:
+                start_scan_chain.apply_async(
+                    (str(scan["scan_id"]), scan["target"], scan["nuclei_templates"], scan["mode"]),
+                    producer=producer, priority=scheduler.broker_priority(scan["priority"]),
+                    headers={"scan_submitted_at": scan["started_at"].replace(tzinfo=timezone.utc).timestamp()},
+                )
+            except Exception:
+                logger.exception(f"Could not start queued scan {scan['scan_id']}")
+                update_scan_status(scan["scan_id"], "failed", datetime.utcnow())
+    if scans:
+        logger.info(f"Started {len(scans)} queued scans")
+    return len(scans)
 
-# Chain entrypoint
 @celery_app.task
-def start_scan_chain(scan_id: str, target: str, nuclei_templates):
-    logger.info(f"Scan {scan_id} started")
-    return chain(
-        subfinder_task.s(scan_id, target),
-        katana_task.s(scan_id, target),
-        naabu_task.s(scan_id, target),
-        nuclei_task.s(scan_id, target, nuclei_templates)
-    )() 
-    logger.info(f"Scan {scan_id} completed")
\ No newline at end of file
+def maintain_partitions_task():
+    """Create the upcoming monthly partitions and drop (or archive) expired ones."""
+    created = partitions.ensure_partitions()
+    dropped = partitions.drop_expired_partitions()
+    return {"created": created, "dropped": dropped}
@@ -0,0 +1,60 @@
+"""
+Compare two benchmark result files (JSONL from bench/pipeline.py or
+bench/bulk_insert.py), e.g. from the base and head commit of a change:
+
+    python bench/compare.py base.jsonl head.jsonl
+
+Prints every numeric metric of each scenario found in both files with its relative
+change. When a file holds several runs of a scenario, the last one is used.
+"""
+import argparse
+import json
+
+# Fields identifying a measurement rather than measuring anything.
+IDENTITY = ("benchmark", "scenario", "path", "commit", "timestamp", "params")
+
+
+def flatten(record, prefix=""):
+    for name, value in record.items():
+        if not prefix and name in IDENTITY:
+            continue
+        if isinstance(value, dict):
+            yield from flatten(value, f"{prefix}{name}.")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield f"{prefix}{name}", value
+
+
+def load(path):
+    runs = {}
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                runs[(record["benchmark"], record.get("scenario") or record.get("path"))] = record
+    return runs
+
+
+def change(base, head):
+    if base == 0:
+        return ""
+    return f"{(head - base) / abs(base) * 100:+.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base")
+    parser.add_argument("head")
+    args = parser.parse_args()
+    base_runs, head_runs = load(args.base), load(args.head)
+    for key in sorted(base_runs.keys() & head_runs.keys()):
+        base, head = base_runs[key], head_runs[key]
+        print(f"{'/'.join(key)}  {base.get('commit')} -> {head.get('commit')}")
+        if base.get("params") != head.get("params"):
+            print("  (parameters differ)")
+        base_metrics, head_metrics = dict(flatten(base)), dict(flatten(head))
+        for name in sorted(base_metrics.keys() & head_metrics.keys()):
+            print(f"  {name:40} {base_metrics[name]:>14} {head_metrics[name]:>14} {change(base_metrics[name], head_metrics[name]):>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Stand-in for the ProjectDiscovery tools. Invoked through the symlinks in bench/bin
+(put that directory first on the worker's PATH), it acts as the tool it is named
+after: it reads the same arguments and input and prints JSONL shaped like the real
+tool's, so the worker's parsing, ingest and result reads do the usual work.
+
+Output is deterministic per tool and input. Volume and timing come from the
+environment; every knob can be set for one tool with FAKE_PD_<TOOL>_<KNOB>, e.g.
+FAKE_PD_NUCLEI_STARTUP=30:
+
+    FAKE_PD_SUBDOMAINS      hosts subfinder finds per domain (50)
+    FAKE_PD_URLS            URLs katana crawls per target (100)
+    FAKE_PD_PORTS           open ports naabu reports per host (2)
+    FAKE_PD_FINDINGS        findings nuclei reports per target, may be fractional (0.2)
+    FAKE_PD_EVIDENCE_BYTES  size of each finding's request + response (2048)
+    FAKE_PD_STARTUP         seconds before the first line, per run (0.2)
+    FAKE_PD_DELAY           seconds between lines (0)
+    FAKE_PD_FAIL_RATE       fraction of runs exiting 1 after their output (0)
+"""
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+TOOLS = ("subfinder", "katana", "naabu", "nuclei")
+
+DEFAULTS = {
+    "SUBDOMAINS": 50,
+    "URLS": 100,
+    "PORTS": 2,
+    "FINDINGS": 0.2,
+    "EVIDENCE_BYTES": 2048,
+    "STARTUP": 0.2,
+    "DELAY": 0,
+    "FAIL_RATE": 0,
+}
+
+WORDS = ("api", "app", "auth", "cdn", "dev", "docs", "mail", "portal", "shop", "staging", "vpn", "www")
+SOURCES = ("crtsh", "hackertarget", "alienvault", "rapiddns", "waybackarchive")
+PATHS = ("login", "search", "assets/app.js", "api/v1/users", "account/settings", "blog", "static/logo.png")
+PORTS = (80, 443, 8080, 8443, 22, 21, 3306, 5432, 6379, 9200)
+TEMPLATES = (
+    ("CVE-2021-44228", "Apache Log4j2 Remote Code Injection", "critical", "cves/2021"),
+    ("CVE-2023-22515", "Confluence Broken Access Control", "critical", "cves/2023"),
+    ("git-config", "Git Configuration File Exposure", "medium", "exposures/configs"),
+    ("tech-detect", "Wappalyzer Technology Detection", "info", "technologies"),
+    ("missing-hsts", "HTTP Missing Security Headers", "info", "misconfiguration"),
+    ("open-redirect", "Open Redirect Detection", "medium", "vulnerabilities/generic"),
+    ("exposed-panels", "Admin Panel Exposure", "low", "exposed-panels"),
+)
+
+
+def knob(tool, name):
+    value = os.getenv(f"FAKE_PD_{tool.upper()}_{name}", os.getenv(f"FAKE_PD_{name}"))
+    return float(value) if value is not None else DEFAULTS[name]
+
+
+def seeded(*parts):
+    return random.Random(hashlib.sha256("\0".join(parts).encode()).digest())
+
+
+def now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def arg(argv, flag, default=None):
+    return argv[argv.index(flag) + 1] if flag in argv else default
+
+
+def fake_ip(host):
+    digest = hashlib.md5(host.encode()).digest()
+    return f"10.{digest[0]}.{digest[1]}.{digest[2] or 1}"
+
+
+def input_lines(path=None):
+    lines = open(path) if path else sys.stdin
+    return [line.strip() for line in lines if line.strip()]
+
+
+def subfinder(argv):
+    domain = arg(argv, "-d", "example.com")
+    rng = seeded("subfinder", domain)
+    for i in range(int(knob("subfinder", "SUBDOMAINS"))):
+        yield {"host": f"{rng.choice(WORDS)}{i}.{domain}", "input": domain, "source": rng.choice(SOURCES)}
+
+
+def katana(argv):
+    target = arg(argv, "-u", "https://example.com").rstrip("/")
+    rng = seeded("katana", target)
+    for i in range(int(knob("katana", "URLS"))):
+        url = f"{target}/{rng.choice(PATHS)}?page={i}"
+        yield {
+            "timestamp": now(),
+            "url": url,
+            "request": {"method": "GET", "endpoint": url, "tag": "a", "attribute": "href", "source": target},
+            "response": {
+                "status_code": rng.choice((200, 200, 200, 301, 403, 404)),
+                "headers": {"content_type": "text/html; charset=utf-8", "server": "nginx"},
+                "content_length": rng.randint(512, 65536),
+            },
+        }
+
+
+def naabu(argv):
+    ports = int(knob("naabu", "PORTS"))
+    for host in input_lines():
+        rng = seeded("naabu", host)
+        ip = fake_ip(host)
+        for port in rng.sample(PORTS, min(ports, len(PORTS))):
+            yield {"host": host, "ip": ip, "port": port, "protocol": "tcp", "tls": port in (443, 8443), "timestamp": now()}
+
+
+def nuclei(argv):
+    findings = knob("nuclei", "FINDINGS")
+    evidence = int(knob("nuclei", "EVIDENCE_BYTES"))
+    for target in input_lines(arg(argv, "-list")):
+        rng = seeded("nuclei", target)
+        count = int(findings) + (rng.random() < findings % 1)
+        host = target.split("://", 1)[-1].split("/", 1)[0]
+        url = target if "://" in target else f"https://{target}"
+        for _ in range(count):
+            template_id, name, severity, folder = rng.choice(TEMPLATES)
+            matched = f"{url.rstrip('/')}/{rng.choice(PATHS)}"
+            request = f"GET /{matched.split('/', 3)[-1]} HTTP/1.1\r\nHost: {host}\r\nUser-Agent: Mozilla/5.0\r\n\r\n"
+            response = "HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n\r\n"
+            response += "x" * max(0, evidence - len(request) - len(response))
+            yield {
+                "template": f"http/{folder}/{template_id}.yaml",
+                "template-id": template_id,
+                "template-path": f"/root/nuclei-templates/http/{folder}/{template_id}.yaml",
+                "info": {
+                    "name": name,
+                    "author": ["bench"],
+                    "tags": folder.split("/"),
+                    "description": f"{name} detected on {host}.",
+                    "severity": severity,
+                    "reference": [f"https://nvd.nist.gov/vuln/detail/{template_id}"],
+                },
+                "type": "http",
+                "host": host,
+                "port": "443",
+                "scheme": "https",
+                "url": url,
+                "matched-at": matched,
+                "request": request,
+                "response": response,
+                "ip": fake_ip(host),
+                "timestamp": now(),
+                "curl-command": f"curl -X 'GET' '{matched}'",
+                "matcher-status": True,
+            }
+
+
+def main():
+    tool = os.path.basename(sys.argv[0])
+    if tool not in TOOLS:
+        sys.exit(f"fake_pd: run through a symlink named one of {', '.join(TOOLS)}")
+    argv = sys.argv[1:]
+    time.sleep(knob(tool, "STARTUP"))
+    delay = knob(tool, "DELAY")
+    # Real tools flush every line; the worker ingests while they run.
+    sys.stdout.reconfigure(line_buffering=True)
+    for record in globals()[tool](argv):
+        sys.stdout.write(json.dumps(record) + "\n")
+        if delay:
+            time.sleep(delay)
+    if random.random() < knob(tool, "FAIL_RATE"):
+        print(f"[FTL] {tool}: simulated failure", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Which baseline findings an incremental scan carries forward. Runs against a migrated
+database, inside a transaction that is rolled back.
+"""
+import os
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import insert
+
+if not os.getenv("DATABASE_URL"):
+    pytest.skip("needs DATABASE_URL pointing at a migrated database", allow_module_level=True)
+
+import db
+import db_sync
+from models import Scan, Subdomain, Port, Vulnerability, ProbedHost, LINEAGE_QUERY
+
+
+@pytest.fixture
+def conn():
+    with db_sync.engine.connect() as conn:
+        with conn.begin() as trans:
+            yield conn
+            trans.rollback()
+
+
+def add_scan(conn, subdomains, baseline=None, started_at=None):
+    scan_id, started_at = uuid4(), started_at or datetime.utcnow()
+    conn.execute(insert(Scan).values(
+        scan_id=scan_id, target="https://ex.com", started_at=started_at, status="completed",
+        baseline_scan_id=baseline[0] if baseline else None,
+    ))
+    for subdomain in subdomains:
+        conn.execute(insert(Subdomain).values(scan_id=scan_id, scan_started_at=started_at, subdomain=subdomain))
+    return scan_id, started_at
+
+
+def add_vulnerability(conn, scan, host):
+    conn.execute(insert(Vulnerability).values(
+        scan_id=scan[0], scan_started_at=scan[1], template_id="exposed-panel", severity="high",
+        matched_url=f"https://{host}/admin", description="", host=host,
+    ))
+
+
+def add_port(conn, scan, host, port, ip="10.0.0.1", with_host=True):
+    conn.execute(insert(Port).values(
+        scan_id=scan[0], scan_started_at=scan[1], ip=ip, port=port, host=host if with_host else None,
+    ))
+
+
+def probed(conn, scan, stage, *hosts):
+    for host in hosts:
+        conn.execute(insert(ProbedHost).values(scan_id=scan[0], scan_started_at=scan[1], stage=stage, host=host))
+
+
+def section(conn, scan, name):
+    lineage = conn.execute(LINEAGE_QUERY, {"scan_id": scan[0]}).all()
+    return conn.execute(db._section_query(scan[0], name, lineage=lineage)).all()
+
+
+def test_reprobed_host_drops_baseline_finding(conn):
+    baseline = add_scan(conn, ["a.ex.com", "b.ex.com"], started_at=datetime.utcnow() - timedelta(hours=1))
+    add_vulnerability(conn, baseline, "a.ex.com")
+    add_vulnerability(conn, baseline, "b.ex.com")
+    scan = add_scan(conn, ["a.ex.com", "b.ex.com"], baseline)
+    # a.ex.com had new URLs, so nuclei ran on it again and the panel is gone.
+    probed(conn, scan, "nuclei", "a.ex.com")
+
+    assert [row.matched_url for row in section(conn, scan, "vulnerabilities")] == ["https://b.ex.com/admin"]
+    assert db_sync.stage_summary(conn, scan[0], "nuclei")["vulnerabilities"] == 1
+
+
+def test_reprobed_host_keeps_its_new_finding(conn):
+    baseline = add_scan(conn, ["a.ex.com"], started_at=datetime.utcnow() - timedelta(hours=1))
+    add_vulnerability(conn, baseline, "a.ex.com")
+    scan = add_scan(conn, ["a.ex.com"], baseline)
+    probed(conn, scan, "nuclei", "a.ex.com")
+    add_vulnerability(conn, scan, "a.ex.com")
+
+    assert [row.matched_url for row in section(conn, scan, "vulnerabilities")] == ["https://a.ex.com/admin"]
+
+
+def test_vanished_host_drops_baseline_ports(conn):
+    baseline = add_scan(conn, ["a.ex.com", "c.ex.com"], started_at=datetime.utcnow() - timedelta(hours=1))
+    add_port(conn, baseline, "a.ex.com", 443)
+    add_port(conn, baseline, "c.ex.com", 22, ip="10.0.0.3")
+    add_port(conn, baseline, None, 8080, ip="10.0.0.4", with_host=False)
+    scan = add_scan(conn, ["a.ex.com"], baseline)
+
+    ports = {(row.ip, row.port) for row in section(conn, scan, "ports")}
+    # c.ex.com is gone; the port stored without a host is carried as before.
+    assert ports == {("10.0.0.1", 443), ("10.0.0.4", 8080)}
+
+
+def test_probe_two_increments_later_drops_finding(conn):
+    now = datetime.utcnow()
+    full = add_scan(conn, ["a.ex.com"], started_at=now - timedelta(hours=2))
+    add_vulnerability(conn, full, "a.ex.com")
+    middle = add_scan(conn, ["a.ex.com"], full, started_at=now - timedelta(hours=1))
+    scan = add_scan(conn, ["a.ex.com"], middle)
+    assert len(section(conn, scan, "vulnerabilities")) == 1
+
+    probed(conn, middle, "nuclei", "a.ex.com")
+    assert section(conn, scan, "vulnerabilities") == []
@@ -0,0 +1,34 @@
+"""Row helpers used when writing results (models.split_evidence and host_of)."""
+import pytest
+
+import models
+
+
+def test_split_evidence_moves_blobs_out_of_details():
+    vuln = {"template_id": "t", "details": {"info": {"name": "x"}, "request": "GET /", "response": "200"}}
+    row, evidence = models.split_evidence(vuln)
+    assert row == {"template_id": "t", "details": {"info": {"name": "x"}}}
+    assert evidence == {"request": "GET /", "response": "200"}
+    assert "request" in vuln["details"]
+
+
+def test_split_evidence_fills_missing_fields_with_none():
+    row, evidence = models.split_evidence({"details": {"response": "200"}})
+    assert row == {"details": {}}
+    assert evidence == {"request": None, "response": "200"}
+
+
+@pytest.mark.parametrize("details", [None, {}, {"info": {}}])
+def test_split_evidence_without_blobs(details):
+    vuln = {"template_id": "t", "details": details}
+    assert models.split_evidence(vuln) == (vuln, None)
+
+
+@pytest.mark.parametrize("target, host", [
+    ("https://a.example.com:8443/path?q=1", "a.example.com"),
+    ("a.example.com:80", "a.example.com"),
+    ("10.0.0.1", "10.0.0.1"),
+    ("http://b.example.com#frag", "b.example.com"),
+])
+def test_host_of(target, host):
+    assert models.host_of(target) == host
@@ -0,0 +1,49 @@
+"""Tool settings sized to input and worker resources (profiles.choose_profile)."""
+import pytest
+
+import profiles
+
+
+@pytest.fixture(autouse=True)
+def resources(monkeypatch):
+    """4 CPUs and 4 GB shared by two worker processes: 2 CPUs and 2 GB per run."""
+    monkeypatch.setattr(profiles, "worker_resources", lambda: {"cpus": 4, "memory_mb": 4096})
+    monkeypatch.setattr(profiles, "_worker_slots", 2)
+
+
+def test_naabu_rate_is_capped_per_host():
+    assert profiles.choose_profile("naabu", 1) == {
+        "concurrency": 100, "rate": 500, "overridden": [], "hosts": 1, "cpus": 2, "memory_mb": 2048,
+    }
+    assert profiles.choose_profile("naabu", 10)["rate"] == 2000
+
+
+def test_nuclei_spreads_parallelism_across_hosts():
+    few = profiles.choose_profile("nuclei", 1)
+    assert (few["bulk_size"], few["concurrency"], few["rate"]) == (1, 100, 25)
+    many = profiles.choose_profile("nuclei", 100)
+    assert (many["bulk_size"], many["concurrency"], many["rate"]) == (20, 5, 300)
+
+
+def test_no_hosts_counts_as_one():
+    assert profiles.choose_profile("nuclei", 0)["hosts"] == 1
+
+
+def test_memory_bounds_parallelism(monkeypatch):
+    monkeypatch.setattr(profiles, "worker_resources", lambda: {"cpus": 4, "memory_mb": 128})
+    assert profiles.choose_profile("naabu", 1)["concurrency"] == 8
+    monkeypatch.setattr(profiles, "worker_resources", lambda: {"cpus": 4, "memory_mb": 8})
+    assert profiles.choose_profile("naabu", 1)["concurrency"] == 2
+
+
+def test_overrides_replace_computed_values():
+    profile = profiles.choose_profile("naabu", 1, {"rate": 50, "concurrency": None, "bulk_size": 7})
+    assert (profile["rate"], profile["concurrency"]) == (50, 100)
+    assert "bulk_size" not in profile
+    assert profile["overridden"] == ["rate"]
+
+
+def test_tool_args():
+    profile = profiles.choose_profile("nuclei", 100)
+    assert profiles.tool_args("nuclei", profile) == ["-c", "5", "-bulk-size", "20", "-rate-limit", "300"]
+    assert profiles.tool_args("naabu", {"concurrency": 3, "rate": 10}) == ["-c", "3", "-rate", "10"]
@@ -0,0 +1,66 @@
+"""
+The hot lookups plan onto the indexes meant for them. Runs EXPLAIN against a
+migrated database; with sequential scans disabled, a query whose index is missing
+or unusable falls back to a Seq Scan and the assertion names the indexes it did use.
+"""
+import os
+from datetime import datetime
+from uuid import uuid4
+
+import pytest
+from sqlalchemy import text
+
+if not os.getenv("DATABASE_URL"):
+    pytest.skip("needs DATABASE_URL pointing at a migrated database", allow_module_level=True)
+
+import db
+import db_sync
+
+
+@pytest.fixture
+def conn():
+    with db_sync.engine.connect() as conn:
+        with conn.begin() as trans:
+            conn.execute(text("SET LOCAL enable_seqscan = off"))
+            yield conn
+            trans.rollback()
+
+
+def plan_indexes(conn, stmt) -> set:
+    """Indexes a statement's plan reads, by the name of their partitioned parent."""
+    compiled = stmt.compile(dialect=conn.dialect)
+    plan = conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params).scalar()
+    names, nodes = set(), [plan[0]["Plan"]]
+    while nodes:
+        node = nodes.pop()
+        if "Index Name" in node:
+            names.add(node["Index Name"])
+        nodes.extend(node.get("Plans", ()))
+    return {
+        conn.execute(text("SELECT pg_partition_root(CAST(:name AS regclass))::text"), {"name": name}).scalar()
+        for name in names
+    }
+
+
+@pytest.mark.parametrize("section, index", [
+    ("subdomains", "ix_subdomains_scan_id_id"),
+    ("urls", "ix_urls_scan_id_id"),
+    ("ports", "ix_ports_scan_id_id"),
+    ("vulnerabilities", "ix_vulnerabilities_scan_id_severity"),
+])
+def test_section_by_scan_id(conn, section, index):
+    scan_id = uuid4()
+    stmt = db._section_query(scan_id, section, lineage=[(scan_id, datetime.utcnow())])
+    assert index in plan_indexes(conn, stmt)
+
+
+# Running and queued scans are few, so their partial indexes may beat walking
+# started_at and filtering.
+@pytest.mark.parametrize("status, indexes", [
+    (None, {"ix_scans_started_at_scan_id"}),
+    ("completed", {"ix_scans_started_at_scan_id"}),
+    ("in_progress", {"ix_scans_started_at_scan_id", "ix_scans_owner_running"}),
+    ("queued", {"ix_scans_started_at_scan_id", "ix_scans_queued"}),
+])
+def test_scan_listing(conn, status, indexes):
+    assert plan_indexes(conn, db._scans_page_query(50, status=status)) & indexes
@@ -0,0 +1,77 @@
+"""Streaming tool output and stopping tools over budget (runner.stream_jsonl)."""
+import subprocess
+import sys
+import time
+
+import pytest
+
+import runner
+
+
+@pytest.fixture(autouse=True)
+def fast_watch(monkeypatch):
+    monkeypatch.setattr(runner, "TOOL_WATCH_INTERVAL", 0.05)
+    monkeypatch.setattr(runner, "TOOL_KILL_GRACE", 0.5)
+
+
+def tool(script):
+    return [sys.executable, "-c", script]
+
+
+def test_yields_records_and_skips_unparseable_lines():
+    cmd = tool('print(\'{"a": 1}\'); print("not json"); print(); print(\'{"a": 2}\')')
+    assert list(runner.stream_jsonl(cmd)) == [{"a": 1}, {"a": 2}]
+
+
+def test_feeds_input_lines_on_stdin():
+    cmd = tool('import sys, json\nfor line in sys.stdin: print(json.dumps({"host": line.strip()}))')
+    assert list(runner.stream_jsonl(cmd, ["a.example.com", "b.example.com"])) == [
+        {"host": "a.example.com"}, {"host": "b.example.com"},
+    ]
+
+
+def test_nonzero_exit_raises_with_stderr_tail():
+    cmd = tool('import sys; print("{}"); sys.stderr.write("boom"); sys.exit(3)')
+    with pytest.raises(subprocess.CalledProcessError) as ex:
+        list(runner.stream_jsonl(cmd))
+    assert ex.value.returncode == 3
+    assert ex.value.stderr == "boom"
+
+
+def test_timeout_stops_the_tool():
+    started = time.monotonic()
+    with pytest.raises(runner.ToolBudgetExceeded, match="0.2s"):
+        list(runner.stream_jsonl(tool("import time; time.sleep(30)"), timeout=0.2))
+    assert time.monotonic() - started < 5
+
+
+def test_timeout_kills_a_tool_ignoring_sigterm():
+    script = "import signal, time; signal.signal(signal.SIGTERM, signal.SIG_IGN); print('{}', flush=True); time.sleep(30)"
+    started = time.monotonic()
+    with pytest.raises(runner.ToolBudgetExceeded):
+        list(runner.stream_jsonl(tool(script), timeout=0.2))
+    assert time.monotonic() - started < 5
+
+
+def test_output_budget_stops_the_tool():
+    cmd = tool('import json\nwhile True: print(json.dumps({"x": "y" * 100}), flush=True)')
+    records = []
+    with pytest.raises(runner.ToolBudgetExceeded, match="1000 bytes of output"):
+        for record in runner.stream_jsonl(cmd, max_output_bytes=1000):
+            records.append(record)
+    assert 0 < len(records) < 10
+
+
+def test_cancelled_stops_the_tool():
+    started = time.monotonic()
+    with pytest.raises(runner.ToolCancelled):
+        list(runner.stream_jsonl(tool("import time; time.sleep(30)"), cancelled=lambda: time.monotonic() - started > 0.2))
+    assert time.monotonic() - started < 5
+
+
+def test_consumer_stopping_early_kills_the_tool():
+    cmd = tool('import json, time\nwhile True: print(json.dumps({}), flush=True); time.sleep(0.01)')
+    started = time.monotonic()
+    for _ in runner.stream_jsonl(cmd):
+        break
+    assert time.monotonic() - started < 5
@@ -0,0 +1,47 @@
+"""Admission under the per-owner and per-target running-scan caps (scheduler.admit)."""
+from collections import Counter
+
+import pytest
+
+import scheduler
+
+
+@pytest.fixture(autouse=True)
+def caps(monkeypatch):
+    monkeypatch.setattr(scheduler, "SCAN_MAX_RUNNING_PER_OWNER", 2)
+    monkeypatch.setattr(scheduler, "SCAN_MAX_RUNNING_PER_TARGET", 1)
+
+
+def scan(target, owner=None):
+    return {"target": target, "owner": owner}
+
+
+def test_target_cap_counts_running_and_admitted_scans():
+    scans = [scan("a"), scan("a"), scan("b")]
+    assert scheduler.admit(scans, Counter(), Counter()) == [scans[0], scans[2]]
+    assert scheduler.admit([scan("a")], Counter(), Counter({"a": 1})) == []
+
+
+def test_owner_cap_skips_but_keeps_looking():
+    by_owner, by_target = Counter({"alice": 1}), Counter()
+    scans = [scan("a", "alice"), scan("b", "alice"), scan("c", "bob"), scan("d")]
+    assert scheduler.admit(scans, by_owner, by_target) == [scans[0], scans[2], scans[3]]
+    assert by_owner == Counter({"alice": 2, "bob": 1})
+    assert by_target == Counter({"a": 1, "c": 1, "d": 1})
+
+
+def test_scans_without_owner_are_only_capped_per_target():
+    scans = [scan(target) for target in "abcde"]
+    assert scheduler.admit(scans, Counter(), Counter()) == scans
+
+
+def test_zero_disables_a_cap(monkeypatch):
+    monkeypatch.setattr(scheduler, "SCAN_MAX_RUNNING_PER_TARGET", 0)
+    monkeypatch.setattr(scheduler, "SCAN_MAX_RUNNING_PER_OWNER", 0)
+    scans = [scan("a", "alice")] * 5
+    assert scheduler.admit(scans, Counter({"alice": 100}), Counter({"a": 100})) == scans
+
+
+def test_broker_priority_orders_classes():
+    order = sorted(scheduler.SCAN_PRIORITIES, key=scheduler.broker_priority)
+    assert order == ["interactive", "normal", "batch", "demoted"]
@@ -0,0 +1,38 @@
+"""Stage cache keys (stage_cache.normalize_target and cache_key)."""
+import pytest
+
+import stage_cache
+
+
+@pytest.mark.parametrize("target, expected", [
+    ("example.com", "https://example.com"),
+    ("HTTP://Example.COM/", "http://example.com"),
+    ("https://example.com/App/", "https://example.com/App"),
+    ("https://example.com:8443/a?Q=1#frag", "https://example.com:8443/a?Q=1"),
+])
+def test_normalize_target(target, expected):
+    assert stage_cache.normalize_target(target) == expected
+
+
+def test_equivalent_targets_share_a_key():
+    cmd = ["subfinder", "-silent"]
+    assert stage_cache.cache_key("subfinder", "Example.com/", cmd) == stage_cache.cache_key("subfinder", "https://example.com", cmd)
+
+
+def test_input_order_does_not_matter():
+    cmd = ["naabu", "-json"]
+    assert stage_cache.cache_key("naabu", "example.com", cmd, ["b.example.com", "a.example.com"]) == \
+        stage_cache.cache_key("naabu", "example.com", cmd, ["a.example.com", "b.example.com"])
+
+
+def test_key_depends_on_stage_target_command_and_inputs():
+    base = stage_cache.cache_key("naabu", "example.com", ["naabu", "-top-ports", "100"], ["a.example.com"])
+    assert base.startswith("pd:stage-cache:naabu:")
+    assert len({
+        base,
+        stage_cache.cache_key("katana", "example.com", ["naabu", "-top-ports", "100"], ["a.example.com"]),
+        stage_cache.cache_key("naabu", "http://example.com", ["naabu", "-top-ports", "100"], ["a.example.com"]),
+        stage_cache.cache_key("naabu", "example.com/other", ["naabu", "-top-ports", "100"], ["a.example.com"]),
+        stage_cache.cache_key("naabu", "example.com", ["naabu", "-top-ports", "1000"], ["a.example.com"]),
+        stage_cache.cache_key("naabu", "example.com", ["naabu", "-top-ports", "100"], ["b.example.com"]),
+    }) == 6